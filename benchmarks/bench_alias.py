@@ -0,0 +1,245 @@
+""" Benchmark the alias redirect hot path and key lookup autocomplete.
+
+Builds a Substance D site in a MappingStorage (or FileStorage) database with
+a tree of folders ``depth`` levels deep and ``fanout`` children wide, adds
+``aliases`` aliases pointing at random leaves, then reports throughput,
+p50/p99 latency, database loads per request and peak memory for:
+
+  redirect : GET requests for aliases through the WSGI application
+  generate_url : ``Alias.generate_url`` called directly
+  key_lookup : the ``alias_key_lookup`` view with random prefixes
+
+The key lookup view is a management view which needs an authenticated user,
+so it is called directly with a request instead of through the WSGI stack.
+
+Usage: python benchmarks/bench_alias.py [options]
+"""
+import os
+import random
+import resource
+import sys
+import tempfile
+from optparse import OptionParser
+from timeit import default_timer as timer
+
+import transaction
+
+from pyramid.config import Configurator
+from pyramid.encode import urlencode
+from pyramid.request import Request
+from pyramid.scripting import prepare
+from pyramid_zodbconn import get_connection
+from ZODB.ActivityMonitor import ActivityMonitor
+
+from substanced.db import root_factory
+
+from substanced_alias import IAlias
+from substanced_alias.views import alias_key_lookup
+
+
+def make_app(uri, lookup_table=False):
+    settings = {
+        'zodbconn.uri': uri,
+        'substanced.secret': 'benchmark',
+        'substanced.initial_login': 'admin',
+        'substanced.initial_password': 'admin',
+        'substanced.initial_email': 'admin@example.com',
+        'substanced.autosync_catalogs': 'true',
+        'substanced_alias.lookup_table': str(lookup_table).lower(),
+        'pyramid.includes': 'pyramid_tm',
+        }
+    config = Configurator(settings=settings, root_factory=root_factory)
+    config.include('substanced')
+    config.include('substanced_alias')
+    return config.make_wsgi_app()
+
+def populate(app, options, rnd):
+    """ Creates the folder tree and the aliases, returning the alias paths
+    and the paths of all containers.
+    """
+    env = prepare(registry=app.registry)
+    root = env['root']
+    registry = env['registry']
+    content = registry.content
+
+    containers = ['']
+    level = [('', root)]
+    for depth in range(options.depth):
+        next_level = []
+        for path, folder in level:
+            for i in range(options.fanout):
+                name = 'f%s-%s' % (depth, i)
+                child = content.create('Folder')
+                folder[name] = child
+                next_level.append((path + name + '/', child))
+        containers.extend(path for path, folder in next_level)
+        level = next_level
+        transaction.commit()
+    leaves = [folder for path, folder in level]
+
+    aliases = content.create('Folder')
+    root['aliases'] = aliases
+    paths = []
+    for i in range(options.aliases):
+        name = 'alias-%06d' % i
+        target = rnd.choice(leaves)
+        aliases[name] = content.create(IAlias, name, target,
+                                       query=['page=%s' % i], anchor=None)
+        paths.append('/aliases/' + name)
+        if i % 1000 == 999:
+            transaction.commit()
+    transaction.commit()
+    containers.append('aliases/')
+    db = get_connection(env['request']).db()
+    env['closer']()
+    return db, paths, containers
+
+class ClosedConnectionLoads(object):
+    """ Counts the objects loaded by connections closed while it is active,
+    i.e. by requests handled through the WSGI application.
+    """
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.monitor = ActivityMonitor()
+        self.db.setActivityMonitor(self.monitor)
+        return self
+
+    def __exit__(self, *exc):
+        self.db.setActivityMonitor(None)
+
+    def __call__(self):
+        analysis = self.monitor.getActivityAnalysis(divisions=1)
+        return sum(d['loads'] for d in analysis)
+
+class OpenConnectionLoads(object):
+    """ Counts the objects loaded by one open connection."""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.getTransferCounts(True)
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def __call__(self):
+        return self.conn.getTransferCounts()[0]
+
+def measure(name, func, count, loads):
+    """ Calls ``func(i)`` ``count`` times and returns a dict of results.
+    ``loads`` is one of the load counters above.
+    """
+    timings = []
+    with loads:
+        start = timer()
+        for i in range(count):
+            begin = timer()
+            func(i)
+            timings.append(timer() - begin)
+        total = timer() - start
+        loads = loads()
+    timings.sort()
+    return {
+        'name': name,
+        'count': count,
+        'throughput': count / total,
+        'p50': timings[int(count * 0.5)] * 1000,
+        'p99': timings[min(int(count * 0.99), count - 1)] * 1000,
+        'loads': float(loads) / count,
+        'maxrss': peak_memory(),
+        }
+
+def peak_memory():
+    """ Peak resident set size of this process in megabytes."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss = maxrss / 1024
+    return maxrss / 1024.0
+
+def bench_redirect(app, db, paths, options, rnd):
+    def run(i):
+        request = Request.blank(rnd.choice(paths))
+        response = request.get_response(app)
+        assert response.status_int == 302, response.status
+    return measure('redirect', run, options.requests,
+                   ClosedConnectionLoads(db))
+
+def bench_generate_url(app, db, paths, options, rnd):
+    env = prepare(registry=app.registry)
+    root = env['root']
+    request = env['request']
+    aliases = root['aliases']
+    names = [path.rsplit('/', 1)[1] for path in paths]
+    def run(i):
+        aliases[rnd.choice(names)].generate_url(request)
+    try:
+        return measure('generate_url', run, options.requests,
+                       OpenConnectionLoads(get_connection(request)))
+    finally:
+        env['closer']()
+
+def bench_key_lookup(app, db, containers, options, rnd):
+    env = prepare(registry=app.registry)
+    root = env['root']
+    conn = get_connection(env['request'])
+    def run(i):
+        term = rnd.choice(containers) + rnd.choice('afx')
+        request = Request.blank('/?' + urlencode({'term': term}))
+        request.registry = app.registry
+        request.context = root
+        alias_key_lookup(request)
+    try:
+        return measure('key_lookup', run, options.requests,
+                       OpenConnectionLoads(conn))
+    finally:
+        env['closer']()
+
+def report(results, out=sys.stdout):
+    header = '%-14s %8s %12s %9s %9s %11s %10s' % (
+        'benchmark', 'count', 'req/s', 'p50 ms', 'p99 ms', 'loads/req',
+        'maxrss MB')
+    out.write(header + '\n' + '-' * len(header) + '\n')
+    for r in results:
+        out.write('%(name)-14s %(count)8d %(throughput)12.1f %(p50)9.3f '
+                  '%(p99)9.3f %(loads)11.2f %(maxrss)10.1f\n' % r)
+
+def main(argv=sys.argv):
+    parser = OptionParser(description=__doc__.split('\n')[0])
+    parser.add_option('-a', '--aliases', type='int', default=1000,
+        help='Number of aliases to create (default: %default)')
+    parser.add_option('-f', '--fanout', type='int', default=10,
+        help='Children per folder (default: %default)')
+    parser.add_option('-d', '--depth', type='int', default=3,
+        help='Depth of the folder tree (default: %default)')
+    parser.add_option('-n', '--requests', type='int', default=5000,
+        help='Requests per benchmark (default: %default)')
+    parser.add_option('-s', '--storage', default='memory',
+        help="'memory' or 'file' (default: %default)")
+    parser.add_option('-l', '--lookup-table', action='store_true',
+        default=False, help='Enable the in-memory lookup tween')
+    parser.add_option('-r', '--seed', type='int', default=42,
+        help='Random seed (default: %default)')
+    options, args = parser.parse_args(argv[1:])
+
+    if options.storage == 'file':
+        tmpdir = tempfile.mkdtemp()
+        uri = 'file://%s' % os.path.join(tmpdir, 'Data.fs')
+    else:
+        uri = 'memory://'
+
+    rnd = random.Random(options.seed)
+    app = make_app(uri, options.lookup_table)
+    db, paths, containers = populate(app, options, rnd)
+
+    results = [
+        bench_redirect(app, db, paths, options, rnd),
+        bench_generate_url(app, db, paths, options, rnd),
+        bench_key_lookup(app, db, containers, options, rnd),
+        ]
+    report(results)
+
+if __name__ == '__main__':
+    main()
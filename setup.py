@@ -23,10 +23,24 @@ setup(name='substanced_alias',
       author_email='eric@chromaticleaves.com',
       url='http://python.chromaticleaves.com/docs/substanced_alias/',
       license='FreeBSD',
-      packages=['substanced_alias'],
+      packages=['substanced_alias', 'substanced_alias.scripts'],
       test_suite='substanced_alias.tests',
       include_package_data=True,
       zip_safe=False,
       tests_require=['pkginfo', 'nose'],
       install_requires=['substanced'],
+      entry_points={
+          'console_scripts': [
+              'sd_alias_import = substanced_alias.scripts.bulk:import_main',
+              'sd_alias_export = substanced_alias.scripts.bulk:export_main',
+              'sd_alias_flatten = '
+              'substanced_alias.scripts.maintenance:flatten_main',
+              'sd_alias_dangling = '
+              'substanced_alias.scripts.maintenance:dangling_main',
+              'sd_alias_retarget = '
+              'substanced_alias.scripts.maintenance:retarget_main',
+              'sd_alias_redirect_map = '
+              'substanced_alias.scripts.maintenance:redirect_map_main',
+              ],
+          },
 )
@@ -1,44 +1,660 @@
+import binascii
+import time
+try:
+    from urllib.parse import unquote_plus
+except ImportError: # pragma: no cover
+    from urllib import unquote_plus
+from bisect import bisect_left
+from itertools import islice
+
 from persistent import Persistent
+from BTrees.Length import Length
+from BTrees.OOBTree import (
+    OOTreeSet,
+    intersection,
+    )
 from substanced.content import content
-from pyramid.httpexceptions import HTTPFound
+from pyramid.httpexceptions import (
+    HTTPFound,
+    HTTPMovedPermanently,
+    HTTPNotFound,
+    HTTPPermanentRedirect,
+    HTTPTemporaryRedirect,
+    )
+from pyramid.settings import asbool
+from pyramid.tweens import MAIN
+from pyramid.encode import (
+    url_quote,
+    urlencode,
+    )
 from substanced.property import PropertySheet
 from deform import widget
 import colander
 from substanced.schema import Schema
-from zope.interface import Interface
-from pyramid.traversal import find_resource
+from substanced.interfaces import ReferenceType
+from substanced.util import (
+    find_index,
+    find_objectmap,
+    get_oid,
+    is_folder,
+    )
+from zope.interface import (
+    Interface,
+    implementer,
+    )
+from pyramid.traversal import (
+    find_resource,
+    find_root,
+    quote_path_segment,
+    resource_path,
+    resource_path_tuple,
+    traversal_path,
+    )
+
+from .timing import timed
+
+# names of the root attributes holding the alias generation counters: the
+# lookup table changes when resources move and when aliases themselves are
+# added, modified or removed, and the pattern generation when pattern aliases
+# are
+TABLE_GENERATION_ATTR = '__alias_table_generation__'
+PATTERN_GENERATION_ATTR = '__alias_pattern_generation__'
+
+# number of containers, and for how many seconds, ``find_container`` caches
+CONTAINER_CACHE_SIZE = 10
+CONTAINER_CACHE_TIMEOUT = 300
+
+# characters left unquoted in a URL fragment (RFC 3986)
+ANCHOR_SAFE = "/?:@!$&'()*+,;="
+
+# default maximum number of aliases followed from an alias to its target
+MAX_CHAIN_DEPTH = 10
+
+# the shortest and longest names an alias may have
+MIN_NAME_LENGTH = 1
+MAX_NAME_LENGTH = 255
+
+# the redirect statuses an alias may answer with
+REDIRECT_CLASSES = {
+    301: HTTPMovedPermanently,
+    302: HTTPFound,
+    307: HTTPTemporaryRedirect,
+    308: HTTPPermanentRedirect,
+    }
+
+# choices offered for ``Alias.status`` in the SDI
+REDIRECT_STATUS_CHOICES = (
+    ('', 'Site default'),
+    ('301', '301 Moved Permanently'),
+    ('302', '302 Found'),
+    ('307', '307 Temporary Redirect'),
+    ('308', '308 Permanent Redirect'),
+    )
+
+# how an alias treats the query string of the requests it redirects, see
+# ``merge_query``
+QUERY_MODE_CHOICES = (
+    ('', 'Ignore the incoming query'),
+    ('passthrough', 'Append the incoming query'),
+    ('merge', 'Add incoming parameters the alias does not set'),
+    ('override', 'Incoming parameters replace those of the alias'),
+    )
+QUERY_MODES = ('passthrough', 'merge', 'override')
 
 def includeme(config): # pragma no cover
-    """ Register @content, @view_config, and @mgmt_view. """
-    config.scan('.')
+    """ Register @content, @view_config, and @mgmt_view, and the evolution
+    steps in ``substanced_alias.evolve``.
+    Also registers the in-memory redirect tween when the
+    ``substanced_alias.lookup_table`` setting is true, the hit counter
+    when ``substanced_alias.hit_counters`` is true and the timing sink and
+    tween named by ``substanced_alias.timing``, the lookup file tween
+    when ``substanced_alias.lookup_file`` names a file and the pattern alias
+    tween when ``substanced_alias.patterns`` is true. The map writer is
+    registered when a redirect map or lookup file is configured. An unknown
+    ``substanced_alias.redirect_status`` raises ``ValueError``.
+    """
+    from .catalog import add_alias_catalog
+    from .evolve import compact_alias_storage
+    from .counters import (
+        HitCounter,
+        IAliasHitCounter,
+        )
+    from .redirectmap import (
+        DEFAULT_WRITE_DELAY,
+        IAliasMapWriter,
+        MapWriter,
+        )
+    from .timing import (
+        IAliasTimingSink,
+        make_sink,
+        )
+    # the ASGI module needs Python 3 and registers nothing
+    config.scan('.', ignore='.asgi')
+    config.add_evolution_step(compact_alias_storage)
+    config.add_evolution_step(add_alias_catalog)
+    settings = config.registry.settings or {}
+    get_redirect_status(config.registry)
+    sink = make_sink(settings)
+    if sink is not None:
+        config.registry.registerUtility(sink, IAliasTimingSink)
+        config.add_tween('substanced_alias.timing.timing_tween_factory',
+                         over=('substanced_alias.lookupfile.'
+                               'lookup_file_tween_factory',
+                               'substanced_alias.lookup.alias_tween_factory',
+                               MAIN))
+    if asbool(settings.get('substanced_alias.hit_counters', False)):
+        interval = int(settings.get('substanced_alias.hit_flush_interval', 30))
+        config.registry.registerUtility(HitCounter(interval=interval),
+                                        IAliasHitCounter)
+    if (settings.get('substanced_alias.redirect_map') or
+        settings.get('substanced_alias.lookup_file')):
+        delay = float(settings.get('substanced_alias.redirect_map_delay',
+                                   DEFAULT_WRITE_DELAY))
+        config.registry.registerUtility(MapWriter(delay), IAliasMapWriter)
+    if asbool(settings.get('substanced_alias.lookup_table', False)):
+        config.add_tween('substanced_alias.lookup.alias_tween_factory',
+                         over=MAIN)
+    if settings.get('substanced_alias.lookup_file'):
+        config.add_tween('substanced_alias.lookupfile.'
+                         'lookup_file_tween_factory',
+                         over=('substanced_alias.lookup.alias_tween_factory',
+                               MAIN))
+    if asbool(settings.get('substanced_alias.patterns', False)):
+        config.add_tween('substanced_alias.patterns.pattern_tween_factory',
+                         over=MAIN)
 
 class IAlias(Interface):
     """ Interface representing an alias that can redirect to another resource.
     """
 
-def get_matching_keys(root, path):
+class AliasToTarget(ReferenceType):
+    """ Reference type from an ``Alias`` to the resource it redirects to.
+    The objectmap keeps both directions of the reference in BTrees, which
+    makes it a reverse index of target oid -> alias oids.
+    """
+
+def connect_alias(alias, resource=None):
+    """ Records in the objectmap that ``alias`` points at ``resource``
+    (defaults to ``alias.resource``). Does nothing if no objectmap is found,
+    e.g. while the alias has not been added to a folder yet.
+    """
+    objectmap = find_objectmap(alias)
+    if objectmap is not None:
+        if resource is None:
+            resource = alias.resource
+        objectmap.connect(alias, resource, AliasToTarget)
+
+def disconnect_alias(alias, resource):
+    """ Removes the objectmap reference from ``alias`` to ``resource``."""
+    objectmap = find_objectmap(alias)
+    if objectmap is not None:
+        objectmap.disconnect(alias, resource, AliasToTarget)
+
+def find_alias_oids(resource):
+    """ Returns the set of oids of the aliases pointing at ``resource`` or an
+    empty tuple if no objectmap is found.
+    """
+    objectmap = find_objectmap(resource)
+    if objectmap is None:
+        return ()
+    return objectmap.sourceids(resource, AliasToTarget)
+
+def find_aliases(resource):
+    """ Returns a generator of the aliases pointing at ``resource``."""
+    objectmap = find_objectmap(resource)
+    if objectmap is None:
+        return iter(())
+    return objectmap.sources(resource, AliasToTarget)
+
+def has_target(alias):
+    """ Returns True if the target of ``alias`` still exists in the tree.
+    The target's oid comes from the ``AliasToTarget`` reference, or from the
+    target itself for aliases which were never connected, and its path from
+    the objectmap, so a removed target is not loaded. Without an objectmap,
+    the target must share the root of ``alias``.
+    """
+    objectmap = find_objectmap(alias)
+    if objectmap is None:
+        return find_root(alias.resource) is find_root(alias)
+    oids = objectmap.targetids(alias, AliasToTarget)
+    if not oids:
+        oid = get_oid(alias.resource, None)
+        oids = () if oid is None else (oid,)
+    for oid in oids:
+        if objectmap.path_for(oid) is not None:
+            return True
+    return False
+
+def iter_aliases(root, batch_size=1000):
+    """ Yields every ``Alias`` below ``root``.
+
+    Aliases are found through the system catalog's ``content_type`` index
+    when there is one, otherwise by walking the folders below ``root``. The
+    database connection's object cache is minimized after each
+    ``batch_size`` aliases, so memory use stays bounded however many aliases
+    there are. Callers must not hold on to, or modify, the yielded aliases.
+    """
+    return iter_content(root, IAlias, batch_size)
+
+def iter_content(root, content_type, batch_size=1000):
+    """ Yields every object of ``content_type`` (an interface used as a
+    Substance D content type) below ``root``, as described for
+    ``iter_aliases``.
+    """
+    jar = getattr(root, '_p_jar', None)
+    index = find_index(root, 'system', 'content_type')
+    objectmap = find_objectmap(root)
+    if index is not None and objectmap is not None:
+        objects = (objectmap.object_for(oid)
+                   for oid in index.eq(content_type).execute().ids)
+        objects = (obj for obj in objects if obj is not None)
+    else:
+        objects = _walk_content(root, content_type)
+    for count, obj in enumerate(objects, 1):
+        yield obj
+        if jar is not None and count % batch_size == 0:
+            jar.cacheMinimize()
+
+def _walk_content(folder, content_type):
+    for child in folder.values():
+        if content_type.providedBy(child):
+            yield child
+        if is_folder(child):
+            for obj in _walk_content(child, content_type):
+                yield obj
+
+class AliasCycleError(Exception):
+    """ Raised when following aliases to their targets leads back to an
+    alias already seen.
+    """
+
+def iter_chain(alias, max_depth=MAX_CHAIN_DEPTH):
+    """ Yields the aliases reached by following ``alias`` to its target as
+    long as the target is itself an alias, stopping after ``max_depth``
+    aliases. Raises ``AliasCycleError`` if an alias is reached twice.
+    """
+    seen = set([id(alias)])
+    for depth in range(max_depth):
+        target = alias.resource
+        if not IAlias.providedBy(target):
+            return
+        if id(target) in seen:
+            raise AliasCycleError(target)
+        seen.add(id(target))
+        alias = target
+        yield alias
+
+def resolve_chain(alias, max_depth=MAX_CHAIN_DEPTH):
+    """ Returns the last alias of the chain starting at ``alias`` (``alias``
+    itself unless it targets another alias): the alias whose target, query
+    and anchor make up the final destination. See ``iter_chain``.
+    """
+    for alias in iter_chain(alias, max_depth):
+        pass
+    return alias
+
+def chain_mtime(alias, max_depth=MAX_CHAIN_DEPTH):
+    """ Returns the newest modification time of ``alias`` and the aliases
+    of its chain (see ``iter_chain``), which all contribute to the final
+    destination, or None if any of them has never been saved.
+    """
+    mtimes = [getattr(alias, '_p_mtime', None)]
+    mtimes.extend(getattr(alias, '_p_mtime', None)
+                  for alias in iter_chain(alias, max_depth))
+    if None in mtimes:
+        return None
+    return max(mtimes)
+
+def get_chain_depth(registry):
+    """ Returns the ``substanced_alias.max_chain_depth`` setting."""
+    settings = registry.settings or {}
+    return int(settings.get('substanced_alias.max_chain_depth',
+                            MAX_CHAIN_DEPTH))
+
+def get_redirect_status(registry):
+    """ Returns the ``substanced_alias.redirect_status`` setting (302 by
+    default), raising ``ValueError`` if it is not one of the keys of
+    ``REDIRECT_CLASSES``.
+    """
+    settings = registry.settings or {}
+    value = settings.get('substanced_alias.redirect_status', 302)
+    try:
+        status = int(value)
+    except (TypeError, ValueError):
+        status = None
+    if status not in REDIRECT_CLASSES:
+        raise ValueError('Unknown substanced_alias.redirect_status: %s'
+                         % value)
+    return status
+
+def make_redirect(request, location, status=None, max_age=None, mtime=None):
+    """ Returns a redirect response to ``location``.
+
+    ``status`` (one of the keys of ``REDIRECT_CLASSES``) and ``max_age`` (the
+    seconds a cache may keep the redirect) default to the
+    ``substanced_alias.redirect_status`` (see ``get_redirect_status``) and
+    ``substanced_alias.max_age`` (none, no ``Cache-Control`` header) settings.
+    ``mtime`` is the modification time of the alias and its chain (see
+    ``chain_mtime``): if given, it is sent as ``Last-Modified`` and makes up
+    the ``ETag`` along with the status and location, and conditional
+    requests are answered with 304 Not Modified.
+    """
+    settings = request.registry.settings or {}
+    if status is None:
+        status = get_redirect_status(request.registry)
+    if max_age is None:
+        max_age = settings.get('substanced_alias.max_age')
+    response = REDIRECT_CLASSES[status](location=location)
+    if max_age not in (None, ''):
+        response.cache_control.public = True
+        response.cache_control.max_age = int(max_age)
+    if mtime is not None:
+        response.last_modified = mtime
+        data = '%s %s %r' % (status, location, mtime)
+        response.etag = '%08x' % (binascii.crc32(data.encode('utf-8'))
+                                  & 0xffffffff)
+        response.conditional_response = True
+    return response
+
+def follow_chain(alias, request):
+    """ Returns ``resolve_chain`` of ``alias`` up to the depth configured for
+    ``request``, raising ``HTTPNotFound`` for a cycle or when the last alias
+    of the chain is dangling.
+    """
+    try:
+        alias = resolve_chain(alias, get_chain_depth(request.registry))
+    except AliasCycleError:
+        raise HTTPNotFound('Alias cycle')
+    if getattr(alias, 'dangling', False):
+        raise HTTPNotFound('Alias target removed')
+    return alias
+
+def make_location(path, query=None, anchor=None):
+    """ Returns a host-relative location from an already quoted resource
+    ``path``, a ``query`` (a dict or a sequence of (key, value) pairs) and an
+    ``anchor``. Like ``request.resource_url``, the path always ends with a
+    '/' and the query and anchor are left out when they are None or empty.
+    """
+    if not path.endswith('/'):
+        path += '/'
+    if query:
+        path += '?' + urlencode(query)
+    if anchor is not None:
+        path += '#' + url_quote(anchor, ANCHOR_SAFE)
+    return path
+
+def merge_query(url, query_string, mode=None):
+    """ Returns ``url``, whose query was encoded when the alias was saved,
+    combined with the still encoded ``query_string`` of the incoming request
+    according to ``mode``:
+
+      None : the incoming query is ignored
+      'passthrough' : incoming parameters are appended
+      'merge' : incoming parameters whose name the alias does not use are
+        appended
+      'override' : incoming parameters are appended and replace the
+        parameters of the alias with the same name
+
+    Parameters are only split and joined, never re-encoded; only their names
+    are decoded to compare them. The anchor of ``url`` stays last.
+    """
+    if not mode or not query_string:
+        return url
+    url, hash, anchor = url.partition('#')
+    path, question, static = url.partition('?')
+    static = [part for part in static.split('&') if part]
+    incoming = [part for part in query_string.split('&') if part]
+    if mode == 'merge':
+        names = set(_param_name(part) for part in static)
+        incoming = [part for part in incoming
+                    if _param_name(part) not in names]
+    elif mode == 'override':
+        names = set(_param_name(part) for part in incoming)
+        static = [part for part in static if _param_name(part) not in names]
+    query = '&'.join(static + incoming)
+    if query:
+        path += '?' + query
+    return path + hash + anchor
+
+def _param_name(part):
+    return unquote_plus(part.partition('=')[0])
+
+def location_for_oid(objectmap, oid, query=(), anchor=None):
+    """ Returns the host-relative location of the object with oid ``oid``,
+    built from its path in ``objectmap`` without loading it or its
+    ancestors, or None if the object no longer exists.
+    """
+    path = objectmap.path_for(oid)
+    if path is None:
+        return None
+    path = '/'.join(quote_path_segment(segment) for segment in path)
+    return make_location(path, query, anchor)
+
+def query_pairs(query):
+    """ Turns a sequence of "key=value" or "key" strings into a tuple of
+    (key, value) pairs, keeping their order and repeated keys.
+    """
+    if not query:
+        return ()
+    return tuple(tuple(item.partition('=')[::2]) for item in query)
+
+def query_strings(pairs):
+    """ Turns (key, value) ``pairs`` back into a list of "key=value"
+    strings. A bare "key" comes back as "key=", as it is encoded in the
+    location, so the strings always give the same pairs and location.
+    """
+    return ['%s=%s' % (key, value) for key, value in pairs]
+
+def get_generation(context, name):
+    """ Returns the alias generation number ``name`` (e.g.
+    ``TABLE_GENERATION_ATTR``) stored on the root in the lineage of
+    ``context``, or 0 if the root has never been given one.
+    """
+    counter = getattr(find_root(context), name, None)
+    if counter is None:
+        return 0
+    return counter()
+
+def bump_generation(context, name):
+    """ Increments the alias generation number ``name`` stored on the root
+    in the lineage of ``context``, creating the counter if necessary.
+
+    The counter is a ``BTrees.Length.Length`` so concurrent bumps resolve
+    instead of raising ``ConflictError``.
+    """
+    root = find_root(context)
+    counter = getattr(root, name, None)
+    if counter is None:
+        counter = Length()
+        setattr(root, name, counter)
+    counter.change(1)
+
+def iter_keys_with_prefix(container, prefix):
+    """ Yields the keys of ``container`` that start with ``prefix``, in
+    sorted order.
+
+    Substance D folders keep their children in a BTree (``container.data``),
+    so this is a range scan starting at ``prefix`` that stops at the first key
+    without it, only loading the BTree buckets it needs. Other containers fall
+    back to a sorted copy of their keys and a binary search.
+    """
+    try:
+        keys = container.data.keys(min=prefix)
+    except (AttributeError, TypeError):
+        keys = sorted(container.keys())
+        keys = keys[bisect_left(keys, prefix):]
+    for key in keys:
+        if not key.startswith(prefix):
+            break
+        yield key
+
+def find_container(root, path, cache=None):
+    """ Returns the resource at ``path`` relative to ``root`` like
+    ``find_resource``.
+
+    If ``cache`` (a dict, usually kept in the session) is passed, containers
+    found by traversal are remembered by their database oid, so the next
+    lookup of the same ``path`` loads the container directly without
+    traversing from ``root``. A cached container is only used while the
+    objectmap still has it at the path it was found at, so removed and moved
+    containers are traversed for again. Entries are dropped after
+    ``CONTAINER_CACHE_TIMEOUT`` seconds and at most ``CONTAINER_CACHE_SIZE``
+    are kept.
+    """
+    if cache is None:
+        return find_resource(root, path)
+
+    now = time.time()
+    jar = getattr(root, '_p_jar', None)
+    objectmap = find_objectmap(root)
+    entry = cache.get(path)
+    if (entry is not None and jar is not None and objectmap is not None and
+        now - entry[0] < CONTAINER_CACHE_TIMEOUT):
+        try:
+            resource = jar.get(binascii.unhexlify(entry[1]))
+        except KeyError:
+            pass
+        else:
+            if objectmap.path_for(get_oid(resource, None)) == tuple(entry[2]):
+                return resource
+
+    resource = find_resource(root, path)
+    oid = getattr(resource, '_p_oid', None)
+    if oid is not None:
+        if path not in cache and len(cache) >= CONTAINER_CACHE_SIZE:
+            del cache[min(cache, key=lambda k: cache[k][0])]
+        cache[path] = (now, binascii.hexlify(oid),
+                       resource_path_tuple(resource))
+    return resource
+
+def get_matching_keys(root, path, limit=None, offset=0, mark_containers=False,
+                      cache=None):
     """
     Parameters:
       ``root`` : a resource to be used as the starting point for traversal
       ``path`` : a unicode or string object
+      ``limit`` : the maximum number of keys to return, or None for all
+      ``offset`` : the number of matching keys to skip
+      ``mark_containers`` : if True, keys of folders end with a '/'
+      ``cache`` : a container cache passed on to ``find_container``
 
     Returns:
       Splits the ``path`` into a search term (after the last '/') and a
       container object (up to the last '/'), relative to ``root``.
-      Returns a list of matching keys in the container prefixed by the search
-      term, or [].
+      Returns a sorted list of matching keys in the container prefixed by the
+      search term, or []. An exact match always sorts first.
+      Iteration stops as soon as ``offset + limit`` keys have been seen.
    """
     prefix, sep, term = path.rpartition('/')
 
     # return empty list if resource does not exist
     try:
-        resource = find_resource(root, prefix)
+        with timed('find_container'):
+            resource = find_container(root, prefix, cache)
     except KeyError:
         return []
 
     prefix += sep # ensure the prefix ends with a trailing slash
 
-    return [prefix + key for key in resource.keys() if key.startswith(term)]
+    stop = None if limit is None else offset + limit
+    with timed('filter_keys'):
+        keys = islice(iter_keys_with_prefix(resource, term), offset, stop)
+        if not mark_containers:
+            return [prefix + key for key in keys]
+        return [prefix + key + ('/' if is_folder(resource[key]) else '')
+                for key in keys]
+
+
+def find_target(request, path, root=None):
+    """ Returns the resource at ``path`` relative to ``root`` (defaults to
+    ``request.root``) or raises ``KeyError``, like ``find_resource``.
+
+    Entries of an ``AliasFolder`` are transient aliases without an oid which
+    cannot be referenced, so they count as missing (see ``is_target``).
+    Results, including misses, are memoized on the request, so validating
+    and then creating an alias traverses to its target only once. The memo
+    can be filled for many paths at once with ``resolve_paths``.
+    """
+    cache = get_target_cache(request)
+    try:
+        resource = cache[path]
+    except KeyError:
+        if root is None:
+            root = request.root
+        try:
+            resource = find_resource(root, path)
+        except KeyError:
+            resource = None
+        if not is_target(resource):
+            resource = None
+        cache[path] = resource
+    if resource is None:
+        raise KeyError(path)
+    return resource
+
+def get_target_cache(request):
+    """ Returns the dict of path -> resource (or None for a missing
+    resource) used by ``find_target`` for ``request``.
+    """
+    cache = getattr(request, '_alias_targets', None)
+    if cache is None:
+        cache = request._alias_targets = {}
+    return cache
+
+def is_target(resource):
+    """ Returns True if an alias may point at ``resource``: it exists and is
+    not a transient alias without an oid, i.e. an ``AliasFolder`` entry.
+    """
+    if resource is None:
+        return False
+    return (not IAlias.providedBy(resource) or
+            get_oid(resource, None) is not None)
+
+def resolve_paths(root, paths, cache=None):
+    """ Resolves every path in ``paths`` relative to ``root`` in a single
+    walk, and returns a dict of path -> resource, or None for each path that
+    does not exist or cannot be a target (see ``is_target``). Pass ``cache``
+    to update an existing dict, e.g. the one returned by
+    ``get_target_cache``.
+
+    The paths are arranged into a trie of path segments, so each container
+    along the way is only visited once no matter how many paths share it.
+    """
+    if cache is None:
+        cache = {}
+    trie = {}
+    for path in paths:
+        if path in cache:
+            continue
+        node = trie
+        for segment in traversal_path(path):
+            node = node.setdefault(segment, {})
+        node.setdefault(None, []).append(path)
+
+    stack = [(root, trie)]
+    while stack:
+        context, node = stack.pop()
+        for segment, child in node.items():
+            if segment is None:
+                target = context if is_target(context) else None
+                for path in child:
+                    cache[path] = target
+                continue
+            try:
+                resource = context[segment]
+            except (KeyError, TypeError, AttributeError):
+                _mark_missing(child, cache)
+            else:
+                stack.append((resource, child))
+    return cache
+
+def _mark_missing(node, cache):
+    for segment, child in node.items():
+        if segment is None:
+            for path in child:
+                cache[path] = None
+        else:
+            _mark_missing(child, cache)
 
 
 @colander.deferred
@@ -50,58 +666,108 @@ def keys_autocomplete_widget(node, kw):
     url = request.mgmt_path(request.root, '@@alias_key_lookup')
     return widget.AutocompleteInputWidget(values=url)
 
-@colander.deferred
-def alias_name_validator(node, kw):
-    """ When adding or renaming an ``Alias``, ensures that the name is not
-    already a key in the current container (context).
-    Also ensures names meet length requirements and do not contain a '/'.
+def check_alias_names(container, names):
+    """ Checks many candidate alias names for ``container`` at once and
+    returns a dict of name -> error message for the names which cannot be
+    used; the other names are free. Names must be between
+    ``MIN_NAME_LENGTH`` and ``MAX_NAME_LENGTH`` characters long and pass
+    the container's name checks.
+
+    For Substance D folders, each name goes through ``validate_name`` and
+    the sorted names are intersected once with the folder's BTree of
+    children and, for an ``AliasFolder``, with its BTree of aliases, instead
+    of looking each name up in turn. Other containers fall back to calling
+    ``check_name`` for each name.
     """
-    request = kw['request']
-    context = request.context
-
-    def exists(node, value):
-        """ Finds an appropriate name checking function (name_checker) when
-        an Alias is being newly added to a Folder and when an existing Alias
-        is renamed.
-        Otherwise we're not adding or changing a key, so it uses a default
-        name_checker that always passes.
-        """
-
-        # case: context is a Folder
-        if not IAlias.providedBy(context):
-            name_checker = context.check_name
-
-        # case: context is an Alias that is being renamed
-        elif value != context.__name__:
-            name_checker = context.__parent__.check_name
-
-        # case: context is an Alias and the key isn't changing
+    errors = {}
+    candidates = []
+    for name in names:
+        if not MIN_NAME_LENGTH <= len(name) <= MAX_NAME_LENGTH:
+            errors[name] = ('Names must be between %s and %s characters long'
+                            % (MIN_NAME_LENGTH, MAX_NAME_LENGTH))
         else:
-            name_checker = lambda v: None
-
-        # raise colander.Invalid if the chosen name_checker fails
+            candidates.append(name)
+    data = getattr(container, 'data', None)
+    validate_name = getattr(container, 'validate_name', None)
+    if data is None or validate_name is None:
+        for name in candidates:
+            try:
+                container.check_name(name)
+            except Exception as e:
+                errors[name] = e.args[0]
+        return errors
+    valid = []
+    for name in candidates:
         try:
-            name_checker(value)
-        except Exception as e:
-            raise colander.Invalid(node, e.args[0], value)
+            valid.append(validate_name(name))
+        except ValueError as e:
+            errors[name] = e.args[0]
+    valid = OOTreeSet(valid)
+    for name in intersection(valid, data):
+        errors[name] = 'An object named %s already exists' % name
+    aliases = getattr(container, 'aliases', None)
+    if aliases is not None:
+        for name in intersection(valid, aliases):
+            errors[name] = 'An alias named %s already exists' % name
+    return errors
+
+class AliasNameValidator(object):
+    """ A colander validator checking a name for ``container`` with
+    ``check_alias_names``. ``current_name``, the name of the alias being
+    edited, is accepted as is.
+    """
 
-    return colander.All(
-        colander.Length(min=1, max=255),
-        exists,
-        )
+    def __init__(self, container, current_name=None):
+        self.container = container
+        self.current_name = current_name
+
+    def __call__(self, node, value):
+        if self.current_name is not None and value == self.current_name:
+            return
+        error = check_alias_names(self.container, (value,)).get(value)
+        if error is not None:
+            raise colander.Invalid(node, error, value)
+
+@colander.deferred
+def alias_name_validator(node, kw):
+    """ When adding or renaming an ``Alias``, ensures that the name is not
+    already a key (or, in an ``AliasFolder``, an alias) in the container,
+    meets length requirements and does not contain a '/'. The name of an
+    alias being edited may stay as it is.
+    """
+    context = kw['request'].context
+    if IAlias.providedBy(context):
+        return AliasNameValidator(context.__parent__, context.__name__)
+    return AliasNameValidator(context)
 
 @colander.deferred
 def alias_resource_validator(node, kw):
     """ When adding or modifying an ``Alias``, ensures the resource is valid.
+    When modifying, the context is the alias itself, which may not be its
+    own target or be reached again by following the target; when adding,
+    the context is the container, which may be the target.
     """
     request = kw['request']
     context = request.context
 
     def exists(node, value):
         try:
-            find_resource(request.root, value)
+            resource = find_target(request, value)
         except KeyError:
             raise colander.Invalid(node, 'Resource not found', value)
+        if not IAlias.providedBy(context):
+            return
+        if resource is context:
+            raise colander.Invalid(node, 'An alias cannot point at itself',
+                                   value)
+        if IAlias.providedBy(resource):
+            try:
+                for alias in iter_chain(resource):
+                    if alias is context:
+                        raise AliasCycleError(alias)
+            except AliasCycleError:
+                raise colander.Invalid(
+                    node, 'Resource leads back to this alias', value)
 
     return exists
 
@@ -129,6 +795,29 @@ class AliasSchema(Schema):
         missing=None,
         )
     query = QueryParams()
+    status = colander.SchemaNode(
+        colander.String(),
+        title='Redirect status',
+        widget=widget.SelectWidget(values=REDIRECT_STATUS_CHOICES),
+        validator=colander.OneOf([value for value, title
+                                  in REDIRECT_STATUS_CHOICES]),
+        missing='',
+        )
+    max_age = colander.SchemaNode(
+        colander.Int(),
+        title='Cache max-age (seconds)',
+        description='Leave empty for the site default',
+        validator=colander.Range(min=0),
+        missing=None,
+        )
+    query_mode = colander.SchemaNode(
+        colander.String(),
+        title='Incoming query string',
+        widget=widget.SelectWidget(values=QUERY_MODE_CHOICES),
+        validator=colander.OneOf([value for value, title
+                                  in QUERY_MODE_CHOICES]),
+        missing='',
+        )
 
 
 class AliasPropertySheet(PropertySheet):
@@ -138,10 +827,16 @@ class AliasPropertySheet(PropertySheet):
         context = self.context
         props = {}
         props['name'] = context.name
-        resource_path = self.request.resource_path(context.resource)
-        props['resource'] = resource_path
+        if getattr(context, 'dangling', False):
+            # the target is no longer in the tree and has no path
+            props['resource'] = ''
+        else:
+            props['resource'] = self.request.resource_path(context.resource)
         props['query'] = context.query
         props['anchor'] = context.anchor
+        props['status'] = str(context.status or '')
+        props['max_age'] = context.max_age
+        props['query_mode'] = getattr(context, 'query_mode', None) or ''
         return props
 
     def set(self, struct):
@@ -153,10 +848,19 @@ class AliasPropertySheet(PropertySheet):
             parent.rename(oldname, newname)
             context.name = newname
         resourcename = struct['resource']
-        context.resource = find_resource(parent, resourcename)
+        resource = find_target(self.request, resourcename, find_root(parent))
+        if resource is not context.resource:
+            disconnect_alias(context, context.resource)
+            context.resource = resource
+            connect_alias(context, resource)
+            if getattr(context, 'dangling', False):
+                context.dangling = False
         query = struct['query']
         context.updatequery(query)
         context.anchor = struct['anchor']
+        context.status = int(struct.get('status') or 0) or None
+        context.max_age = struct.get('max_age')
+        context.query_mode = struct.get('query_mode') or None
 
 @content(
     IAlias,
@@ -167,50 +871,137 @@ class AliasPropertySheet(PropertySheet):
         ('Basic', AliasPropertySheet),
         )
 )
+@implementer(IAlias)
 class Alias(Persistent):
-    """ Object representing a resource alias."""
+    """ Object representing a resource alias.
 
-    def __init__(self, name, resource, query=None, anchor=None):
+    The query is stored once, as ``_query``, a tuple of (key, value) pairs;
+    the encoded query string is part of the stored location. Aliases pickled
+    with the older ``query`` list and ``_querydict`` are converted when they
+    are loaded (see ``__setstate__``) and rewritten by the
+    ``compact_alias_storage`` evolve step.
+    """
+    __name__ = None
+    __parent__ = None
+    # aliases created by older versions have no stored location
+    _location = None
+    # redirect status and cache max-age, None for the site defaults
+    status = None
+    max_age = None
+    # set when the target is removed; dangling aliases answer 404 Not Found
+    dangling = False
+    # one of ``QUERY_MODES``, None to ignore the incoming query string
+    query_mode = None
+
+    def __init__(self, name, resource, query=None, anchor=None, status=None,
+                 max_age=None, query_mode=None):
         self.name = name
         self.resource = resource
         self.anchor = anchor
-        self.query = query
-        self._querydict = self.dict_from_query(query)
+        if status is not None:
+            self.status = status
+        if max_age is not None:
+            self.max_age = max_age
+        if query_mode is not None:
+            self.query_mode = query_mode
+        self._query = query_pairs(query)
+        self.refresh_location()
+
+    def __setstate__(self, state):
+        """ Converts the state of aliases stored in the old format."""
+        if isinstance(state, dict) and '_query' not in state:
+            state = dict(state)
+            state['_query'] = query_pairs(state.pop('query', None))
+            state.pop('_querydict', None)
+            state.setdefault('_location', None)
+        Persistent.__setstate__(self, state)
+
+    @property
+    def query(self):
+        """ The query as a list of "key=value" strings, as edited in the SDI,
+        or None if there is none (see ``query_strings``).
+        """
+        if not self._query:
+            return None
+        return query_strings(self._query)
 
-    def generate_url(self, request):
-        """ Builds up a list of keyword arguments for non-None elements.
-        Otherwise default values for query and anchor would always
-        append '?' and '#' elements to the URL.
+    def build_location(self):
+        """ Returns the host-relative location (path, query string and anchor)
+        of the resource, e.g. '/blog/post/?page=7#comments'.
+        Only non-None elements are added, otherwise default values for query
+        and anchor would always append '?' and '#' elements to the URL.
         """
-        kwargs = {}
-        if self._querydict is not None:
-            kwargs['query'] = self._querydict
-        if self.anchor is not None:
-            kwargs['anchor'] = self.anchor
-        return request.resource_url(self.resource, **kwargs)
+        with timed('build_location'):
+            return make_location(resource_path(self.resource), self._query,
+                                 self.anchor)
 
-    def redirect(self, request):
-        """ Perform a redirect."""
-        url = self.generate_url(request)
-        return HTTPFound(location=url)
-
-    def dict_from_query(self, query):
-        """ Turns a sequence of "key=value" or "key" strings into a dict.
-        Note: ``_querydict`` should be None if ``query`` is either None or
-        (in the event items are added to the sequence then removed) [].
+    def refresh_location(self):
+        """ Stores a freshly built location. Called when the alias is
+        created, its properties change or its target is moved.
         """
-        if query == None or query == []:
-            return None
+        self._location = self.build_location()
 
-        d = {}
+    def retarget(self, resource):
+        """ Points the alias at ``resource``, moving its objectmap reference,
+        and refreshes the stored location. A dangling alias stays dangling
+        unless its new target is in the tree.
+        """
+        if resource is not self.resource:
+            disconnect_alias(self, self.resource)
+            self.resource = resource
+            connect_alias(self, resource)
+        if self.dangling and has_target(self):
+            self.dangling = False
+        self.refresh_location()
+
+    def get_location(self):
+        """ Returns the stored location. Aliases created by older versions
+        have none until they are modified or evolved; their location is built
+        without storing it, so a redirect never writes to the database.
+        """
+        location = self._location
+        if location is None:
+            location = self.build_location()
+        return location
 
-        for item in query:
-            key, sep, value = item.partition('=')
-            d[key] = value
+    def generate_url(self, request):
+        """ Returns the absolute URL of the resource for ``request``.
+        The location is host-relative, so the same stored value is valid for
+        every virtual host. Requests using a virtual root fall back to
+        ``request.resource_url`` as the physical path does not apply to them.
+        """
+        registry = request.registry
+        with timed('generate_url', registry):
+            if 'HTTP_X_VHM_ROOT' not in request.environ:
+                with timed('location', registry):
+                    location = self.get_location()
+                return request.application_url + location
+            kwargs = {}
+            if self._query:
+                kwargs['query'] = self._query
+            if self.anchor is not None:
+                kwargs['anchor'] = self.anchor
+            with timed('resource_url', registry):
+                return request.resource_url(self.resource, **kwargs)
 
-        return d
+    def redirect(self, request):
+        """ Perform a redirect with the status and caching headers of this
+        alias (see ``make_redirect``). If the target is another alias, the
+        chain is followed (up to the ``substanced_alias.max_chain_depth``
+        setting) and the redirect goes straight to the final destination.
+        Chains leading back to one of their aliases, and dangling aliases,
+        are answered with 404 Not Found. The incoming query string is
+        combined with the query of the alias according to ``query_mode``.
+        """
+        if self.dangling:
+            raise HTTPNotFound('Alias target removed')
+        url = follow_chain(self, request).generate_url(request)
+        url = merge_query(url, request.query_string, self.query_mode)
+        mtime = chain_mtime(self, get_chain_depth(request.registry))
+        with timed('response', request.registry):
+            return make_redirect(request, url, self.status, self.max_age,
+                                 mtime)
 
     def updatequery(self, query):
-        """ Convenience method to reset both ``query`` and ``_querydict``. """
-        self.query = query
-        self._querydict = self.dict_from_query(query)
+        """ Sets the query from a sequence of "key=value" strings."""
+        self._query = query_pairs(query)
@@ -0,0 +1,228 @@
+""" An ASGI application serving alias redirects from an in-memory snapshot.
+
+``AliasRedirectApp`` answers GET and HEAD requests for alias paths without
+a worker thread per request: the redirects are held in a dict, replaced as a
+whole by ``RedirectSnapshot.refresh``, which runs in a thread pool every few
+seconds and only rebuilds the dict when the lookup table generation on the
+root has changed. Other requests are passed to the wrapped ASGI application
+(e.g. the Pyramid application behind an ASGI to WSGI adapter), or answered
+with 404 Not Found when there is none.
+
+The snapshot is built from the redirect index of
+``substanced_alias.redirectmap``, so it loads neither aliases nor their
+targets. This module requires Python 3.5 or later; the rest of the package
+does not import it.
+
+Use ``make_app`` to build the application from a Pyramid configuration file::
+
+  from substanced_alias.asgi import make_app
+  app = make_app('production.ini', pyramid_asgi_app)
+"""
+import asyncio
+import logging
+
+import transaction
+
+from . import (
+    MAX_CHAIN_DEPTH,
+    TABLE_GENERATION_ATTR,
+    get_chain_depth,
+    get_generation,
+    get_redirect_status,
+    merge_query,
+    )
+from .redirectmap import (
+    build_index,
+    get_index,
+    iter_redirects,
+    )
+
+logger = logging.getLogger(__name__)
+
+# default seconds between checks for changed aliases
+REFRESH_INTERVAL = 5
+
+
+def snapshot_key(path):
+    """ Returns the key ``path`` is stored under: without a trailing slash,
+    like the keys of the lookup file.
+    """
+    return path.rstrip('/') or '/'
+
+
+class RedirectSnapshot(object):
+    """ The redirects of the root with oid ``root_oid`` in ``db``, as a dict
+    of path -> (host-relative location, status, max_age, query_mode).
+    """
+
+    def __init__(self, db, root_oid, max_depth=MAX_CHAIN_DEPTH):
+        self.db = db
+        self.root_oid = root_oid
+        self.max_depth = max_depth
+        self.generation = None
+        self.redirects = {}
+
+    def get(self, path):
+        return self.redirects.get(snapshot_key(path))
+
+    def refresh(self):
+        """ Rebuilds the snapshot in a new connection if aliases changed
+        since the last refresh. Returns True if it was rebuilt. Nothing is
+        ever committed: if the redirect index is missing it is built in
+        memory and discarded.
+        """
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        try:
+            tm.begin()
+            root = conn.get(self.root_oid)
+            generation = get_generation(root, TABLE_GENERATION_ATTR)
+            if generation == self.generation:
+                return False
+            if get_index(root) is None:
+                logger.warning('No alias redirect index, building one for '
+                               'this snapshot only')
+                build_index(root)
+            redirects = {}
+            for row in iter_redirects(root, self.max_depth):
+                redirects[snapshot_key(row[0])] = row[1:]
+            self.redirects = redirects
+            self.generation = generation
+            return True
+        finally:
+            tm.abort()
+            conn.close()
+
+
+class AliasRedirectApp(object):
+    """ An ASGI application answering requests for the paths in
+    ``snapshot`` and passing everything else to the ASGI application
+    ``app``. ``status`` and ``max_age`` are used for aliases without their
+    own, as the ``substanced_alias.redirect_status`` and
+    ``substanced_alias.max_age`` settings are by ``make_redirect``.
+    """
+
+    def __init__(self, snapshot, app=None, status=302, max_age=None,
+                 interval=REFRESH_INTERVAL):
+        self.snapshot = snapshot
+        self.app = app
+        self.status = status
+        self.max_age = max_age
+        self.interval = interval
+        self._refreshing = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self._start_refreshing()
+            entry = None
+            if scope['method'] in ('GET', 'HEAD'):
+                entry = self.snapshot.get(scope['path'])
+            if entry is not None:
+                await self._redirect(scope, send, *entry)
+                return
+        elif scope['type'] == 'lifespan' and self.app is None:
+            await self._lifespan(receive, send)
+            return
+        if self.app is None:
+            await self._not_found(send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def _start_refreshing(self):
+        """ Loads the first snapshot and starts the background refresh,
+        once. Requests arriving meanwhile wait for the first snapshot.
+        """
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._first_refresh())
+        await asyncio.shield(self._refreshing)
+
+    async def _first_refresh(self):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.snapshot.refresh)
+        asyncio.ensure_future(self._refresh_forever())
+
+    async def _refresh_forever(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await loop.run_in_executor(None, self.snapshot.refresh)
+            except Exception:
+                logger.exception('Error refreshing the alias snapshot')
+
+    async def _redirect(self, scope, send, location, status, max_age,
+                        query_mode):
+        location = merge_query(
+            location, scope.get('query_string', b'').decode('latin-1'),
+            query_mode)
+        if status is None:
+            status = self.status
+        if max_age is None:
+            max_age = self.max_age
+        headers = [
+            (b'location', (base_url(scope) + location).encode('utf-8')),
+            (b'content-length', b'0'),
+            ]
+        if max_age not in (None, ''):
+            headers.append((b'cache-control',
+                            ('public, max-age=%d' % int(max_age)).encode(
+                                'ascii')))
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _not_found(self, send):
+        await send({'type': 'http.response.start', 'status': 404,
+                    'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Not Found'})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self._start_refreshing()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def base_url(scope):
+    """ Returns the scheme, host and root path of the request ``scope``."""
+    host = None
+    for name, value in scope.get('headers', ()):
+        if name == b'host':
+            host = value.decode('latin-1')
+            break
+    if host is None:
+        server = scope.get('server') or ('localhost', 80)
+        host = '%s:%s' % server
+    return '%s://%s%s' % (scope.get('scheme', 'http'), host,
+                          scope.get('root_path', ''))
+
+
+def make_app(config_uri, app=None):
+    """ Returns an ``AliasRedirectApp`` for the site configured in
+    ``config_uri``, wrapping the ASGI application ``app``. Reads the
+    ``substanced_alias.redirect_status``, ``substanced_alias.max_age``,
+    ``substanced_alias.max_chain_depth`` and
+    ``substanced_alias.snapshot_interval`` settings, raising ``ValueError``
+    for an unknown redirect status.
+    """
+    from pyramid.paster import bootstrap
+    env = bootstrap(config_uri)
+    try:
+        root = env['root']
+        registry = env['registry']
+        status = get_redirect_status(registry)
+        snapshot = RedirectSnapshot(root._p_jar.db(), root._p_oid,
+                                    get_chain_depth(registry))
+    finally:
+        env['closer']()
+    settings = registry.settings or {}
+    return AliasRedirectApp(
+        snapshot, app,
+        status=status,
+        max_age=settings.get('substanced_alias.max_age'),
+        interval=float(settings.get('substanced_alias.snapshot_interval',
+                                    REFRESH_INTERVAL)))
@@ -0,0 +1,278 @@
+""" Streaming import and export of aliases as CSV or JSON lines.
+
+Each row describes one alias with the fields in ``FIELDS``:
+
+  ``name`` : the alias name
+  ``resource`` : the path of the target resource
+  ``query`` : "key=value" items, a list in JSON or joined by '&' in CSV
+  ``anchor`` : the anchor, or empty
+  ``container`` : the path of the folder holding the alias, or empty for root
+
+Rows for an ``AliasFolder`` container are stored as entries of the folder
+rather than as ``Alias`` objects.
+
+Rows are read and written one at a time, so files of any size can be
+processed without loading them into memory.
+"""
+import csv
+import json
+from itertools import islice
+
+import colander
+import transaction
+
+from pyramid.traversal import (
+    quote_path_segment,
+    resource_path,
+    )
+from substanced.util import find_objectmap
+
+from . import (
+    IAlias,
+    AliasSchema,
+    alias_name_validator,
+    alias_resource_validator,
+    check_alias_names,
+    find_target,
+    iter_aliases,
+    iter_content,
+    query_strings,
+    resolve_paths,
+    )
+from .folder import IAliasFolder
+
+FIELDS = ('name', 'resource', 'query', 'anchor', 'container')
+
+# fields every row needs, as non-empty strings
+REQUIRED_FIELDS = ('name', 'resource')
+
+# byte and text strings on Python 2, str on Python 3
+STRING_TYPES = (str, type(u''))
+
+
+def parse_query(value):
+    """ Turns a query field into the list of "key=value" strings stored by
+    ``Alias``, or None if it is empty.
+    """
+    if not value:
+        return None
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return value.split('&')
+
+def read_csv(stream):
+    """ Yields a row dict for each line of a CSV file with a header line."""
+    for row in csv.DictReader(stream):
+        yield row
+
+def read_jsonl(stream):
+    """ Yields a row dict for each non-blank line of a JSON lines file."""
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+def write_csv(rows, stream):
+    """ Writes ``rows`` to ``stream`` as CSV with a header line."""
+    writer = csv.DictWriter(stream, FIELDS)
+    writer.writeheader()
+    for row in rows:
+        row = dict(row, query='&'.join(row['query'] or ()))
+        writer.writerow(row)
+
+def write_jsonl(rows, stream):
+    """ Writes ``rows`` to ``stream`` as JSON lines."""
+    for row in rows:
+        stream.write(json.dumps(row) + '\n')
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl}
+
+
+class ValidationRequest(object):
+    """ The parts of a request used by the ``AliasSchema`` validators, so
+    they can be bound outside of a form. ``targets`` is the memo used by
+    ``find_target`` and may be shared between rows.
+    """
+    def __init__(self, context, root, targets=None):
+        self.context = context
+        self.root = root
+        self._alias_targets = {} if targets is None else targets
+
+def check_row(row):
+    """ Returns an error message if ``row`` is not a dict with non-empty
+    strings for the ``REQUIRED_FIELDS`` and a string or nothing for the
+    container, or None if it can be validated.
+    """
+    if not isinstance(row, dict):
+        return 'Not a row of fields'
+    for field in REQUIRED_FIELDS:
+        value = row.get(field)
+        if not value:
+            return 'Missing %s' % field
+        if not isinstance(value, STRING_TYPES):
+            return 'Invalid %s' % field
+    container = row.get('container')
+    if container and not isinstance(container, STRING_TYPES):
+        return 'Invalid container'
+    return None
+
+def validate_row(root, row, schema=None, targets=None, name_errors=None):
+    """ Checks ``row`` with the ``AliasSchema`` name and resource validators.
+    Returns the container, or raises ``colander.Invalid`` or ``KeyError``.
+    If given, ``name_errors`` (see ``check_batch_names``) replaces the name
+    validator.
+    """
+    if schema is None:
+        schema = AliasSchema()
+    request = ValidationRequest(root, root, targets)
+    container_path = row.get('container') or ''
+    request.context = find_target(request, container_path)
+    kw = {'request': request}
+    if name_errors is None:
+        node = schema['name']
+        alias_name_validator(node, kw)(node, row['name'])
+    else:
+        error = name_errors.get((container_path, row['name']))
+        if error is not None:
+            raise colander.Invalid(schema['name'], error, row['name'])
+    node = schema['resource']
+    alias_resource_validator(node, kw)(node, row['resource'])
+    return request.context
+
+def check_batch_names(rows, targets):
+    """ Returns a dict of (container path, name) -> error message for the
+    ``rows`` whose name cannot be used in their container. The names of each
+    container are checked together with ``check_alias_names``; containers
+    must have been resolved into ``targets`` and missing ones are skipped.
+    """
+    names = {}
+    for row in rows:
+        names.setdefault(row.get('container') or '', []).append(row['name'])
+    errors = {}
+    for path, container_names in names.items():
+        container = targets.get(path)
+        if container is None:
+            continue
+        for name, error in check_alias_names(container,
+                                             container_names).items():
+            errors[(path, name)] = error
+    return errors
+
+def batched(rows, size):
+    """ Yields lists of at most ``size`` items from the iterable ``rows``."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            break
+        yield batch
+
+def import_aliases(root, rows, registry, commit_size=1000, savepoint_size=100,
+                   txn=transaction):
+    """ Creates an ``Alias`` for each row in ``rows``, or an entry added
+    with ``add_alias`` if the row's container is an ``AliasFolder``.
+
+    Rows are processed in batches of ``savepoint_size``. Rows without the
+    required fields (see ``check_row``) are skipped. The containers and
+    targets of a batch are resolved together with ``resolve_paths`` before
+    validation, so each container is traversed once per batch, and the names
+    of a batch are checked per container with ``check_batch_names``. Rows
+    failing validation are skipped. A savepoint is made after each batch,
+    which lets the object cache be trimmed, and the transaction is committed
+    every ``commit_size`` aliases and at the end. A ``commit_size`` of None
+    leaves committing to the caller.
+
+    Returns a tuple of (number of aliases created, list of (row number,
+    error message) tuples).
+    """
+    schema = AliasSchema()
+    jar = getattr(root, '_p_jar', None)
+    created = 0
+    uncommitted = 0
+    errors = []
+    targets = {}
+    lineno = 0
+    for batch in batched(rows, savepoint_size or 100):
+        problems = [check_row(row) for row in batch]
+        valid = [row for row, problem in zip(batch, problems)
+                 if problem is None]
+        paths = set()
+        for row in valid:
+            paths.add(row.get('container') or '')
+            paths.add(row['resource'])
+        resolve_paths(root, paths, targets)
+        name_errors = check_batch_names(valid, targets)
+        added = set()
+        for row, problem in zip(batch, problems):
+            lineno += 1
+            if problem is not None:
+                errors.append((lineno, problem))
+                continue
+            try:
+                container = validate_row(root, row, schema, targets,
+                                         name_errors)
+            except colander.Invalid as e:
+                errors.append((lineno, '; '.join(e.messages())))
+                continue
+            except KeyError:
+                errors.append((lineno, 'Container not found'))
+                continue
+            key = (id(container), row['name'])
+            if key in added:
+                errors.append((lineno, 'An object named %s already exists'
+                               % row['name']))
+                continue
+            added.add(key)
+            resource = targets[row['resource']]
+            query = parse_query(row.get('query'))
+            anchor = row.get('anchor') or None
+            if IAliasFolder.providedBy(container):
+                container.add_alias(row['name'], resource, query=query,
+                                    anchor=anchor)
+            else:
+                alias = registry.content.create(
+                    IAlias, row['name'], resource, query=query, anchor=anchor)
+                container[row['name']] = alias
+            created += 1
+            uncommitted += 1
+        if commit_size and uncommitted >= commit_size:
+            txn.commit()
+            uncommitted = 0
+            targets.clear()
+            if jar is not None:
+                jar.cacheMinimize()
+        else:
+            txn.savepoint(optimistic=True)
+    if commit_size:
+        txn.commit()
+    return created, errors
+
+def export_aliases(root):
+    """ Yields a row dict for each ``Alias`` below ``root``, then for each
+    entry of the ``AliasFolder`` objects below ``root``. Folder entries
+    whose target no longer exists are left out, as they could not be
+    imported again.
+    """
+    for alias in iter_aliases(root):
+        yield {
+            'name': alias.__name__,
+            'resource': resource_path(alias.resource),
+            'query': alias.query,
+            'anchor': alias.anchor,
+            'container': resource_path(alias.__parent__),
+            }
+    for folder in iter_content(root, IAliasFolder):
+        objectmap = find_objectmap(folder)
+        container = resource_path(folder)
+        for name, (oid, query, anchor) in folder.aliases.items():
+            path = objectmap.path_for(oid)
+            if path is None:
+                continue
+            yield {
+                'name': name,
+                'resource': '/'.join(
+                    quote_path_segment(segment) for segment in path) or '/',
+                'query': query_strings(query) or None,
+                'anchor': anchor,
+                'container': container,
+                }
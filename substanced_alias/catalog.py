@@ -0,0 +1,159 @@
+""" The ``alias`` catalog, indexing ``Alias`` objects for SDI listings.
+
+The catalog has four indexes:
+
+  ``alias_name`` (field) : the name of the alias
+  ``target_path`` (field) : the path of the target, '' for dangling aliases
+  ``query_keys`` (keyword) : the names of the query parameters
+  ``anchor`` (field) : the anchor
+
+Field indexes are sorted, so prefix searches (e.g. all aliases named
+``promo-*`` or targeting ``/blog/*``) are range queries. The catalog is
+added to new sites when their root is created and to existing sites by the
+``add_alias_catalog`` evolution step. Substance D indexes aliases when they
+are added or modified; aliases whose target moves are reindexed by the
+``resource_moved`` subscriber. ``AliasFolder`` entries are not content
+objects and are not indexed.
+"""
+import transaction
+
+from pyramid.traversal import resource_path
+from substanced.catalog import (
+    Field,
+    Keyword,
+    catalog_factory,
+    indexview,
+    indexview_defaults,
+    )
+from substanced.util import (
+    find_catalog,
+    find_objectmap,
+    get_oid,
+    )
+
+from . import (
+    AliasToTarget,
+    IAlias,
+    iter_aliases,
+    )
+
+# name of the alias catalog in the catalogs service of the root
+CATALOG_NAME = 'alias'
+
+# the indexes the All Aliases view can sort by
+SORT_INDEXES = ('alias_name', 'target_path')
+
+
+@indexview_defaults(catalog_name=CATALOG_NAME, context=IAlias)
+class AliasIndexViews(object):
+    def __init__(self, resource):
+        self.resource = resource
+
+    @indexview()
+    def alias_name(self, default):
+        name = getattr(self.resource, '__name__', None)
+        if name is None:
+            return default
+        return name
+
+    @indexview()
+    def target_path(self, default):
+        """ Returns the path of the target, from the objectmap when the alias
+        is connected to its target so the target is not loaded.
+        """
+        alias = self.resource
+        if alias.dangling:
+            return ''
+        objectmap = find_objectmap(alias)
+        if objectmap is not None:
+            for oid in objectmap.targetids(alias, AliasToTarget):
+                path = objectmap.path_for(oid)
+                if path is not None:
+                    return '/'.join(path) or '/'
+        return resource_path(alias.resource)
+
+    @indexview()
+    def query_keys(self, default):
+        keys = [key for key, value in self.resource._query]
+        if not keys:
+            return default
+        return keys
+
+    @indexview()
+    def anchor(self, default):
+        anchor = self.resource.anchor
+        if anchor is None:
+            return default
+        return anchor
+
+
+@catalog_factory(CATALOG_NAME)
+class AliasCatalogFactory(object):
+    alias_name = Field()
+    target_path = Field()
+    query_keys = Keyword()
+    anchor = Field()
+
+
+def add_alias_catalog(root, registry=None, batch_size=1000,
+                      txn=transaction):
+    """ Adds the alias catalog to the catalogs service of ``root`` and
+    indexes the existing aliases, unless it is already there. A new catalog
+    only knows the objects it has indexed, so the aliases are found with
+    ``iter_aliases``, ``batch_size`` at a time, with a savepoint after each
+    batch so memory use stays bounded.
+    """
+    catalogs = root['catalogs']
+    if CATALOG_NAME in catalogs:
+        return
+    catalog = catalogs.add_catalog(CATALOG_NAME)
+    for count, alias in enumerate(iter_aliases(root, batch_size), 1):
+        catalog.index_resource(alias, oid=get_oid(alias))
+        if count % batch_size == 0:
+            txn.savepoint(optimistic=True)
+
+def reindex_alias(alias):
+    """ Reindexes ``alias`` in the alias catalog, if there is one."""
+    catalog = find_catalog(alias, CATALOG_NAME)
+    if catalog is not None:
+        catalog.reindex_resource(alias)
+
+def reindex_alias_targets(resource):
+    """ Refreshes the stored locations of the aliases pointing at
+    ``resource`` or at any object below it, e.g. after it has been moved, and
+    reindexes them in the alias catalog if there is one. They are found
+    through their ``AliasToTarget`` references.
+    """
+    objectmap = find_objectmap(resource)
+    if objectmap is None:
+        return
+    catalog = find_catalog(resource, CATALOG_NAME)
+    for oid in objectmap.pathlookup(resource):
+        for alias_oid in objectmap.sourceids(oid, AliasToTarget):
+            alias = objectmap.object_for(alias_oid)
+            if alias is None:
+                continue
+            alias.refresh_location()
+            if catalog is not None:
+                catalog.reindex_resource(alias, oid=alias_oid)
+
+def prefix_range(index, prefix):
+    """ Returns a query for the values of the field ``index`` starting with
+    ``prefix``.
+    """
+    return index.inrange(prefix, prefix + u'\uffff')
+
+def search_aliases(catalog, name=None, target=None, query_key=None):
+    """ Returns an unsorted result set of the aliases in the alias
+    ``catalog`` whose name starts with ``name``, whose target path starts
+    with ``target`` and which have a query parameter named ``query_key``,
+    each if given.
+    """
+    query = catalog['alias_name'].ge(u'')
+    if name:
+        query = prefix_range(catalog['alias_name'], name)
+    if target:
+        query = query & prefix_range(catalog['target_path'], target)
+    if query_key:
+        query = query & catalog['query_keys'].any([query_key])
+    return query.execute()
@@ -0,0 +1,169 @@
+""" Per-alias hit counters that never write in the redirect's transaction.
+
+When the ``substanced_alias.hit_counters`` setting is true, ``includeme``
+registers a ``HitCounter`` utility. Each alias redirect increments an
+in-memory count keyed by the alias path. Every
+``substanced_alias.hit_flush_interval`` seconds (default 30) the counts are
+drained and added to a BTree of ``BTrees.Length.Length`` objects on the root,
+in a separate connection and transaction on a background thread. Length
+objects resolve concurrent increments from other workers instead of raising
+``ConflictError``.
+"""
+import heapq
+import logging
+import threading
+import time
+
+import transaction
+
+from BTrees.Length import Length
+from BTrees.OOBTree import OOBTree
+from ZODB.POSException import ConflictError
+from zope.interface import Interface
+
+logger = logging.getLogger(__name__)
+
+# name of the root attribute holding the flushed hit counts
+HITS_ATTR = '__alias_hits__'
+
+class IAliasHitCounter(Interface):
+    """ Marker interface for the ``HitCounter`` utility."""
+
+
+def hit_key(request):
+    """ Returns the key an alias hit is counted under: the request path
+    without a trailing slash.
+    """
+    return request.path_info.rstrip('/') or '/'
+
+def add_hits(root, counts):
+    """ Adds the dict of path -> count ``counts`` to the hits stored on
+    ``root``.
+    """
+    hits = getattr(root, HITS_ATTR, None)
+    if hits is None:
+        hits = OOBTree()
+        setattr(root, HITS_ATTR, hits)
+    for key, count in counts.items():
+        counter = hits.get(key)
+        if counter is None:
+            hits[key] = Length(count)
+        else:
+            counter.change(count)
+
+def iter_hits(root):
+    """ Yields a (path, count) tuple for every alias path with flushed hits,
+    in path order.
+    """
+    hits = getattr(root, HITS_ATTR, None)
+    if hits is None:
+        return
+    for key, counter in hits.items():
+        yield key, counter()
+
+def get_hits(root, path):
+    """ Returns the number of flushed hits for the alias ``path``."""
+    hits = getattr(root, HITS_ATTR, None)
+    if hits is None:
+        return 0
+    counter = hits.get(path.rstrip('/') or '/')
+    if counter is None:
+        return 0
+    return counter()
+
+def top_hits(root, limit):
+    """ Returns a list of the ``limit`` (path, count) tuples with the most
+    hits, most hits first.
+    """
+    return heapq.nlargest(limit, iter_hits(root), key=lambda item: item[1])
+
+
+class HitCounter(object):
+    """ A lock-striped, in-memory hit aggregator. Increments only lock one
+    of ``stripes`` dicts, so concurrent requests rarely wait on each other.
+    """
+
+    def __init__(self, stripes=16, interval=30, retries=3):
+        self._stripes = [({}, threading.Lock()) for i in range(stripes)]
+        self.interval = interval
+        self.retries = retries
+        self._last_flush = time.time()
+        self._flushing = threading.Lock()
+
+    def hit(self, key, count=1):
+        counts, lock = self._stripes[hash(key) % len(self._stripes)]
+        with lock:
+            counts[key] = counts.get(key, 0) + count
+
+    def drain(self):
+        """ Returns and resets the counts accumulated since the last drain."""
+        result = {}
+        for counts, lock in self._stripes:
+            with lock:
+                items = list(counts.items())
+                counts.clear()
+            for key, count in items:
+                result[key] = result.get(key, 0) + count
+        return result
+
+    def flush(self, db, root_oid):
+        """ Adds the drained counts to the root with oid ``root_oid`` using a
+        new connection to ``db``. Counts that could not be committed are put
+        back to be retried by the next flush.
+        """
+        counts = self.drain()
+        if not counts:
+            return
+        tm = transaction.TransactionManager()
+        conn = db.open(transaction_manager=tm)
+        try:
+            for attempt in range(self.retries):
+                try:
+                    tm.begin()
+                    add_hits(conn.get(root_oid), counts)
+                    tm.commit()
+                    return
+                except ConflictError:
+                    tm.abort()
+            logger.warning('Could not flush alias hits, will retry')
+            for key, count in counts.items():
+                self.hit(key, count)
+        finally:
+            conn.close()
+
+    def maybe_flush(self, db, root_oid):
+        """ Starts a background flush if ``interval`` seconds have passed
+        since the last one and no flush is running.
+        """
+        if time.time() - self._last_flush < self.interval:
+            return
+        if not self._flushing.acquire(False):
+            return
+        self._last_flush = time.time()
+        thread = threading.Thread(target=self._flush, args=(db, root_oid))
+        thread.daemon = True
+        thread.start()
+
+    def _flush(self, db, root_oid):
+        try:
+            self.flush(db, root_oid)
+        except Exception:
+            logger.exception('Error flushing alias hits')
+        finally:
+            self._flushing.release()
+
+
+def count_hit(request, root=None):
+    """ Counts a hit on the alias served by ``request`` if hit counters are
+    enabled, and flushes them in the background when they are due.
+    ``root`` defaults to ``request.root``.
+    """
+    counter = request.registry.queryUtility(IAliasHitCounter)
+    if counter is None:
+        return
+    counter.hit(hit_key(request))
+    if root is None:
+        root = request.root
+    jar = getattr(root, '_p_jar', None)
+    if jar is not None:
+        counter.maybe_flush(jar.db(), root._p_oid)
@@ -0,0 +1,28 @@
+""" Evolution steps for existing substanced_alias databases.
+
+Registered by ``includeme``; run them with Substance D's ``sd_evolve``.
+"""
+import logging
+
+import transaction
+
+from . import iter_aliases
+
+logger = logging.getLogger('evolution')
+
+def compact_alias_storage(root, registry=None, txn=transaction):
+    """ Rewrites every ``Alias`` so it is stored with the compact ``_query``
+    pairs instead of the old ``query`` list and ``_querydict``, and with a
+    precomputed location. Old state is converted by ``Alias.__setstate__``
+    when loaded, so marking each alias as changed is enough to store it in
+    the new format. A savepoint every 1000 aliases keeps memory bounded.
+    """
+    logger.info('substanced_alias: compacting alias storage')
+    count = 0
+    for count, alias in enumerate(iter_aliases(root), 1):
+        alias.refresh_location()
+        alias._p_changed = True
+        if count % 1000 == 0:
+            txn.savepoint(optimistic=True)
+            logger.info('substanced_alias: compacted %s aliases' % count)
+    logger.info('substanced_alias: compacted %s aliases in total' % count)
@@ -0,0 +1,210 @@
+""" A folder storing large numbers of aliases compactly.
+
+An ``AliasFolder`` keeps its aliases in a single OOBTree of
+name -> (target oid, query pairs, anchor) instead of as ``Alias`` child
+objects. Entries do not show up in folder listings and do not become
+persistent objects of their own, so millions of them fit in a handful of
+BTree buckets. A second BTree of target oid -> alias names finds the entries
+pointing at given objects without scanning them all. Traversing to an entry
+(e.g. /go/NEAT) returns an ``AliasRecord``, which the default alias view
+redirects like any ``Alias``.
+"""
+from BTrees.Length import Length
+from pyramid.httpexceptions import HTTPNotFound
+from substanced.content import content
+from substanced.folder import (
+    Folder,
+    FolderKeyError,
+    )
+from substanced.interfaces import IFolder
+from substanced.util import (
+    find_objectmap,
+    get_oid,
+    )
+from zope.interface import implementer
+
+from . import (
+    IAlias,
+    AliasToTarget,
+    TABLE_GENERATION_ATTR,
+    bump_generation,
+    follow_chain,
+    location_for_oid,
+    make_redirect,
+    query_pairs,
+    )
+
+class IAliasFolder(IFolder):
+    """ Interface representing a folder that stores aliases in a BTree."""
+
+
+@implementer(IAlias)
+class AliasRecord(object):
+    """ A transient alias built from an ``AliasFolder`` entry."""
+
+    def __init__(self, name, parent, oid, query=(), anchor=None):
+        self.__name__ = name
+        self.__parent__ = parent
+        self.oid = oid
+        self.query = query
+        self.anchor = anchor
+
+    @property
+    def resource(self):
+        """ The target resource, or None if it no longer exists."""
+        objectmap = find_objectmap(self.__parent__)
+        return objectmap.object_for(self.oid)
+
+    def get_location(self):
+        """ Returns the host-relative location of the target. The path comes
+        straight from the objectmap, so neither the target nor its ancestors
+        are loaded. Raises ``KeyError`` if the target no longer exists.
+        """
+        objectmap = find_objectmap(self.__parent__)
+        location = location_for_oid(objectmap, self.oid, self.query,
+                                    self.anchor)
+        if location is None:
+            raise KeyError(self.oid)
+        return location
+
+    def generate_url(self, request):
+        return request.application_url + self.get_location()
+
+    def targets_alias(self):
+        """ Returns True if the target is an ``Alias``, without loading it:
+        only aliases are the source of ``AliasToTarget`` references.
+        """
+        objectmap = find_objectmap(self.__parent__)
+        return bool(objectmap.targetids(self.oid, AliasToTarget))
+
+    def redirect(self, request):
+        """ Perform a redirect, following chains of aliases like
+        ``Alias.redirect``. Entries have no redirect policy of their own, so
+        the site's default status and max-age are used. Entries whose target
+        was removed are answered with 404 Not Found.
+        """
+        alias = self
+        if self.targets_alias():
+            alias = follow_chain(self, request)
+        try:
+            url = alias.generate_url(request)
+        except KeyError:
+            raise HTTPNotFound('Alias target removed')
+        return make_redirect(request, url)
+
+
+@content(
+    IAliasFolder,
+    name='Alias Folder',
+    icon='icon-folder-close',
+    add_view='add_alias_folder',
+)
+@implementer(IAliasFolder)
+class AliasFolder(Folder):
+    """ A folder whose aliases are stored in the ``aliases`` BTree. It can
+    hold ordinary children as well; names are unique across both. The
+    ``targets`` BTree maps target oids to the names of the aliases pointing
+    at them.
+    """
+
+    def __init__(self, data=None, family=None):
+        Folder.__init__(self, data, family)
+        self.aliases = self.family.OO.BTree()
+        self.targets = self.family.IO.BTree()
+        self._num_aliases = Length()
+
+    def check_name(self, name, reserved_names=()):
+        """ Like ``Folder.check_name``, but also rejects alias names."""
+        name = Folder.check_name(self, name, reserved_names)
+        if name in self.aliases:
+            raise FolderKeyError('An alias named %s already exists' % name)
+        return name
+
+    def add_alias(self, name, resource, query=None, anchor=None):
+        """ Stores an alias named ``name`` pointing at ``resource``, which
+        must have an oid. ``query`` is a sequence of "key=value" strings, as
+        for ``Alias``.
+        """
+        name = self.check_name(name)
+        oid = get_oid(resource)
+        self.aliases[name] = (oid, query_pairs(query), anchor)
+        self._index_target(oid, name)
+        self._num_aliases.change(1)
+        self._aliases_changed()
+        return name
+
+    def retarget_alias(self, name, resource, query=None, anchor=None):
+        """ Points the existing alias named ``name`` at ``resource`` with the
+        given query and anchor, raising ``KeyError`` if there is none.
+        """
+        old_oid = self.aliases[name][0]
+        oid = get_oid(resource)
+        self.aliases[name] = (oid, query_pairs(query), anchor)
+        if oid != old_oid:
+            self._unindex_target(old_oid, name)
+            self._index_target(oid, name)
+        self._aliases_changed()
+
+    def remove_alias(self, name):
+        """ Removes the alias named ``name``, raising ``KeyError`` if there is
+        none.
+        """
+        oid = self.aliases.pop(name)[0]
+        self._unindex_target(oid, name)
+        self._num_aliases.change(-1)
+        self._aliases_changed()
+
+    def alias_names_for(self, oids):
+        """ Returns the sorted names of the aliases pointing at any of the
+        objects with ``oids``, e.g. the result of the objectmap's
+        ``pathlookup``.
+        """
+        names = []
+        for oid in oids:
+            names.extend(self.targets.get(oid, ()))
+        return sorted(names)
+
+    def _index_target(self, oid, name):
+        names = self.targets.get(oid)
+        if names is None:
+            names = self.targets[oid] = self.family.OO.TreeSet()
+        names.insert(name)
+
+    def _unindex_target(self, oid, name):
+        names = self.targets[oid]
+        names.remove(name)
+        if not names:
+            del self.targets[oid]
+
+    def _aliases_changed(self):
+        """ Invalidates lookup tables and schedules a redirect map rewrite,
+        as the alias subscribers do for ``Alias`` objects.
+        """
+        from .redirectmap import schedule_map_write
+        bump_generation(self, TABLE_GENERATION_ATTR)
+        schedule_map_write(self)
+
+    def get_alias(self, name, default=None):
+        """ Returns an ``AliasRecord`` for ``name`` or ``default``."""
+        entry = self.aliases.get(name)
+        if entry is None:
+            return default
+        return AliasRecord(name, self, *entry)
+
+    def num_aliases(self):
+        return self._num_aliases()
+
+    def __getitem__(self, name):
+        """ Returns the alias named ``name`` if there is one, otherwise the
+        child object. Aliases are checked first as they are the usual case.
+        """
+        record = self.get_alias(name)
+        if record is None:
+            return Folder.__getitem__(self, name)
+        return record
+
+    def get(self, name, default=None):
+        record = self.get_alias(name)
+        if record is None:
+            return Folder.get(self, name, default)
+        return record
@@ -0,0 +1,249 @@
+""" A process-local table of alias paths and their redirects.
+
+When the ``substanced_alias.lookup_table`` setting is true, ``includeme``
+registers ``alias_tween_factory``. The tween answers requests for paths it has
+already seen resolve to an ``Alias`` without running traversal, so a repeat
+redirect loads neither the ``Alias`` nor its target from the database.
+
+Entries are only valid for one table generation (see ``get_generation``).
+Adding, modifying, removing or moving aliases and moving resources bumps the
+generation stored on the root, and every worker drops its table the next time
+it sees the new value.
+
+With ``substanced_alias.miss_cache_size`` set, the tween also remembers paths
+answered with 404 Not Found in a ``MissTable`` for
+``substanced_alias.miss_cache_ttl`` seconds, so repeated probes of missing
+paths get a plain 404 without traversal. Only alias-style paths, a single
+segment below the root without a query string, for which neither traversal
+nor view lookup found anything, are remembered (see ``is_lookup_miss``); a
+404 raised by a view may depend on more than the path. Misses are dropped
+along with the table when aliases or pattern aliases change, so a path never
+stays a miss once an alias answers it; other content added at a cached path
+is found once its entry expires.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.interfaces import (
+    IRequest,
+    IRootFactory,
+    IView,
+    IViewClassifier,
+    )
+from pyramid.traversal import DefaultRootFactory
+from zope.interface import providedBy
+
+from . import (
+    IAlias,
+    PATTERN_GENERATION_ATTR,
+    REDIRECT_CLASSES,
+    TABLE_GENERATION_ATTR,
+    get_generation,
+    merge_query,
+    )
+from .counters import count_hit
+from .timing import timed
+
+# default maximum number of alias paths kept per process
+DEFAULT_SIZE = 1000
+
+# response headers replayed from the table along with the location
+CACHED_HEADERS = ('Cache-Control', 'ETag', 'Last-Modified')
+
+# default seconds a path answered with 404 Not Found is remembered
+DEFAULT_MISS_TTL = 60
+
+
+class AliasTable(object):
+    """ A bounded, thread-safe mapping of request path -> redirect entry
+    which evicts the least recently used path once ``size`` paths are stored.
+    An entry is a tuple of (host-relative location, status, headers, query
+    mode).
+    """
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.generation = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _sync(self, generation):
+        """ Drops every entry if ``generation`` differs from the generation
+        the entries were stored in. Must be called with the lock held.
+        """
+        if generation != self.generation:
+            self._data.clear()
+            self.generation = generation
+
+    def get(self, path, generation):
+        """ Returns the entry stored for ``path`` or None."""
+        with self._lock:
+            self._sync(generation)
+            entry = self._data.pop(path, None)
+            if entry is not None:
+                # reinsert to mark it as the most recently used
+                self._data[path] = entry
+            return entry
+
+    def set(self, path, generation, entry):
+        """ Stores ``entry`` for ``path``, evicting the least recently used
+        path if the table is full.
+        """
+        with self._lock:
+            self._sync(generation)
+            if self._data.pop(path, None) is None:
+                if len(self._data) >= self.size:
+                    self._data.popitem(last=False)
+            self._data[path] = entry
+
+    def discard(self, path):
+        with self._lock:
+            self._data.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._sync(None)
+
+
+class MissTable(AliasTable):
+    """ An ``AliasTable`` of paths answered with 404 Not Found, each kept
+    for ``ttl`` seconds. Its generation should cover everything that can make
+    a missing path an alias.
+    """
+
+    def __init__(self, size, ttl=DEFAULT_MISS_TTL, clock=time.time):
+        AliasTable.__init__(self, size)
+        self.ttl = ttl
+        self.clock = clock
+
+    def add(self, path, generation):
+        self.set(path, generation, self.clock() + self.ttl)
+
+    def is_miss(self, path, generation):
+        """ Returns True if ``path`` was missing less than ``ttl`` seconds
+        ago.
+        """
+        expires = self.get(path, generation)
+        if expires is None:
+            return False
+        if expires <= self.clock():
+            self.discard(path)
+            return False
+        return True
+
+
+def find_app_root(request):
+    """ Returns the application root without traversing, using the root
+    factory registered with Pyramid.
+    """
+    root_factory = request.registry.queryUtility(
+        IRootFactory, default=DefaultRootFactory)
+    return root_factory(request)
+
+def replay_redirect(request, entry):
+    """ Returns the redirect response for a table ``entry``, with the
+    incoming query string combined as the alias's query mode says. The
+    stored ``ETag`` only applies to the stored location.
+    """
+    location, status, headers, query_mode = entry
+    merged = merge_query(location, request.query_string, query_mode)
+    if merged != location:
+        headers = [header for header in headers if header[0] != 'ETag']
+    response = REDIRECT_CLASSES[status](
+        location=request.application_url + merged, headers=list(headers))
+    response.conditional_response = 'ETag' in response.headers
+    return response
+
+def is_lookup_miss(request, root):
+    """ Returns True if ``request`` was answered with 404 Not Found because
+    nothing answers its path: a single segment below ``root`` without a
+    query string, which traversal left as the view name of ``root`` and for
+    which no view is registered.
+    """
+    if request.query_string or getattr(request, 'subpath', None):
+        return False
+    if getattr(request, 'context', None) is not root:
+        return False
+    view_name = getattr(request, 'view_name', None)
+    if not view_name or request.path_info.strip('/') != view_name:
+        return False
+    request_iface = getattr(request, 'request_iface', IRequest)
+    view = request.registry.adapters.lookup(
+        (IViewClassifier, request_iface, providedBy(root)), IView,
+        name=view_name, default=None)
+    return view is None
+
+def alias_tween_factory(handler, registry):
+    """ Pyramid tween factory for the in-memory alias redirect fast path.
+    The table size is read from ``substanced_alias.lookup_table_size`` and
+    the size and time to live of the miss table from
+    ``substanced_alias.miss_cache_size`` (default 0, no miss table) and
+    ``substanced_alias.miss_cache_ttl``.
+    """
+    settings = registry.settings or {}
+    size = int(settings.get('substanced_alias.lookup_table_size',
+                            DEFAULT_SIZE))
+    table = AliasTable(size)
+    misses = None
+    miss_size = int(settings.get('substanced_alias.miss_cache_size', 0))
+    if miss_size > 0:
+        misses = MissTable(miss_size, float(settings.get(
+            'substanced_alias.miss_cache_ttl', DEFAULT_MISS_TTL)))
+
+    def alias_tween(request):
+        if (request.method not in ('GET', 'HEAD') or
+            'HTTP_X_VHM_ROOT' in request.environ):
+            return handler(request)
+
+        path = request.path_info
+        with timed('lookup_table', request.registry):
+            root = find_app_root(request)
+            generation = get_generation(root, TABLE_GENERATION_ATTR)
+            entry = table.get(path, generation)
+            if entry is not None:
+                count_hit(request, root)
+                return replay_redirect(request, entry)
+            if misses is not None:
+                miss_generation = (generation, get_generation(
+                    root, PATTERN_GENERATION_ATTR))
+                if misses.is_miss(path, miss_generation):
+                    return HTTPNotFound()
+
+        try:
+            response = handler(request)
+        except HTTPNotFound:
+            if misses is not None and is_lookup_miss(request, root):
+                misses.add(path, miss_generation)
+            raise
+        if (misses is not None and response.status_int == 404 and
+            is_lookup_miss(request, root)):
+            misses.add(path, miss_generation)
+
+        # remember paths that were served by the default alias view; the
+        # location is taken from the response as it may be the end of a
+        # chain of aliases, unless it includes the incoming query string
+        context = getattr(request, 'context', None)
+        query_mode = getattr(context, 'query_mode', None)
+        if (IAlias.providedBy(context) and not request.view_name and
+            not request.subpath and response.status_int in REDIRECT_CLASSES
+            and not (query_mode and request.query_string)):
+            application_url = request.application_url
+            location = response.location[len(application_url):]
+            if (response.location.startswith(application_url) and
+                location.startswith('/')):
+                headers = tuple((name, response.headers[name])
+                                for name in CACHED_HEADERS
+                                if name in response.headers)
+                table.set(path, generation,
+                          (location, response.status_int, headers,
+                           query_mode))
+        return response
+
+    alias_tween.table = table
+    alias_tween.misses = misses
+    return alias_tween
@@ -0,0 +1,188 @@
+""" A memory-mapped file of alias redirects shared by all workers of a host.
+
+When the ``substanced_alias.lookup_file`` setting names a file, the file is
+rewritten after every transaction changing aliases (see
+``substanced_alias.redirectmap``, which provides the rows) and
+``includeme`` registers ``lookup_file_tween_factory``. Each worker maps the
+file read-only, so the operating system keeps a single copy of it in memory,
+and answers alias requests found in it without touching the database.
+
+The file holds the records sorted by path, preceded by a table of their
+offsets for binary search::
+
+  header  : magic (8 bytes), record count (uint32)
+  offsets : one uint32 per record
+  record  : status (uint16, 0 for the site default), query mode (uint8,
+            0 to ignore the query, else 1 + its index in ``QUERY_MODES``),
+            max-age (int32, -1 for the site default), path length (uint32),
+            location length (uint32), UTF-8 path, UTF-8 host-relative
+            location
+
+All integers are little-endian. Files are written to a temporary name and
+renamed into place, and readers reopen the file when it has been replaced.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from . import (
+    QUERY_MODES,
+    make_redirect,
+    merge_query,
+    )
+from .counters import (
+    IAliasHitCounter,
+    count_hit,
+    )
+from .lookup import find_app_root
+from .timing import timed
+
+MAGIC = b'SDALIAS1'
+HEADER = struct.Struct('<8sI')
+OFFSET = struct.Struct('<I')
+RECORD = struct.Struct('<HBiII')
+
+# query modes by their code in a record
+MODE_CODES = (None,) + QUERY_MODES
+
+# seconds between checks for a replaced lookup file
+CHECK_INTERVAL = 1.0
+
+
+def write_lookup_file(rows, filename):
+    """ Writes ``rows`` of (path, location, status, max_age, query_mode) to
+    ``filename``, atomically replacing it. ``status``, ``max_age`` and
+    ``query_mode`` may be None for the site defaults. Paths are stored
+    without a trailing slash.
+    """
+    records = []
+    for path, location, status, max_age, query_mode in rows:
+        path = (path.rstrip('/') or '/').encode('utf-8')
+        location = location.encode('utf-8')
+        records.append((path, RECORD.pack(
+            status or 0, MODE_CODES.index(query_mode),
+            -1 if max_age is None else max_age,
+            len(path), len(location)) + path + location))
+    records.sort(key=lambda record: record[0])
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(dir=directory, prefix='.aliaslookup-')
+    try:
+        with os.fdopen(fd, 'wb') as stream:
+            stream.write(HEADER.pack(MAGIC, len(records)))
+            offset = HEADER.size + OFFSET.size * len(records)
+            for path, record in records:
+                stream.write(OFFSET.pack(offset))
+                offset += len(record)
+            for path, record in records:
+                stream.write(record)
+        os.chmod(tmpname, 0o644)
+        os.rename(tmpname, filename)
+    except Exception:
+        os.unlink(tmpname)
+        raise
+
+
+class LookupFile(object):
+    """ Read-only access to a lookup file written by ``write_lookup_file``.
+    The file is checked for replacement at most every ``check_interval``
+    seconds; a missing file has no entries.
+    """
+
+    def __init__(self, filename, check_interval=CHECK_INTERVAL):
+        self.filename = filename
+        self.check_interval = check_interval
+        self._checked = 0
+        self._lock = threading.Lock()
+        # (file identity, mmap, record count), swapped as a whole
+        self._current = (None, None, 0)
+
+    def _identity(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime, stat.st_size)
+
+    def _refresh(self):
+        """ Maps the file again if it has been replaced. An old map is not
+        closed, as other threads may still be reading it; it is released
+        once they are done with it.
+        """
+        now = time.time()
+        if now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            self._checked = now
+            identity = self._identity()
+            if identity == self._current[0]:
+                return
+            if identity is None:
+                self._current = (None, None, 0)
+                return
+            with open(self.filename, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, count = HEADER.unpack_from(data, 0)
+            if magic != MAGIC:
+                raise ValueError('Not an alias lookup file: %s'
+                                 % self.filename)
+            self._current = (identity, data, count)
+
+    def get(self, path):
+        """ Returns (location, status, max_age, query_mode) for ``path``, or
+        None. ``status``, ``max_age`` and ``query_mode`` are None for the
+        site defaults.
+        """
+        self._refresh()
+        identity, data, count = self._current
+        if data is None:
+            return None
+        key = (path.rstrip('/') or '/').encode('utf-8')
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = OFFSET.unpack_from(
+                data, HEADER.size + OFFSET.size * mid)[0]
+            status, mode, max_age, key_len, value_len = RECORD.unpack_from(
+                data, offset)
+            start = offset + RECORD.size
+            candidate = data[start:start + key_len]
+            if candidate < key:
+                lo = mid + 1
+            elif candidate > key:
+                hi = mid
+            else:
+                start += key_len
+                location = data[start:start + value_len].decode('utf-8')
+                return (location, status or None,
+                        None if max_age < 0 else max_age, MODE_CODES[mode])
+        return None
+
+
+def lookup_file_tween_factory(handler, registry):
+    """ Pyramid tween factory answering alias requests from the file named
+    by the ``substanced_alias.lookup_file`` setting.
+    """
+    settings = registry.settings or {}
+    lookup = LookupFile(settings['substanced_alias.lookup_file'])
+
+    def lookup_file_tween(request):
+        if (request.method not in ('GET', 'HEAD') or
+            'HTTP_X_VHM_ROOT' in request.environ):
+            return handler(request)
+        with timed('lookup_file', registry):
+            entry = lookup.get(request.path_info)
+        if entry is None:
+            return handler(request)
+        if registry.queryUtility(IAliasHitCounter) is not None:
+            count_hit(request, find_app_root(request))
+        location, status, max_age, query_mode = entry
+        location = merge_query(location, request.query_string, query_mode)
+        return make_redirect(request, request.application_url + location,
+                             status, max_age)
+
+    lookup_file_tween.lookup = lookup
+    return lookup_file_tween
@@ -0,0 +1,312 @@
+""" Maintenance operations over all the aliases of a site.
+
+These run outside of requests, e.g. from the console scripts in
+``substanced_alias.scripts``. They modify aliases in the current transaction
+and leave committing to the caller, except for ``retarget_aliases`` which
+commits in chunks unless told otherwise.
+"""
+import logging
+
+import transaction
+
+from pyramid.traversal import resource_path
+from ZODB.POSException import ConflictError
+from substanced.util import find_objectmap
+
+from . import (
+    AliasCycleError,
+    AliasToTarget,
+    IAlias,
+    MAX_CHAIN_DEPTH,
+    TABLE_GENERATION_ATTR,
+    bump_generation,
+    has_target,
+    iter_aliases,
+    iter_content,
+    query_strings,
+    resolve_chain,
+    )
+from .catalog import reindex_alias
+from .folder import IAliasFolder
+from .redirectmap import (
+    index_alias,
+    schedule_map_write,
+    )
+
+logger = logging.getLogger(__name__)
+
+def flatten_aliases(root, max_depth=MAX_CHAIN_DEPTH, savepoint_size=1000,
+                    txn=transaction):
+    """ Rewrites every alias below ``root`` which targets another alias so
+    it points straight at the final target of its chain, with the query and
+    anchor of the last alias in the chain. This covers ``Alias`` objects and
+    the entries of ``AliasFolder`` objects. Chains longer than ``max_depth``
+    are shortened by ``max_depth`` hops; run it again to finish them.
+    Chains ending in a dangling alias are left alone, as they answer 404 Not
+    Found and the target they would be pointed at is gone.
+
+    Returns a tuple of (number of aliases flattened, list of the paths of
+    aliases in cycles, which are left alone).
+    """
+    flattened = 0
+    cycles = []
+    for alias in iter_aliases(root):
+        if not IAlias.providedBy(alias.resource):
+            continue
+        try:
+            last = resolve_chain(alias, max_depth)
+        except AliasCycleError:
+            cycles.append(resource_path(alias))
+            continue
+        if getattr(last, 'dangling', False):
+            continue
+        alias._query = last._query
+        alias.anchor = last.anchor
+        alias.retarget(last.resource)
+        index_alias(alias)
+        reindex_alias(alias)
+        flattened += 1
+        if flattened % savepoint_size == 0:
+            txn.savepoint(optimistic=True)
+            logger.info('substanced_alias: flattened %s aliases' % flattened)
+    for folder in iter_content(root, IAliasFolder):
+        count, folder_cycles = flatten_alias_folder(folder, max_depth)
+        flattened += count
+        cycles.extend(folder_cycles)
+    if flattened:
+        bump_generation(root, TABLE_GENERATION_ATTR)
+        schedule_map_write(root)
+    return flattened, cycles
+
+def flatten_alias_folder(folder, max_depth=MAX_CHAIN_DEPTH):
+    """ Flattens the entries of the ``AliasFolder`` ``folder``, as described
+    for ``flatten_aliases``. Only entries whose target is the source of an
+    ``AliasToTarget`` reference, i.e. is an ``Alias``, are loaded.
+    """
+    objectmap = find_objectmap(folder)
+    updates = []
+    cycles = []
+    for name, entry in folder.aliases.items():
+        if not objectmap.targetids(entry[0], AliasToTarget):
+            continue
+        try:
+            last = resolve_chain(folder.get_alias(name), max_depth)
+        except AliasCycleError:
+            cycles.append(resource_path(folder, name))
+            continue
+        if getattr(last, 'dangling', False):
+            continue
+        updates.append((name, last))
+    for name, last in updates:
+        folder.retarget_alias(name, last.resource, last.query, last.anchor)
+    return len(updates), cycles
+
+# what ``clean_dangling_aliases`` does with the aliases it finds
+DANGLING_ACTIONS = ('report', 'disable', 'remove')
+
+def clean_dangling_aliases(root, action='report', batch_size=1000,
+                           txn=transaction):
+    """ Finds the aliases below ``root`` whose target no longer exists (see
+    ``has_target``) and, depending on ``action``, only reports them, marks
+    them as dangling so they answer 404 Not Found, or removes them.
+    Aliases are loaded ``batch_size`` at a time (see ``iter_aliases``) and a
+    savepoint is made after each ``batch_size`` changes, so memory use stays
+    bounded. ``AliasFolder`` entries with a removed target already answer
+    404 Not Found; they are removed by the 'remove' action and otherwise
+    only reported.
+
+    Returns the list of the paths of the dangling aliases.
+    """
+    if action not in DANGLING_ACTIONS:
+        raise ValueError('Unknown action: %s' % action)
+    paths = []
+    removals = []
+    for alias in iter_aliases(root, batch_size):
+        if has_target(alias):
+            continue
+        paths.append(resource_path(alias))
+        if action == 'disable' and not alias.dangling:
+            alias.dangling = True
+            reindex_alias(alias)
+            if len(paths) % batch_size == 0:
+                txn.savepoint(optimistic=True)
+        elif action == 'remove':
+            removals.append((alias.__parent__, alias.__name__))
+    for count, (parent, name) in enumerate(removals, 1):
+        parent.remove(name)
+        if count % batch_size == 0:
+            txn.savepoint(optimistic=True)
+            logger.info('substanced_alias: removed %s aliases' % count)
+    objectmap = find_objectmap(root)
+    folders = ()
+    if objectmap is not None:
+        folders = iter_content(root, IAliasFolder, batch_size)
+    for folder in folders:
+        names = [name for name, entry in folder.aliases.items()
+                 if objectmap.path_for(entry[0]) is None]
+        for name in names:
+            paths.append(resource_path(folder, name))
+            if action == 'remove':
+                folder.remove_alias(name)
+    if paths and action == 'disable':
+        bump_generation(root, TABLE_GENERATION_ATTR)
+        schedule_map_write(root)
+    return paths
+
+def path_tuple(path):
+    """ Returns the objectmap path tuple of the absolute ``path``, e.g.
+    ('', 'blog', 'category') for '/blog/category/'.
+    """
+    if not path.startswith('/'):
+        raise ValueError('Not an absolute path: %s' % path)
+    return ('',) + tuple(segment for segment in path.split('/') if segment)
+
+def find_prefix_alias_oids(objectmap, prefix):
+    """ Returns the sorted list of the oids of the aliases pointing at the
+    object at the path tuple ``prefix`` or at any object below it. They are
+    found through the objectmap's path index and ``AliasToTarget``
+    references, so nothing is loaded.
+    """
+    oids = set()
+    for oid in objectmap.pathlookup(prefix):
+        oids.update(objectmap.sourceids(oid, AliasToTarget))
+    return sorted(oids)
+
+def retarget_aliases(root, old_prefix, new_prefix, commit_size=1000,
+                     retries=3, progress=None, txn=transaction):
+    """ Points the aliases below ``root`` whose target is at or below the
+    path ``old_prefix`` at the object at the same path below ``new_prefix``
+    instead, e.g. an alias of /old/a/b at /new/a/b. This covers ``Alias``
+    objects and the entries of ``AliasFolder`` objects. Aliases whose new
+    target does not exist are left alone.
+
+    Aliases are found with ``find_prefix_alias_oids``, and the entries of
+    each ``AliasFolder`` with its ``alias_names_for``, and rewritten
+    ``commit_size`` at a time. Each chunk is committed and the object cache
+    minimized, so memory use stays bounded however many aliases there are;
+    a chunk failing to commit with a ``ConflictError`` is retried up to
+    ``retries`` times. A ``commit_size`` of None makes a savepoint after
+    every 1000 aliases and leaves committing to the caller. ``progress`` is
+    called with (aliases done, total) after each chunk.
+
+    Returns a tuple of (number of aliases retargeted, list of (alias path,
+    missing target path) tuples).
+    """
+    old = path_tuple(old_prefix)
+    new = path_tuple(new_prefix)
+    objectmap = find_objectmap(root)
+    jar = getattr(root, '_p_jar', None)
+    oids = find_prefix_alias_oids(objectmap, old)
+    total = len(oids)
+    retargeted = 0
+    missing = []
+    chunk_size = commit_size or 1000
+    for start in range(0, total, chunk_size):
+        chunk = oids[start:start + chunk_size]
+        count, chunk_missing = _commit_chunk(
+            txn, commit_size, retries, _retarget_chunk, root, objectmap,
+            chunk, old, new)
+        retargeted += count
+        missing.extend(chunk_missing)
+        if commit_size and jar is not None:
+            jar.cacheMinimize()
+        done = start + len(chunk)
+        logger.info('substanced_alias: retargeted %s of %s aliases' % (
+            done, total))
+        if progress is not None:
+            progress(done, total)
+    target_oids = objectmap.pathlookup(old)
+    for folder in iter_content(root, IAliasFolder):
+        names = folder.alias_names_for(target_oids)
+        for start in range(0, len(names), chunk_size):
+            count, chunk_missing = _commit_chunk(
+                txn, commit_size, retries, _retarget_folder_entries, folder,
+                objectmap, names[start:start + chunk_size], old, new)
+            retargeted += count
+            missing.extend(chunk_missing)
+        if names:
+            logger.info('substanced_alias: retargeted the entries of %s' %
+                        resource_path(folder))
+    if commit_size:
+        txn.commit()
+    return retargeted, missing
+
+def _commit_chunk(txn, commit_size, retries, func, *args):
+    """ Calls ``func`` with ``args`` and commits, or makes a savepoint if
+    ``commit_size`` is None, and returns its result. A commit failing with a
+    ``ConflictError`` is aborted and the call retried up to ``retries``
+    times.
+    """
+    for attempt in range(retries):
+        try:
+            result = func(*args)
+            if commit_size:
+                txn.commit()
+            else:
+                txn.savepoint(optimistic=True)
+            return result
+        except ConflictError:
+            if not commit_size or attempt == retries - 1:
+                raise
+            txn.abort()
+            logger.info('substanced_alias: conflict retargeting aliases, '
+                        'retrying')
+
+def _new_target(objectmap, oid, old, new):
+    """ Returns a tuple of (path tuple below ``new`` corresponding to the
+    path of the object with ``oid`` below ``old``, oid at that path or None).
+    Returns None if the object is no longer below ``old``.
+    """
+    path = objectmap.path_for(oid)
+    if path is None or path[:len(old)] != old:
+        return None
+    new_path = new + path[len(old):]
+    return new_path, objectmap.objectid_for(new_path)
+
+def _retarget_chunk(root, objectmap, oids, old, new):
+    count = 0
+    missing = []
+    for oid in oids:
+        alias = objectmap.object_for(oid)
+        if alias is None:
+            continue
+        for target_oid in objectmap.targetids(alias, AliasToTarget):
+            found = _new_target(objectmap, target_oid, old, new)
+            if found is None:
+                continue
+            new_path, new_oid = found
+            if new_oid is None:
+                missing.append((resource_path(alias), '/'.join(new_path)))
+                continue
+            alias.retarget(objectmap.object_for(new_oid))
+            index_alias(alias)
+            reindex_alias(alias)
+            count += 1
+    if count:
+        bump_generation(root, TABLE_GENERATION_ATTR)
+        schedule_map_write(root)
+    return count, missing
+
+def _retarget_folder_entries(folder, objectmap, names, old, new):
+    """ Retargets the entries of ``folder`` named ``names``, as described
+    for ``retarget_aliases``.
+    """
+    updates = []
+    missing = []
+    for name in names:
+        entry = folder.aliases.get(name)
+        if entry is None:
+            continue
+        oid, query, anchor = entry
+        found = _new_target(objectmap, oid, old, new)
+        if found is None:
+            continue
+        new_path, new_oid = found
+        if new_oid is None:
+            missing.append((resource_path(folder, name), '/'.join(new_path)))
+            continue
+        updates.append((name, new_oid, query, anchor))
+    for name, new_oid, query, anchor in updates:
+        folder.retarget_alias(name, objectmap.object_for(new_oid),
+                              query_strings(query), anchor)
+    return len(updates), missing
@@ -0,0 +1,282 @@
+""" Pattern aliases redirecting whole families of paths.
+
+A pattern alias maps a path pattern to a target template, e.g.::
+
+  /p/{id}        ->  /products/{id}
+  /old/*         ->  /new/*
+
+A ``{name}`` placeholder matches exactly one path segment and a trailing
+``*`` matches the rest of the path, including nothing. The target may use the
+placeholders of its pattern and, if the pattern ends with ``*``, ``*`` for
+the rest of the path; their values are quoted as path segments.
+
+Patterns are stored on the root in an OOBTree of pattern -> (target, status,
+query mode), so a family of legacy URLs needs no persistent object per URL.
+Each process compiles them into a trie of path segments (``PatternMatcher``),
+so a lookup walks one node per segment however many patterns there are. The
+trie is rebuilt when the pattern generation counter on the root, bumped by
+``add_pattern`` and ``remove_pattern``, changes.
+
+When the ``substanced_alias.patterns`` setting is true, ``includeme``
+registers ``pattern_tween_factory``. The tween only consults the patterns
+for GET and HEAD requests which would otherwise be answered with 404 Not
+Found, so existing resources and aliases always win.
+"""
+import re
+import threading
+
+from BTrees.OOBTree import OOBTree
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.traversal import quote_path_segment
+
+from . import (
+    PATTERN_GENERATION_ATTR,
+    QUERY_MODES,
+    REDIRECT_CLASSES,
+    bump_generation,
+    get_generation,
+    make_redirect,
+    merge_query,
+    )
+from .lookup import find_app_root
+
+# name of the root attribute holding the patterns
+PATTERNS_ATTR = '__alias_patterns__'
+
+PLACEHOLDER = re.compile(r'\{([A-Za-z_][A-Za-z0-9_]*)\}')
+
+# the trie key of a placeholder segment
+_PARAM = object()
+
+
+class PatternError(ValueError):
+    """ Raised for a malformed pattern or target."""
+
+
+def parse_pattern(pattern):
+    """ Returns the segments of ``pattern`` as a tuple of strings, with the
+    names of placeholder segments as ``(name,)`` tuples and a trailing
+    wildcard as '*'. Raises ``PatternError`` if ``pattern`` is malformed.
+    """
+    if not pattern.startswith('/'):
+        raise PatternError('A pattern must start with /')
+    segments = [segment for segment in pattern.split('/') if segment]
+    result = []
+    names = set()
+    for position, segment in enumerate(segments, 1):
+        match = PLACEHOLDER.match(segment)
+        if match is not None and match.end() == len(segment):
+            name = match.group(1)
+            if name in names:
+                raise PatternError('Placeholder {%s} is used twice' % name)
+            names.add(name)
+            result.append((name,))
+        elif segment == '*':
+            if position != len(segments):
+                raise PatternError('* may only be the last segment')
+            result.append('*')
+        elif '{' in segment or '}' in segment or '*' in segment:
+            raise PatternError('Placeholders and * must be whole segments: '
+                               '%s' % segment)
+        else:
+            result.append(segment)
+    return tuple(result)
+
+def check_target(segments, target):
+    """ Raises ``PatternError`` if ``target`` uses placeholders or a
+    wildcard that the parsed pattern ``segments`` does not have.
+    """
+    if not target.startswith('/'):
+        raise PatternError('A target must start with /')
+    names = set(segment[0] for segment in segments
+                if isinstance(segment, tuple))
+    for name in PLACEHOLDER.findall(target):
+        if name not in names:
+            raise PatternError('Unknown placeholder {%s}' % name)
+    if '*' in target and segments[-1:] != ('*',):
+        raise PatternError('* needs a pattern ending with *')
+
+
+class _Node(object):
+    __slots__ = ('children', 'entry', 'rest')
+
+    def __init__(self):
+        self.children = {}
+        # (placeholder names, target, status, query_mode) of the pattern
+        # ending here, and of the pattern ending here with a wildcard
+        self.entry = None
+        self.rest = None
+
+
+class PatternMatcher(object):
+    """ A trie of the path segments of ``patterns``, an iterable of
+    (pattern, (target, status, query_mode)) tuples. Literal segments take
+    precedence over placeholders, and placeholders over wildcards.
+    """
+
+    def __init__(self, patterns=()):
+        self.root = _Node()
+        self.size = 0
+        for pattern, value in patterns:
+            self.add(pattern, *value)
+
+    def add(self, pattern, target, status=None, query_mode=None):
+        segments = parse_pattern(pattern)
+        check_target(segments, target)
+        node = self.root
+        names = []
+        wildcard = segments[-1:] == ('*',)
+        if wildcard:
+            segments = segments[:-1]
+        for segment in segments:
+            if isinstance(segment, tuple):
+                names.append(segment[0])
+                segment = _PARAM
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = _Node()
+            node = child
+        entry = (tuple(names), target, status, query_mode)
+        if wildcard:
+            node.rest = entry
+        else:
+            node.entry = entry
+        self.size += 1
+
+    def match(self, path):
+        """ Returns a tuple of (host-relative location, status, query mode)
+        for the first pattern matching ``path``, or None.
+        """
+        segments = [segment for segment in path.split('/') if segment]
+        found = _match(self.root, segments, 0, ())
+        if found is None:
+            return None
+        (names, target, status, query_mode), values, rest = found
+        location = target
+        for name, value in zip(names, values):
+            location = location.replace('{%s}' % name,
+                                        quote_path_segment(value))
+        if rest is not None:
+            location = location.replace('*', '/'.join(
+                quote_path_segment(segment) for segment in rest))
+        return location, status, query_mode
+
+def _match(node, segments, position, values):
+    """ Returns a tuple of (entry, placeholder values, rest of the path or
+    None) for the pattern below ``node`` matching ``segments`` from
+    ``position`` on, or None.
+    """
+    if position == len(segments):
+        if node.entry is not None:
+            return node.entry, values, None
+    else:
+        segment = segments[position]
+        child = node.children.get(segment)
+        if child is not None:
+            found = _match(child, segments, position + 1, values)
+            if found is not None:
+                return found
+        child = node.children.get(_PARAM)
+        if child is not None:
+            found = _match(child, segments, position + 1,
+                           values + (segment,))
+            if found is not None:
+                return found
+    if node.rest is not None:
+        return node.rest, values, segments[position:]
+    return None
+
+
+def get_patterns(root):
+    """ Returns the pattern BTree of ``root`` or None if it has none."""
+    return getattr(root, PATTERNS_ATTR, None)
+
+def add_pattern(root, pattern, target, status=None, query_mode=None):
+    """ Adds the pattern alias ``pattern`` -> ``target`` to ``root``, or
+    replaces the one with the same pattern. ``status`` is one of the keys of
+    ``REDIRECT_CLASSES`` or None for the site default and ``query_mode`` one
+    of ``QUERY_MODES`` or None. Raises ``PatternError`` if the pattern or
+    target is malformed.
+    """
+    check_target(parse_pattern(pattern), target)
+    if status is not None and status not in REDIRECT_CLASSES:
+        raise PatternError('Unknown redirect status %s' % status)
+    if query_mode is not None and query_mode not in QUERY_MODES:
+        raise PatternError('Unknown query mode %s' % query_mode)
+    patterns = get_patterns(root)
+    if patterns is None:
+        patterns = OOBTree()
+        setattr(root, PATTERNS_ATTR, patterns)
+    patterns[pattern] = (target, status, query_mode)
+    bump_generation(root, PATTERN_GENERATION_ATTR)
+
+def remove_pattern(root, pattern):
+    """ Removes the pattern alias ``pattern`` from ``root``, raising
+    ``KeyError`` if there is none.
+    """
+    patterns = get_patterns(root)
+    if patterns is None:
+        raise KeyError(pattern)
+    del patterns[pattern]
+    bump_generation(root, PATTERN_GENERATION_ATTR)
+
+
+class PatternCache(object):
+    """ Holds the ``PatternMatcher`` of a process, recompiled when the
+    pattern generation on the root changes.
+    """
+
+    def __init__(self):
+        self.generation = None
+        self.matcher = PatternMatcher()
+        self._lock = threading.Lock()
+
+    def get(self, root):
+        generation = get_generation(root, PATTERN_GENERATION_ATTR)
+        if generation != self.generation:
+            with self._lock:
+                if generation != self.generation:
+                    self.matcher = PatternMatcher(
+                        (get_patterns(root) or {}).items())
+                    self.generation = generation
+        return self.matcher
+
+
+def pattern_redirect(request, cache):
+    """ Returns a redirect response for the pattern alias matching the path
+    of ``request``, or None.
+    """
+    if (request.method not in ('GET', 'HEAD') or
+        'HTTP_X_VHM_ROOT' in request.environ):
+        return None
+    matcher = cache.get(find_app_root(request))
+    if not matcher.size:
+        return None
+    found = matcher.match(request.path_info)
+    if found is None:
+        return None
+    location, status, query_mode = found
+    location = merge_query(location, request.query_string, query_mode)
+    return make_redirect(request, request.application_url + location, status)
+
+def pattern_tween_factory(handler, registry):
+    """ Pyramid tween factory redirecting requests which would otherwise be
+    answered with 404 Not Found according to the site's pattern aliases.
+    """
+    cache = PatternCache()
+
+    def pattern_tween(request):
+        try:
+            response = handler(request)
+        except HTTPNotFound:
+            redirect = pattern_redirect(request, cache)
+            if redirect is None:
+                raise
+            return redirect
+        if response.status_int == 404:
+            redirect = pattern_redirect(request, cache)
+            if redirect is not None:
+                return redirect
+        return response
+
+    return pattern_tween
@@ -0,0 +1,327 @@
+""" Redirect maps that let a front-end server answer alias requests itself.
+
+A redirect map lists each alias path with the URL it redirects to, in the
+format read by nginx (``map``), Apache (``RewriteMap`` txt) or HAProxy
+(``map``). Writing one would mean loading every alias and target, so the
+aliases are also kept in a redirect index on the root: a BTree of
+alias oid -> (target oid, query pairs, anchor, status, max-age, query mode),
+the entries an ``AliasFolder`` uses plus the redirect policy. Paths of both
+are looked up in the objectmap, so the index stays correct when aliases or
+their targets move, and writing the map loads neither. The same rows feed
+the lookup file of ``substanced_alias.lookupfile``.
+
+The index is created by ``build_index`` (the ``sd_alias_redirect_map``
+script and the ``write_redirect_map`` management view call it when it is
+missing) and kept up to date by the alias subscribers from then on. When the
+``substanced_alias.redirect_map`` or ``substanced_alias.lookup_file``
+setting names a file, transactions changing aliases have it rewritten by a
+``MapWriter`` on a background thread, in its own connection,
+``substanced_alias.redirect_map_delay`` seconds (default 5) after the first
+of them commits; commits made meanwhile are covered by the same rewrite.
+"""
+import logging
+import os
+import tempfile
+import threading
+
+import transaction
+
+from BTrees.LOBTree import LOBTree
+from pyramid.threadlocal import get_current_registry
+from pyramid.traversal import find_root
+from substanced.util import (
+    find_objectmap,
+    get_oid,
+    )
+from zope.interface import Interface
+
+from . import (
+    MAX_CHAIN_DEPTH,
+    iter_aliases,
+    iter_content,
+    location_for_oid,
+    )
+from .folder import IAliasFolder
+from .lookupfile import write_lookup_file
+
+logger = logging.getLogger(__name__)
+
+# name of the root attribute holding the redirect index
+INDEX_ATTR = '__alias_redirect_index__'
+
+# default seconds a ``MapWriter`` waits for further commits before writing
+DEFAULT_WRITE_DELAY = 5
+
+class IAliasMapWriter(Interface):
+    """ Marker interface for the ``MapWriter`` utility."""
+
+
+def write_nginx(rows, stream):
+    """ Writes ``rows`` as the body of an nginx ``map`` block, to be
+    included with e.g. ``map $uri $alias_location { include ...; }``.
+    nginx expands variables in map values, so '$' in locations is written
+    percent-encoded.
+    """
+    stream.write('# alias redirects generated by substanced_alias\n')
+    for path, location in rows:
+        location = location.replace('$', '%24')
+        stream.write('"%s" "%s";\n' % (_nginx_quote(path),
+                                      _nginx_quote(location)))
+
+def _nginx_quote(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+def write_text_map(rows, stream):
+    """ Writes ``rows`` as "path location" lines, the format of Apache
+    ``RewriteMap`` txt files (convert it with ``httxt2dbm`` for a dbm map)
+    and HAProxy map files. Paths containing whitespace cannot be expressed
+    and are skipped.
+    """
+    stream.write('# alias redirects generated by substanced_alias\n')
+    for path, location in rows:
+        if len(path.split()) != 1:
+            logger.warning('Skipping alias path with whitespace: %r', path)
+            continue
+        stream.write('%s %s\n' % (path, location))
+
+FORMATS = {
+    'nginx': write_nginx,
+    'apache': write_text_map,
+    'haproxy': write_text_map,
+    }
+
+
+def get_index(root):
+    """ Returns the redirect index of ``root`` or None if it was never
+    built.
+    """
+    return getattr(root, INDEX_ATTR, None)
+
+def index_entry(alias):
+    """ Returns the redirect index entry for the ``Alias`` ``alias``."""
+    return (get_oid(alias.resource), alias._query, alias.anchor, alias.status,
+            alias.max_age, alias.query_mode)
+
+def build_index(root):
+    """ (Re)builds the redirect index of ``root`` from all its aliases and
+    returns it.
+    """
+    index = LOBTree()
+    for alias in iter_aliases(root):
+        index[get_oid(alias)] = index_entry(alias)
+    setattr(root, INDEX_ATTR, index)
+    return index
+
+def index_alias(alias):
+    """ Adds or updates ``alias`` in the redirect index, if there is one."""
+    index = get_index(find_root(alias))
+    if index is not None:
+        index[get_oid(alias)] = index_entry(alias)
+
+def unindex_alias(alias, context):
+    """ Removes ``alias`` from the redirect index, if there is one.
+    ``context`` is an object in the tree ``alias`` was removed from.
+    """
+    index = get_index(find_root(context))
+    if index is not None:
+        index.pop(get_oid(alias), None)
+
+
+def resolve_entry(index, entry, max_depth=MAX_CHAIN_DEPTH):
+    """ Follows ``entry`` through the index while its target is another
+    indexed alias and returns the entry of the last alias, or None for a
+    cycle.
+    """
+    seen = set()
+    for depth in range(max_depth):
+        oid = entry[0]
+        target = index.get(oid)
+        if target is None:
+            break
+        if oid in seen:
+            return None
+        seen.add(oid)
+        entry = target
+    return entry
+
+def iter_redirects(root, max_depth=MAX_CHAIN_DEPTH):
+    """ Yields a (path, location, status, max_age, query_mode) tuple for
+    every alias below ``root`` with an existing target: ``Alias`` objects
+    from the redirect index (which must have been built) and ``AliasFolder``
+    entries. Paths are unquoted, as servers match them against the decoded
+    request path; locations are host-relative and lead straight to the end
+    of alias chains. ``status``, ``max_age`` and ``query_mode`` are those of
+    the alias itself, None for the site defaults.
+    """
+    objectmap = find_objectmap(root)
+    index = get_index(root)
+    for path, entry in _iter_entries(root, objectmap, index):
+        policy = (tuple(entry[3:6]) + (None, None, None))[:3]
+        entry = resolve_entry(index, entry, max_depth)
+        if entry is None:
+            logger.warning('Skipping alias in a cycle: %s', '/'.join(path))
+            continue
+        location = location_for_oid(objectmap, *entry[:3])
+        if location is not None:
+            yield ('/'.join(path) or '/', location) + policy
+
+def _iter_entries(root, objectmap, index):
+    """ Yields (path tuple, entry) for the indexed aliases and the entries
+    of every ``AliasFolder``.
+    """
+    for oid, entry in index.items():
+        path = objectmap.path_for(oid)
+        if path is not None:
+            yield path, entry
+    for folder in iter_content(root, IAliasFolder):
+        folder_path = objectmap.path_for(get_oid(folder))
+        if folder_path is None:
+            continue
+        for name, entry in folder.aliases.items():
+            yield folder_path + (name,), entry
+
+def write_map(root, stream, fmt='nginx', base_url=''):
+    """ Writes the redirect map of ``root`` to ``stream`` in the format
+    ``fmt`` (a key of ``FORMATS``). ``base_url`` is prepended to each
+    location, e.g. 'https://example.com'. Builds the redirect index first if
+    it does not exist.
+    """
+    if get_index(root) is None:
+        build_index(root)
+    rows = ((row[0], base_url + row[1]) for row in iter_redirects(root))
+    FORMATS[fmt](rows, stream)
+
+def write_map_file(root, filename, fmt='nginx', base_url=''):
+    """ Writes the redirect map to ``filename``, atomically replacing it so a
+    server reloading it never sees a partial file.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(dir=directory, prefix='.aliasmap-')
+    try:
+        with os.fdopen(fd, 'w') as stream:
+            write_map(root, stream, fmt, base_url)
+        os.chmod(tmpname, 0o644)
+        os.rename(tmpname, filename)
+    except Exception:
+        os.unlink(tmpname)
+        raise
+
+
+def get_map_settings(registry):
+    """ Returns (filename, format, base url) from the
+    ``substanced_alias.redirect_map``, ``substanced_alias.redirect_map_format``
+    (default nginx) and ``substanced_alias.redirect_map_base_url`` settings.
+    ``filename`` is None if no map file is configured.
+    """
+    settings = registry.settings or {}
+    return (settings.get('substanced_alias.redirect_map') or None,
+            settings.get('substanced_alias.redirect_map_format', 'nginx'),
+            settings.get('substanced_alias.redirect_map_base_url', ''))
+
+def get_lookup_file_setting(registry):
+    """ Returns the ``substanced_alias.lookup_file`` setting or None."""
+    settings = registry.settings or {}
+    return settings.get('substanced_alias.lookup_file') or None
+
+def write_lookup(root, filename):
+    """ Writes the lookup file of ``root`` to ``filename``, building the
+    redirect index first if it does not exist.
+    """
+    if get_index(root) is None:
+        build_index(root)
+    write_lookup_file(iter_redirects(root), filename)
+
+def write_files(root, registry):
+    """ Writes the redirect map and lookup files configured in
+    ``registry`` from ``root``, whose redirect index must exist.
+    """
+    filename, fmt, base_url = get_map_settings(registry)
+    lookup_filename = get_lookup_file_setting(registry)
+    if filename is not None:
+        write_map_file(root, filename, fmt, base_url)
+    if lookup_filename is not None:
+        write_lookup_file(iter_redirects(root), lookup_filename)
+
+
+class MapWriter(object):
+    """ Rewrites the redirect map and lookup files on a background thread
+    ``delay`` seconds after a rewrite is scheduled, reading the aliases in a
+    new connection. Rewrites scheduled while one is pending are dropped, so
+    a bulk import committing every thousand aliases rewrites the files once
+    per ``delay`` rather than once per commit, and requests never wait for
+    them. Rewrites never overlap.
+    """
+
+    def __init__(self, delay=DEFAULT_WRITE_DELAY):
+        self.delay = delay
+        self.timer = None
+        self._lock = threading.Lock()
+        self._writing = threading.Lock()
+
+    def schedule(self, db, root_oid, registry):
+        """ Starts the timer of a rewrite of the files of the root with oid
+        ``root_oid`` in ``db`` and returns it, unless one is pending.
+        """
+        with self._lock:
+            if self.timer is not None:
+                return None
+            timer = self.timer = threading.Timer(
+                self.delay, self._write, (db, root_oid, registry))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _write(self, db, root_oid, registry):
+        # later commits must schedule a new rewrite, as this one may read
+        # the aliases before they commit
+        with self._lock:
+            self.timer = None
+        with self._writing:
+            try:
+                self.write(db, root_oid, registry)
+            except Exception:
+                logger.exception('Error writing the alias redirect map')
+
+    def write(self, db, root_oid, registry):
+        """ Writes the files of the root with oid ``root_oid`` using a new
+        connection to ``db``.
+        """
+        conn = db.open(transaction_manager=transaction.TransactionManager())
+        try:
+            root = conn.get(root_oid)
+            if get_index(root) is not None:
+                write_files(root, registry)
+        finally:
+            conn.close()
+
+def schedule_map_write(context, registry=None, txn=None):
+    """ Rewrites the configured redirect map and lookup files once the
+    current transaction commits, through the ``MapWriter`` utility if there
+    is one. Does nothing if neither file is configured, and schedules at
+    most one rewrite per transaction.
+    """
+    if registry is None:
+        registry = get_current_registry()
+    if (get_map_settings(registry)[0] is None and
+        get_lookup_file_setting(registry) is None):
+        return
+    if txn is None:
+        txn = transaction.get()
+    for hook, args, kw in txn.getAfterCommitHooks():
+        if hook is _write_after_commit:
+            return
+    txn.addAfterCommitHook(_write_after_commit, (find_root(context), registry))
+
+def _write_after_commit(status, root, registry):
+    # the transaction is over, so the index cannot be built here
+    if not status or get_index(root) is None:
+        return
+    writer = registry.queryUtility(IAliasMapWriter)
+    jar = getattr(root, '_p_jar', None)
+    if writer is not None and jar is not None:
+        writer.schedule(jar.db(), root._p_oid, registry)
+        return
+    try:
+        write_files(root, registry)
+    except Exception:
+        logger.exception('Error writing the alias redirect map')
@@ -0,0 +1,81 @@
+""" Import or export aliases as CSV or JSON lines """
+
+import sys
+from optparse import OptionParser
+
+from pyramid.paster import (
+    setup_logging,
+    bootstrap,
+    )
+
+from ..bulk import (
+    READERS,
+    WRITERS,
+    export_aliases,
+    import_aliases,
+    )
+
+def _get_format(parser, options, filename):
+    fmt = options.format
+    if fmt is None:
+        fmt = 'jsonl' if filename.endswith('.jsonl') else 'csv'
+    if fmt not in READERS:
+        parser.error('Unknown format %r' % fmt)
+    return fmt
+
+def import_main(argv=sys.argv):
+    parser = OptionParser(
+        usage='%prog config_uri filename',
+        description='Create aliases from a CSV or JSON lines file')
+    parser.add_option('-f', '--format', dest='format', default=None,
+        help="'csv' or 'jsonl' (default: guessed from the file name)")
+    parser.add_option('-i', '--interval', dest='commit_interval',
+        action="store", default=1000,
+        help="Commit every N aliases")
+    parser.add_option('-s', '--savepoint', dest='savepoint_interval',
+        action="store", default=100,
+        help="Make a savepoint every N aliases")
+
+    options, args = parser.parse_args(argv[1:])
+    if len(args) != 2:
+        parser.error("Requires a config_uri and a filename as arguments")
+    config_uri, filename = args
+    fmt = _get_format(parser, options, filename)
+
+    setup_logging(config_uri)
+    env = bootstrap(config_uri)
+    try:
+        with open(filename) as stream:
+            created, errors = import_aliases(
+                env['root'],
+                READERS[fmt](stream),
+                env['registry'],
+                commit_size=int(options.commit_interval),
+                savepoint_size=int(options.savepoint_interval),
+                )
+    finally:
+        env['closer']()
+    for lineno, message in errors:
+        print('row %s: %s' % (lineno, message))
+    print('%s aliases created, %s rows skipped' % (created, len(errors)))
+
+def export_main(argv=sys.argv):
+    parser = OptionParser(
+        usage='%prog config_uri filename',
+        description='Write all aliases to a CSV or JSON lines file')
+    parser.add_option('-f', '--format', dest='format', default=None,
+        help="'csv' or 'jsonl' (default: guessed from the file name)")
+
+    options, args = parser.parse_args(argv[1:])
+    if len(args) != 2:
+        parser.error("Requires a config_uri and a filename as arguments")
+    config_uri, filename = args
+    fmt = _get_format(parser, options, filename)
+
+    setup_logging(config_uri)
+    env = bootstrap(config_uri)
+    try:
+        with open(filename, 'w') as stream:
+            WRITERS[fmt](export_aliases(env['root']), stream)
+    finally:
+        env['closer']()
@@ -0,0 +1,172 @@
+""" Maintenance commands for the aliases of a site """
+
+import sys
+from optparse import OptionParser
+
+import transaction
+
+from pyramid.paster import (
+    setup_logging,
+    bootstrap,
+    )
+
+from .. import MAX_CHAIN_DEPTH
+from ..maintenance import (
+    DANGLING_ACTIONS,
+    clean_dangling_aliases,
+    flatten_aliases,
+    retarget_aliases,
+    )
+from ..redirectmap import (
+    FORMATS,
+    build_index,
+    get_index,
+    write_lookup,
+    write_map_file,
+    )
+
+def flatten_main(argv=sys.argv):
+    parser = OptionParser(
+        usage='%prog config_uri',
+        description='Point aliases targeting other aliases straight at the '
+                    'final target of their chain')
+    parser.add_option('-d', '--depth', dest='depth', type='int',
+        default=MAX_CHAIN_DEPTH,
+        help='Follow chains for at most N aliases (default: %default)')
+    parser.add_option('-n', '--dry-run', dest='dry_run',
+        action='store_true', default=False,
+        help="Report what would change without committing")
+
+    options, args = parser.parse_args(argv[1:])
+    if len(args) != 1:
+        parser.error("Requires a config_uri as an argument")
+    config_uri = args[0]
+
+    setup_logging(config_uri)
+    env = bootstrap(config_uri)
+    try:
+        flattened, cycles = flatten_aliases(env['root'], options.depth)
+        if options.dry_run:
+            transaction.abort()
+        else:
+            transaction.commit()
+    finally:
+        env['closer']()
+    for path in cycles:
+        print('cycle: %s' % path)
+    print('%s aliases flattened, %s in cycles' % (flattened, len(cycles)))
+
+def dangling_main(argv=sys.argv):
+    parser = OptionParser(
+        usage='%prog config_uri',
+        description='Find aliases whose target has been removed, and '
+                    'optionally disable or remove them')
+    parser.add_option('-a', '--action', dest='action', default='report',
+        help="'report', 'disable' or 'remove' (default: %default)")
+    parser.add_option('-b', '--batch-size', dest='batch_size', type='int',
+        default=1000,
+        help='Aliases loaded between cache flushes (default: %default)')
+    parser.add_option('-n', '--dry-run', dest='dry_run',
+        action='store_true', default=False,
+        help="Report what would change without committing")
+
+    options, args = parser.parse_args(argv[1:])
+    if len(args) != 1:
+        parser.error("Requires a config_uri as an argument")
+    if options.action not in DANGLING_ACTIONS:
+        parser.error('Unknown action %r' % options.action)
+    config_uri = args[0]
+
+    setup_logging(config_uri)
+    env = bootstrap(config_uri)
+    try:
+        paths = clean_dangling_aliases(env['root'], options.action,
+                                       options.batch_size)
+        if options.dry_run:
+            transaction.abort()
+        else:
+            transaction.commit()
+    finally:
+        env['closer']()
+    for path in paths:
+        print('dangling: %s' % path)
+    print('%s dangling aliases' % len(paths))
+
+def retarget_main(argv=sys.argv):
+    parser = OptionParser(
+        usage='%prog config_uri old_prefix new_prefix',
+        description='Point aliases targeting objects below old_prefix at the '
+                    'objects at the same paths below new_prefix')
+    parser.add_option('-c', '--commit-size', dest='commit_size', type='int',
+        default=1000,
+        help='Aliases retargeted per transaction (default: %default)')
+    parser.add_option('-r', '--retries', dest='retries', type='int',
+        default=3,
+        help='Attempts for each transaction on conflicts (default: %default)')
+    parser.add_option('-n', '--dry-run', dest='dry_run',
+        action='store_true', default=False,
+        help="Report what would change without committing")
+
+    options, args = parser.parse_args(argv[1:])
+    if len(args) != 3:
+        parser.error("Requires a config_uri, an old prefix and a new prefix "
+                     "as arguments")
+    config_uri, old_prefix, new_prefix = args
+    for prefix in (old_prefix, new_prefix):
+        if not prefix.startswith('/'):
+            parser.error('Not an absolute path: %s' % prefix)
+
+    def progress(done, total):
+        print('%s/%s' % (done, total))
+
+    setup_logging(config_uri)
+    env = bootstrap(config_uri)
+    try:
+        retargeted, missing = retarget_aliases(
+            env['root'], old_prefix, new_prefix,
+            None if options.dry_run else options.commit_size,
+            options.retries, progress)
+        if options.dry_run:
+            transaction.abort()
+    finally:
+        env['closer']()
+    for path, target in missing:
+        print('missing target: %s -> %s' % (path, target))
+    print('%s aliases retargeted, %s without a new target' % (
+        retargeted, len(missing)))
+
+def redirect_map_main(argv=sys.argv):
+    parser = OptionParser(
+        usage='%prog config_uri filename',
+        description='Write a redirect map of all aliases for nginx, Apache '
+                    'or HAProxy')
+    parser.add_option('-f', '--format', dest='format', default='nginx',
+        help="'nginx', 'apache', 'haproxy' or 'lookup' for a lookup file "
+             "(default: %default)")
+    parser.add_option('-b', '--base-url', dest='base_url', default='',
+        help="Prefix for the locations, e.g. https://example.com "
+             "(default: host-relative locations)")
+    parser.add_option('-r', '--rebuild', dest='rebuild',
+        action='store_true', default=False,
+        help="Rebuild the redirect index from all aliases first")
+
+    options, args = parser.parse_args(argv[1:])
+    if len(args) != 2:
+        parser.error("Requires a config_uri and a filename as arguments")
+    config_uri, filename = args
+    if options.format not in FORMATS and options.format != 'lookup':
+        parser.error('Unknown format %r' % options.format)
+
+    setup_logging(config_uri)
+    env = bootstrap(config_uri)
+    try:
+        root = env['root']
+        if options.rebuild or get_index(root) is None:
+            build_index(root)
+            transaction.commit()
+        if options.format == 'lookup':
+            write_lookup(root, filename)
+        else:
+            write_map_file(root, filename, options.format, options.base_url)
+    finally:
+        env['closer']()
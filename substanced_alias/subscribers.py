@@ -0,0 +1,117 @@
+from substanced.event import (
+    subscribe_added,
+    subscribe_created,
+    subscribe_modified,
+    subscribe_removed,
+    subscribe_will_be_removed,
+    )
+from pyramid.traversal import find_root
+from substanced.interfaces import IRoot
+from substanced.util import (
+    find_objectmap,
+    get_oid,
+    )
+
+from . import (
+    AliasToTarget,
+    IAlias,
+    TABLE_GENERATION_ATTR,
+    bump_generation,
+    connect_alias,
+    iter_content,
+    )
+from .catalog import (
+    add_alias_catalog,
+    reindex_alias,
+    reindex_alias_targets,
+    )
+from .redirectmap import (
+    index_alias,
+    schedule_map_write,
+    unindex_alias,
+    )
+from .folder import IAliasFolder
+
+
+@subscribe_created(IRoot)
+def root_created(event):
+    """ Add the alias catalog to new sites."""
+    add_alias_catalog(event.object)
+
+@subscribe_added()
+def resource_moved(event):
+    """ A resource was moved or renamed (Substance D sends an added event with
+    ``moving`` set). Every alias targeting it or one of its descendants now
+    has a stale location, so refresh and reindex them, and invalidate the
+    lookup tables.
+    """
+    if not event.moving:
+        return
+    bump_generation(event.parent, TABLE_GENERATION_ATTR)
+    schedule_map_write(event.parent)
+    reindex_alias_targets(event.object)
+
+@subscribe_added(IAlias)
+def alias_added(event):
+    """ A new alias path exists; index its target and invalidate in-memory
+    lookup tables. The objectmap reference and redirect index entry can
+    only be made here, once the alias has been given an oid.
+    """
+    if not event.moving:
+        connect_alias(event.object)
+        index_alias(event.object)
+    bump_generation(event.parent, TABLE_GENERATION_ATTR)
+    schedule_map_write(event.parent)
+
+@subscribe_removed(IAlias)
+def alias_removed(event):
+    """ An alias path is gone; invalidate in-memory lookup tables."""
+    if not event.moving:
+        unindex_alias(event.object, event.parent)
+    bump_generation(event.parent, TABLE_GENERATION_ATTR)
+    schedule_map_write(event.parent)
+
+@subscribe_will_be_removed()
+def target_removed(event):
+    """ A resource is about to be removed along with its descendants. Mark
+    the aliases pointing at any of them as dangling, found through their
+    ``AliasToTarget`` references while the objectmap still has them, so they
+    answer 404 Not Found instead of redirecting to a removed resource.
+    ``AliasFolder`` entries have no references; if any points at a removed
+    object, the lookup tables and redirect map are invalidated so they stop
+    redirecting too.
+    """
+    if event.moving:
+        return
+    objectmap = find_objectmap(event.parent)
+    if objectmap is None:
+        return
+    removed = set(event.removed_oids)
+    dangling = False
+    for oid in removed:
+        for alias_oid in objectmap.sourceids(oid, AliasToTarget):
+            if alias_oid in removed:
+                continue
+            alias = objectmap.object_for(alias_oid)
+            if alias is not None:
+                alias.dangling = True
+                reindex_alias(alias)
+                dangling = True
+    if not dangling:
+        for folder in iter_content(find_root(event.parent), IAliasFolder):
+            if get_oid(folder, None) in removed:
+                continue
+            if folder.alias_names_for(removed):
+                dangling = True
+                break
+    if dangling:
+        bump_generation(event.parent, TABLE_GENERATION_ATTR)
+        schedule_map_write(event.parent)
+
+@subscribe_modified(IAlias)
+def alias_modified(event):
+    """ Rebuild the stored location after an alias's properties change."""
+    event.object.refresh_location()
+    index_alias(event.object)
+    bump_generation(event.object, TABLE_GENERATION_ATTR)
+    schedule_map_write(event.object)
@@ -9,9 +9,9 @@ from substanced.interfaces import IFolder
 
 
 class TestAlias(unittest.TestCase):
-    def _makeOne(self, name, resource, query=None, anchor=None):
+    def _makeOne(self, name, resource, query=None, anchor=None, **kw):
         from .. import Alias
-        return Alias(name, resource, query=query, anchor=anchor)
+        return Alias(name, resource, query=query, anchor=anchor, **kw)
 
     def test_ctor(self):
         resource = testing.DummyResource()
@@ -66,14 +66,532 @@ class TestAlias(unittest.TestCase):
         resp = inst.redirect(request)
         self.assertEqual(resp.code, 302)
 
+    def test_redirect_follows_chain(self):
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        last = self._makeOne('last', root['target'], query=['a=1'])
+        first = self._makeOne('first', last, anchor='top')
+        resp = first.redirect(testing.DummyRequest())
+        self.assertEqual(resp.location, 'http://example.com/target/?a=1')
+
+    def test_redirect_chain_last_modified(self):
+        from persistent.timestamp import TimeStamp
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        last = self._makeOne('last', root['target'])
+        first = self._makeOne('first', last)
+        first._p_serial = TimeStamp(2001, 9, 9, 1, 46, 40).raw()
+        last._p_serial = TimeStamp(2002, 9, 9, 1, 46, 40).raw()
+        resp = first.redirect(testing.DummyRequest())
+        self.assertEqual(resp.headers['Last-Modified'],
+                         'Mon, 09 Sep 2002 01:46:40 GMT')
+
+    def test_redirect_dangling(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        inst = self._makeOne('test', testing.DummyResource())
+        inst.dangling = True
+        self.assertRaises(HTTPNotFound, inst.redirect, testing.DummyRequest())
+
+    def test_redirect_chain_to_dangling(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        last = self._makeOne('last', testing.DummyResource())
+        last.dangling = True
+        first = self._makeOne('first', last)
+        self.assertRaises(HTTPNotFound, first.redirect,
+                          testing.DummyRequest())
+
+    def test_retarget_clears_dangling(self):
+        root = DummyFolder()
+        root['new'] = testing.DummyResource()
+        inst = self._makeOne('test', testing.DummyResource())
+        root['test'] = inst
+        inst.dangling = True
+        inst.retarget(root['new'])
+        self.assertFalse(inst.dangling)
+
+    def test_retarget_to_removed_stays_dangling(self):
+        root = DummyFolder()
+        inst = self._makeOne('test', testing.DummyResource())
+        root['test'] = inst
+        inst.dangling = True
+        inst.retarget(testing.DummyResource())
+        self.assertTrue(inst.dangling)
+
+    def test_redirect_cycle(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        first = self._makeOne('first', testing.DummyResource())
+        second = self._makeOne('second', first)
+        first.resource = second
+        self.assertRaises(HTTPNotFound, first.redirect,
+                          testing.DummyRequest())
+
+    def test_redirect_chain_depth_setting(self):
+        from pyramid.registry import Registry
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        root['last'] = self._makeOne('last', root['target'])
+        first = self._makeOne('first', root['last'])
+        request = testing.DummyRequest()
+        request.registry = Registry()
+        request.registry.settings = {'substanced_alias.max_chain_depth': '0'}
+        resp = first.redirect(request)
+        self.assertEqual(resp.location, 'http://example.com/last/')
+
+    def test_retarget(self):
+        from .. import AliasToTarget
+        root = DummyFolder()
+        root.__objectmap__ = DummyObjectMap()
+        root['old'] = testing.DummyResource()
+        root['new'] = testing.DummyResource()
+        inst = self._makeOne('name', root['old'])
+        root['name'] = inst
+        root.__objectmap__.connect(inst, root['old'], AliasToTarget)
+        inst.retarget(root['new'])
+        self.assertEqual(inst.resource, root['new'])
+        self.assertEqual(inst.get_location(), '/new/')
+        self.assertEqual(root.__objectmap__.references,
+                         set([(inst, root['new'], AliasToTarget)]))
+
+    def test_redirect_default_policy(self):
+        inst = self._makeOne('test', testing.DummyResource())
+        resp = inst.redirect(testing.DummyRequest())
+        self.assertEqual(resp.code, 302)
+        self.assertEqual(resp.cache_control.max_age, None)
+        self.assertEqual(resp.etag, None)
+
+    def test_redirect_alias_policy(self):
+        from persistent.timestamp import TimeStamp
+        from pyramid.request import Request
+        inst = self._makeOne('test', testing.DummyResource(), status=308,
+                             max_age=60)
+        inst._p_serial = TimeStamp(2001, 9, 9, 1, 46, 40).raw()
+        resp = inst.redirect(testing.DummyRequest())
+        self.assertEqual(resp.code, 308)
+        self.assertEqual(resp.cache_control.max_age, 60)
+        self.assertTrue(resp.cache_control.public)
+        self.assertEqual(resp.headers['Last-Modified'],
+                         'Sun, 09 Sep 2001 01:46:40 GMT')
+        self.assertTrue(resp.etag)
+        conditional = Request.blank('/', headers={'If-None-Match': resp.etag})
+        self.assertEqual(conditional.get_response(resp).status_int, 304)
+
+    def test_redirect_query_mode(self):
+        inst = self._makeOne('test', testing.DummyResource(), query=['a=1'],
+                             anchor='top', query_mode='merge')
+        request = testing.DummyRequest()
+        request.query_string = 'a=2&utm_source=x'
+        resp = inst.redirect(request)
+        self.assertEqual(resp.location,
+                         'http://example.com/?a=1&utm_source=x#top')
+
+    def test_redirect_query_ignored(self):
+        inst = self._makeOne('test', testing.DummyResource(), query=['a=1'])
+        request = testing.DummyRequest()
+        request.query_string = 'utm_source=x'
+        resp = inst.redirect(request)
+        self.assertEqual(resp.location, 'http://example.com/?a=1')
+
+    def test_redirect_settings_policy(self):
+        from pyramid.registry import Registry
+        inst = self._makeOne('test', testing.DummyResource())
+        request = testing.DummyRequest()
+        request.registry = Registry()
+        request.registry.settings = {
+            'substanced_alias.redirect_status': '301',
+            'substanced_alias.max_age': '300',
+            }
+        resp = inst.redirect(request)
+        self.assertEqual(resp.code, 301)
+        self.assertEqual(resp.cache_control.max_age, 300)
+
+    def test_generate_url_quotes_path(self):
+        request = testing.DummyRequest()
+        root = DummyFolder()
+        resource = testing.DummyResource()
+        root['my resource'] = resource
+        inst = self._makeOne('test', resource)
+        url = inst.generate_url(request)
+        self.assertEqual(url, 'http://example.com/my%20resource/')
+
+    def test_generate_url_virtual_root(self):
+        request = testing.DummyRequest(
+            environ={'HTTP_X_VHM_ROOT': '/myresource'})
+        root = DummyFolder()
+        resource = testing.DummyResource()
+        root['myresource'] = resource
+        inst = self._makeOne('test', resource, anchor='a')
+        url = inst.generate_url(request)
+        self.assertEqual(url, 'http://example.com/#a')
+
+    def test_location_stored_at_creation(self):
+        root = DummyFolder()
+        root['a'] = DummyFolder()
+        resource = testing.DummyResource()
+        root['a']['b'] = resource
+        inst = self._makeOne('test', resource, ['one=1'], anchor='x')
+        self.assertEqual(inst._location, '/a/b/?one=1#x')
+
+    def test_get_location_uses_stored_value(self):
+        root = DummyFolder()
+        resource = testing.DummyResource()
+        root['a'] = resource
+        inst = self._makeOne('test', resource)
+        root['alias'] = inst
+        inst._location = '/cached/'
+        self.assertEqual(inst.get_location(), '/cached/')
+
+    def test_get_location_not_stored(self):
+        root = DummyFolder()
+        resource = testing.DummyResource()
+        root['a'] = resource
+        inst = self._makeOne('test', resource)
+        del inst._location
+        self.assertEqual(inst.get_location(), '/a/')
+        self.assertFalse('_location' in inst.__dict__)
+
+    def test_refresh_location(self):
+        root = DummyFolder()
+        resource = testing.DummyResource()
+        root['a'] = resource
+        inst = self._makeOne('test', resource)
+        root['alias'] = inst
+        root.rename('a', 'b')
+        inst.anchor = 'top'
+        inst.refresh_location()
+        self.assertEqual(inst._location, '/b/#top')
+        self.assertEqual(inst.get_location(), '/b/#top')
+
     def test_updatequery(self):
         resource = testing.DummyResource()
         request = testing.DummyRequest()
         query = ["foo=bar"]
         inst = self._makeOne('test', resource, query)
-        self.assertEqual(inst._querydict, {'foo': 'bar'})
-        inst.updatequery(["foo=baz"])
-        self.assertEqual(inst._querydict, {'foo': 'baz'})
+        self.assertEqual(inst._query, (('foo', 'bar'),))
+        inst.updatequery(["foo=baz", "flag"])
+        self.assertEqual(inst._query, (('foo', 'baz'), ('flag', '')))
+        self.assertEqual(inst.query, ['foo=baz', 'flag='])
+
+    def test_query_round_trips(self):
+        resource = testing.DummyResource()
+        inst = self._makeOne('test', resource, ['a=', 'b=1', 'a=2'])
+        self.assertEqual(inst.query, ['a=', 'b=1', 'a=2'])
+        location = inst.build_location()
+        inst.updatequery(inst.query)
+        self.assertEqual(inst.query, ['a=', 'b=1', 'a=2'])
+        self.assertEqual(inst.build_location(), location)
+
+    def test_query_empty(self):
+        resource = testing.DummyResource()
+        inst = self._makeOne('test', resource, [])
+        self.assertEqual(inst.query, None)
+
+    def test_generate_url_repeated_keys(self):
+        resource = testing.DummyResource()
+        request = testing.DummyRequest()
+        inst = self._makeOne('test', resource, ['a=1', 'a=2'])
+        url = inst.generate_url(request)
+        self.assertEqual(url, 'http://example.com/?a=1&a=2')
+
+    def test_setstate_old_format(self):
+        resource = testing.DummyResource()
+        inst = self._makeOne('test', resource)
+        inst.__setstate__({'name': 'test', 'resource': resource,
+                           'anchor': None, 'query': ['one=1'],
+                           '_querydict': {'one': '1'}})
+        self.assertEqual(inst._query, (('one', '1'),))
+        self.assertEqual(inst.query, ['one=1'])
+        self.assertFalse('_querydict' in inst.__dict__)
+        self.assertEqual(inst._location, None)
+        self.assertEqual(inst.get_location(), '/?one=1')
+
+    def test_setstate_current_format(self):
+        resource = testing.DummyResource()
+        inst = self._makeOne('test', resource, ['one=1'])
+        state = inst.__getstate__()
+        other = self._makeOne('other', resource)
+        other.__setstate__(state)
+        self.assertEqual(other.name, 'test')
+        self.assertEqual(other._query, (('one', '1'),))
+        self.assertEqual(other._location, '/?one=1')
+
+
+class Test_iter_aliases(unittest.TestCase):
+    def _callFUT(self, root, batch_size=1000):
+        from .. import iter_aliases
+        return list(iter_aliases(root, batch_size))
+
+    def _makeAlias(self):
+        from .. import IAlias
+        alias = testing.DummyResource()
+        alsoProvides(alias, IAlias)
+        return alias
+
+    def test_walk(self):
+        root = DummyFolder()
+        root['a'] = self._makeAlias()
+        root['f'] = DummyFolder()
+        root['f']['b'] = self._makeAlias()
+        root['f']['c'] = testing.DummyResource()
+        result = self._callFUT(root)
+        self.assertEqual(len(result), 2)
+        self.assertIn(root['a'], result)
+        self.assertIn(root['f']['b'], result)
+
+    def test_catalog(self):
+        root = DummyFolder()
+        root['a'] = self._makeAlias()
+        root.__objectmap__ = DummyObjectMap()
+        root.__objectmap__.objects = {1: root['a']}
+        root._p_jar = DummyCacheJar()
+        catalogs = DummyFolder(__is_service__=True)
+        catalogs['system'] = DummyFolder(content_type=DummyIndex([1, 2]))
+        root['catalogs'] = catalogs
+        result = self._callFUT(root, batch_size=1)
+        self.assertEqual(result, [root['a']])
+        self.assertEqual(root._p_jar.minimized, 1)
+
+class Test_merge_query(unittest.TestCase):
+    def _callFUT(self, url, query_string, mode):
+        from .. import merge_query
+        return merge_query(url, query_string, mode)
+
+    def test_ignore(self):
+        self.assertEqual(self._callFUT('/t/?a=1', 'b=2', None), '/t/?a=1')
+
+    def test_no_incoming_query(self):
+        self.assertEqual(self._callFUT('/t/?a=1', '', 'override'), '/t/?a=1')
+
+    def test_passthrough(self):
+        self.assertEqual(
+            self._callFUT('/t/?a=1#top', 'a=2&b=%20', 'passthrough'),
+            '/t/?a=1&a=2&b=%20#top')
+        self.assertEqual(self._callFUT('/t/', 'b=2', 'passthrough'),
+                         '/t/?b=2')
+
+    def test_merge(self):
+        self.assertEqual(
+            self._callFUT('/t/?a=1&a=3&c', 'a=2&b=2&%63=4', 'merge'),
+            '/t/?a=1&a=3&c&b=2')
+
+    def test_override(self):
+        self.assertEqual(
+            self._callFUT('/t/?a=1&c=3&a=5#x', 'a=2&a=4&b', 'override'),
+            '/t/?c=3&a=2&a=4&b#x')
+        self.assertEqual(self._callFUT('/t/?a=1', 'a=2', 'override'),
+                         '/t/?a=2')
+
+class Test_has_target(unittest.TestCase):
+    def _callFUT(self, alias):
+        from .. import has_target
+        return has_target(alias)
+
+    def _makeRoot(self, targets):
+        root = DummyFolder()
+        root.__objectmap__ = DummyTargetMap(targets, {1: ('', 'target')})
+        root['target'] = testing.DummyResource(__oid__=1)
+        return root
+
+    def test_connected(self):
+        root = self._makeRoot({2: set([1])})
+        root['alias'] = testing.DummyResource(__oid__=2, resource=None)
+        self.assertTrue(self._callFUT(root['alias']))
+
+    def test_connected_target_removed(self):
+        root = self._makeRoot({2: set([3])})
+        root['alias'] = testing.DummyResource(__oid__=2, resource=None)
+        self.assertFalse(self._callFUT(root['alias']))
+
+    def test_not_connected(self):
+        root = self._makeRoot({})
+        root['alias'] = testing.DummyResource(__oid__=2,
+                                              resource=root['target'])
+        self.assertTrue(self._callFUT(root['alias']))
+        root['alias'].resource = testing.DummyResource(__oid__=3)
+        self.assertFalse(self._callFUT(root['alias']))
+        root['alias'].resource = testing.DummyResource()
+        self.assertFalse(self._callFUT(root['alias']))
+
+    def test_no_objectmap(self):
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        root['alias'] = testing.DummyResource(resource=root['target'])
+        self.assertTrue(self._callFUT(root['alias']))
+        root['alias'].resource = testing.DummyResource()
+        self.assertFalse(self._callFUT(root['alias']))
+
+class DummyTargetMap(object):
+    def __init__(self, targets, paths):
+        self.targets = targets
+        self.paths = paths
+
+    def targetids(self, obj, reftype):
+        return self.targets.get(obj.__oid__, set())
+
+    def path_for(self, oid):
+        return self.paths.get(oid)
+
+class Test_iter_chain(unittest.TestCase):
+    def _callFUT(self, alias, max_depth=10):
+        from .. import iter_chain
+        return list(iter_chain(alias, max_depth))
+
+    def _makeAlias(self, resource):
+        from .. import IAlias
+        alias = testing.DummyResource(resource=resource)
+        alsoProvides(alias, IAlias)
+        return alias
+
+    def test_no_chain(self):
+        self.assertEqual(self._callFUT(self._makeAlias(object())), [])
+
+    def test_chain(self):
+        third = self._makeAlias(object())
+        second = self._makeAlias(third)
+        first = self._makeAlias(second)
+        self.assertEqual(self._callFUT(first), [second, third])
+        self.assertEqual(self._callFUT(first, 1), [second])
+
+    def test_chain_mtime(self):
+        from .. import chain_mtime
+        second = self._makeAlias(object())
+        first = self._makeAlias(second)
+        self.assertEqual(chain_mtime(first), None)
+        first._p_mtime = 2.0
+        second._p_mtime = 5.0
+        self.assertEqual(chain_mtime(first), 5.0)
+        self.assertEqual(chain_mtime(first, 0), 2.0)
+        second._p_mtime = 1.0
+        self.assertEqual(chain_mtime(first), 2.0)
+
+    def test_cycle(self):
+        from .. import AliasCycleError
+        first = self._makeAlias(None)
+        second = self._makeAlias(first)
+        first.resource = second
+        self.assertRaises(AliasCycleError, self._callFUT, first)
+
+    def test_resolve_chain(self):
+        from .. import resolve_chain
+        second = self._makeAlias(object())
+        first = self._makeAlias(second)
+        self.assertEqual(resolve_chain(first), second)
+        self.assertEqual(resolve_chain(second), second)
+
+class DummyIndex(object):
+    def __init__(self, ids):
+        self.ids = ids
+
+    def eq(self, value):
+        return self
+
+    def execute(self):
+        return self
+
+class DummyCacheJar(object):
+    minimized = 0
+
+    def cacheMinimize(self):
+        self.minimized += 1
+
+
+class Test_get_redirect_status(unittest.TestCase):
+    def _callFUT(self, settings):
+        from .. import get_redirect_status
+        registry = testing.DummyResource(settings=settings)
+        return get_redirect_status(registry)
+
+    def test_default(self):
+        self.assertEqual(self._callFUT(None), 302)
+
+    def test_setting(self):
+        self.assertEqual(
+            self._callFUT({'substanced_alias.redirect_status': '308'}), 308)
+
+    def test_unknown(self):
+        for value in ('303', 'moved', ''):
+            settings = {'substanced_alias.redirect_status': value}
+            self.assertRaises(ValueError, self._callFUT, settings)
+
+class Test_generation(unittest.TestCase):
+    def test_no_counter(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        root = DummyFolder()
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 0)
+
+    def test_bump(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            bump_generation,
+            get_generation,
+            )
+        root = DummyFolder()
+        root['a'] = DummyFolder()
+        bump_generation(root['a'], TABLE_GENERATION_ATTR)
+        bump_generation(root, TABLE_GENERATION_ATTR)
+        self.assertEqual(get_generation(root['a'], TABLE_GENERATION_ATTR), 2)
+
+
+class Test_alias_references(unittest.TestCase):
+    def _makeTree(self):
+        root = DummyFolder()
+        root.__objectmap__ = DummyObjectMap()
+        root['target'] = testing.DummyResource()
+        root['alias'] = testing.DummyResource(resource=root['target'])
+        return root
+
+    def test_connect_alias(self):
+        from .. import (
+            AliasToTarget,
+            connect_alias,
+            )
+        root = self._makeTree()
+        connect_alias(root['alias'])
+        self.assertEqual(root.__objectmap__.references,
+                         set([(root['alias'], root['target'], AliasToTarget)]))
+
+    def test_connect_alias_no_objectmap(self):
+        from .. import connect_alias
+        alias = testing.DummyResource(resource=testing.DummyResource())
+        self.assertEqual(connect_alias(alias), None)
+
+    def test_disconnect_alias(self):
+        from .. import (
+            connect_alias,
+            disconnect_alias,
+            )
+        root = self._makeTree()
+        connect_alias(root['alias'])
+        disconnect_alias(root['alias'], root['target'])
+        self.assertEqual(root.__objectmap__.references, set())
+
+    def test_disconnect_alias_no_objectmap(self):
+        from .. import disconnect_alias
+        alias = testing.DummyResource()
+        self.assertEqual(disconnect_alias(alias, None), None)
+
+    def test_find_aliases(self):
+        from .. import (
+            connect_alias,
+            find_aliases,
+            find_alias_oids,
+            )
+        root = self._makeTree()
+        connect_alias(root['alias'])
+        self.assertEqual(list(find_aliases(root['target'])), [root['alias']])
+        self.assertEqual(list(find_alias_oids(root['target'])),
+                         [id(root['alias'])])
+
+    def test_find_aliases_no_objectmap(self):
+        from .. import (
+            find_aliases,
+            find_alias_oids,
+            )
+        resource = testing.DummyResource()
+        self.assertEqual(list(find_aliases(resource)), [])
+        self.assertEqual(list(find_alias_oids(resource)), [])
 
 
 class Test_keys_autocomplete_widget(unittest.TestCase):
@@ -107,6 +625,50 @@ class Test_keys_autocomplete_widget(unittest.TestCase):
                          json.dumps('myurl'))
 
 
+class Test_check_alias_names(unittest.TestCase):
+    def _callFUT(self, container, names):
+        from .. import check_alias_names
+        return check_alias_names(container, names)
+
+    def test_folder(self):
+        from substanced.folder import Folder
+        folder = Folder()
+        folder.data['taken'] = testing.DummyResource()
+        errors = self._callFUT(folder, ['free', 'taken', 'a/b', '@@x', '',
+                                        'x' * 256, 'free'])
+        self.assertEqual(sorted(errors), ['', '@@x', 'a/b', 'taken',
+                                          'x' * 256])
+        self.assertEqual(errors['taken'], 'An object named taken already '
+                                          'exists')
+
+    def test_alias_folder(self):
+        from ..folder import AliasFolder
+        folder = AliasFolder()
+        folder.data['child'] = testing.DummyResource()
+        folder.add_alias('NEAT', testing.DummyResource(__oid__=1))
+        errors = self._callFUT(folder, ['NEAT', 'child', 'free'])
+        self.assertEqual(errors, {
+            'NEAT': 'An alias named NEAT already exists',
+            'child': 'An object named child already exists',
+            })
+
+    def test_other_container(self):
+        container = DummyFolder()
+        container['taken'] = testing.DummyResource()
+        self.assertEqual(self._callFUT(container, ['taken', 'free']),
+                         {'taken': 'taken'})
+
+class TestAliasNameValidator(unittest.TestCase):
+    def test_current_name(self):
+        from .. import AliasNameValidator
+        container = DummyFolder()
+        container['abc'] = testing.DummyResource()
+        node = object()
+        inst = AliasNameValidator(container, 'abc')
+        self.assertEqual(inst(node, 'abc'), None)
+        inst = AliasNameValidator(container)
+        self.assertRaises(colander.Invalid, inst, node, 'abc')
+
 class Test_alias_name_validator(unittest.TestCase):
     def _makeOne(self, node, kw):
         from .. import alias_name_validator
@@ -201,6 +763,67 @@ class Test_alias_resource_validator(unittest.TestCase):
         validator = self._makeOne(node, kw)
         self.assertRaises(colander.Invalid, validator, node, 'bad/path')
 
+    def test_self(self):
+        from .. import IAlias
+        root = DummyFolder()
+        root['alias'] = testing.DummyResource()
+        alsoProvides(root['alias'], IAlias)
+        kw = self._makeKw()
+        kw['request'].root = root
+        kw['request'].context = root['alias']
+        node = object()
+        validator = self._makeOne(node, kw)
+        self.assertRaises(colander.Invalid, validator, node, 'alias')
+
+    def test_adding_to_target_container(self):
+        root = DummyFolder()
+        root['t'] = DummyFolder()
+        kw = self._makeKw()
+        kw['request'].root = root
+        kw['request'].context = root['t']
+        node = object()
+        validator = self._makeOne(node, kw)
+        self.assertEqual(None, validator(node, '/t'))
+
+    def test_cycle(self):
+        from .. import IAlias
+        root = DummyFolder()
+        root['alias'] = testing.DummyResource()
+        root['other'] = testing.DummyResource(resource=root['alias'],
+                                              __oid__=2)
+        alsoProvides(root['alias'], IAlias)
+        alsoProvides(root['other'], IAlias)
+        kw = self._makeKw()
+        kw['request'].root = root
+        kw['request'].context = root['alias']
+        node = object()
+        validator = self._makeOne(node, kw)
+        self.assertRaises(colander.Invalid, validator, node, 'other')
+
+    def test_chain(self):
+        from .. import IAlias
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        root['other'] = testing.DummyResource(resource=root['target'],
+                                              __oid__=2)
+        alsoProvides(root['other'], IAlias)
+        kw = self._makeKw()
+        kw['request'].root = root
+        node = object()
+        validator = self._makeOne(node, kw)
+        self.assertEqual(None, validator(node, 'other'))
+
+    def test_alias_folder_entry(self):
+        from ..folder import AliasRecord
+        root = DummyFolder()
+        root['go'] = DummyFolder()
+        root['go']['neat'] = AliasRecord('neat', root['go'], 1)
+        kw = self._makeKw()
+        kw['request'].root = root
+        node = object()
+        validator = self._makeOne(node, kw)
+        self.assertRaises(colander.Invalid, validator, node, 'go/neat')
+
 
 class TestAliasPropertySheet(unittest.TestCase):
     def _makeOne(self, context, request):
@@ -214,6 +837,8 @@ class TestAliasPropertySheet(unittest.TestCase):
         context.resource = resource
         context.query = None
         context.anchor = None
+        context.status = None
+        context.max_age = None
         def updatequery(query):
             context.query = query
         context.updatequery = updatequery
@@ -230,6 +855,8 @@ class TestAliasPropertySheet(unittest.TestCase):
         self.assertEqual(props['name'], 'name')
         self.assertEqual(props['resource'], '/resource/')
         self.assertEqual(props['query'], None)
+        self.assertEqual(props['status'], '')
+        self.assertEqual(props['max_age'], None)
 
     def test_set_properties(self):
         root = DummyFolder()
@@ -248,6 +875,41 @@ class TestAliasPropertySheet(unittest.TestCase):
         self.assertEqual(context.resource, resource)
         self.assertEqual(context.query, ["one=1"])
         self.assertEqual(context.anchor, None)
+        self.assertEqual(context.status, None)
+        self.assertEqual(context.max_age, None)
+
+    def test_set_redirect_policy(self):
+        root = DummyFolder()
+        resource = testing.DummyResource()
+        root['resource'] = resource
+        context = self._makeContext(resource)
+        root['name'] = context
+        inst = self._makeOne(context, testing.DummyRequest())
+        struct = dict(name='name', resource='resource', query=None,
+                      anchor=None, status='301', max_age=3600)
+        inst.set(struct)
+        self.assertEqual(context.status, 301)
+        self.assertEqual(context.max_age, 3600)
+        self.assertEqual(inst.get()['status'], '301')
+
+    def test_set_properties_new_resource_reindexed(self):
+        from .. import AliasToTarget
+        root = DummyFolder()
+        root.__objectmap__ = DummyObjectMap()
+        old = testing.DummyResource()
+        new = testing.DummyResource()
+        root['old'] = old
+        root['new'] = new
+        context = self._makeContext(old)
+        root['name'] = context
+        root.__objectmap__.connect(context, old, AliasToTarget)
+        request = testing.DummyRequest()
+        inst = self._makeOne(context, request)
+        struct = dict(name='name', resource='new', query=None, anchor=None)
+        inst.set(struct)
+        self.assertEqual(context.resource, new)
+        self.assertEqual(root.__objectmap__.references,
+                         set([(context, new, AliasToTarget)]))
 
 class Test_get_matching_keys(unittest.TestCase):
     def _makeOne(self):
@@ -286,6 +948,258 @@ class Test_get_matching_keys(unittest.TestCase):
         result = inst(root, 'bad/key')
         self.assertEqual(result, [])
 
+    def test_sorted_with_limit(self):
+        inst = self._makeOne()
+        root = DummyFolder()
+        for name in ('a3', 'a1', 'b1', 'a2'):
+            root[name] = testing.DummyResource()
+        result = inst(root, 'a', limit=2)
+        self.assertEqual(result, ['a1', 'a2'])
+
+    def test_offset(self):
+        inst = self._makeOne()
+        root = DummyFolder()
+        for name in ('a3', 'a1', 'b1', 'a2'):
+            root[name] = testing.DummyResource()
+        self.assertEqual(inst(root, 'a', limit=2, offset=1), ['a2', 'a3'])
+        self.assertEqual(inst(root, 'a', offset=2), ['a3'])
+        self.assertEqual(inst(root, 'a', limit=2, offset=3), [])
+
+    def test_btree_container(self):
+        from BTrees.OOBTree import OOBTree
+        inst = self._makeOne()
+        root = DummyFolder()
+        root.data = OOBTree()
+        for name in ('ab', 'b', 'a', 'abc', 'ac'):
+            root.data[name] = testing.DummyResource()
+        result = inst(root, 'ab')
+        self.assertEqual(result, ['ab', 'abc'])
+
+
+    def test_mark_containers(self):
+        inst = self._makeOne()
+        root = DummyFolder()
+        root['a'] = DummyFolder()
+        root['a']['b'] = DummyFolder()
+        root['a']['bc'] = testing.DummyResource()
+        result = inst(root, 'a/b', mark_containers=True)
+        self.assertEqual(result, ['a/b/', 'a/bc'])
+
+
+class Test_find_container(unittest.TestCase):
+    def _callFUT(self, root, path, cache=None):
+        from .. import find_container
+        return find_container(root, path, cache)
+
+    def _makeRoot(self):
+        root = DummyFolder()
+        root._p_jar = DummyJar()
+        root.__objectmap__ = DummyPathMap()
+        root['a'] = DummyFolder(_p_oid=b'\x00\x01', __oid__=1)
+        root._p_jar.objects[b'\x00\x01'] = root['a']
+        root.__objectmap__.paths[1] = ('', 'a')
+        return root
+
+    def _addOther(self, root):
+        other = testing.DummyResource(__oid__=2)
+        root._p_jar.objects[b'\x00\x02'] = other
+        root.__objectmap__.paths[2] = ('', 'a')
+        return other
+
+    def test_no_cache(self):
+        root = self._makeRoot()
+        self.assertEqual(self._callFUT(root, 'a'), root['a'])
+
+    def test_not_found(self):
+        root = self._makeRoot()
+        self.assertRaises(KeyError, self._callFUT, root, 'b', {})
+
+    def test_caches_oid(self):
+        root = self._makeRoot()
+        cache = {}
+        self.assertEqual(self._callFUT(root, 'a', cache), root['a'])
+        self.assertEqual(cache['a'][1], b'0001')
+        self.assertEqual(cache['a'][2], ('', 'a'))
+
+    def test_cache_hit_skips_traversal(self):
+        import time
+        root = self._makeRoot()
+        other = self._addOther(root)
+        cache = {'a': (time.time(), b'0002', ['', 'a'])}
+        self.assertEqual(self._callFUT(root, 'a', cache), other)
+
+    def test_cache_removed(self):
+        import time
+        root = self._makeRoot()
+        self._addOther(root)
+        del root.__objectmap__.paths[2]
+        cache = {'a': (time.time(), b'0002', ('', 'a'))}
+        self.assertEqual(self._callFUT(root, 'a', cache), root['a'])
+        self.assertEqual(cache['a'][1], b'0001')
+
+    def test_cache_moved(self):
+        import time
+        root = self._makeRoot()
+        self._addOther(root)
+        root.__objectmap__.paths[2] = ('', 'b')
+        cache = {'a': (time.time(), b'0002', ('', 'a'))}
+        self.assertEqual(self._callFUT(root, 'a', cache), root['a'])
+
+    def test_cache_without_objectmap(self):
+        import time
+        root = self._makeRoot()
+        self._addOther(root)
+        del root.__objectmap__
+        cache = {'a': (time.time(), b'0002', ('', 'a'))}
+        self.assertEqual(self._callFUT(root, 'a', cache), root['a'])
+
+    def test_cache_expired(self):
+        root = self._makeRoot()
+        self._addOther(root)
+        cache = {'a': (0, b'0002', ('', 'a'))}
+        self.assertEqual(self._callFUT(root, 'a', cache), root['a'])
+
+    def test_cache_oid_gone(self):
+        import time
+        root = self._makeRoot()
+        cache = {'a': (time.time(), b'0009', ('', 'a'))}
+        self.assertEqual(self._callFUT(root, 'a', cache), root['a'])
+
+    def test_cache_evicts_oldest(self):
+        import time
+        from .. import CONTAINER_CACHE_SIZE
+        root = self._makeRoot()
+        now = time.time()
+        cache = dict(('p%s' % i, (now + i, b'00', ())) for i in
+                     range(CONTAINER_CACHE_SIZE))
+        self._callFUT(root, 'a', cache)
+        self.assertEqual(len(cache), CONTAINER_CACHE_SIZE)
+        self.assertNotIn('p0', cache)
+        self.assertIn('a', cache)
+
+class DummyJar(object):
+    def __init__(self):
+        self.objects = {}
+
+    def get(self, oid):
+        return self.objects[oid]
+
+class DummyPathMap(object):
+    def __init__(self):
+        self.paths = {}
+
+    def path_for(self, oid):
+        return self.paths.get(oid)
+
+
+class Test_find_target(unittest.TestCase):
+    def _callFUT(self, request, path, root=None):
+        from .. import find_target
+        return find_target(request, path, root)
+
+    def _makeRequest(self):
+        request = testing.DummyRequest()
+        request.root = DummyFolder()
+        request.root['a'] = testing.DummyResource()
+        return request
+
+    def test_found_and_memoized(self):
+        request = self._makeRequest()
+        resource = request.root['a']
+        self.assertEqual(self._callFUT(request, 'a'), resource)
+        del request.root['a']
+        self.assertEqual(self._callFUT(request, 'a'), resource)
+
+    def test_missing_memoized(self):
+        request = self._makeRequest()
+        self.assertRaises(KeyError, self._callFUT, request, 'b')
+        request.root['b'] = testing.DummyResource()
+        self.assertRaises(KeyError, self._callFUT, request, 'b')
+
+    def test_explicit_root(self):
+        request = self._makeRequest()
+        root = DummyFolder()
+        root['x'] = testing.DummyResource()
+        self.assertEqual(self._callFUT(request, 'x', root), root['x'])
+
+    def test_alias_folder_entry(self):
+        from ..folder import AliasRecord
+        request = self._makeRequest()
+        request.root['go'] = DummyFolder()
+        request.root['go']['neat'] = AliasRecord('neat', request.root['go'], 1)
+        self.assertRaises(KeyError, self._callFUT, request, 'go/neat')
+
+class Test_resolve_paths(unittest.TestCase):
+    def _callFUT(self, root, paths, cache=None):
+        from .. import resolve_paths
+        return resolve_paths(root, paths, cache)
+
+    def test_it(self):
+        root = DummyFolder()
+        root['a'] = CountingFolder()
+        root['a']['b'] = testing.DummyResource()
+        root['a']['c'] = testing.DummyResource()
+        result = self._callFUT(
+            root, ['a/b', '/a/c/', 'a/missing', 'x/y/z', '', 'a/b/c'])
+        # b, c and missing are each looked up once
+        self.assertEqual(root['a'].lookups, 3)
+        self.assertEqual(result, {
+            'a/b': root['a']['b'],
+            '/a/c/': root['a']['c'],
+            'a/missing': None,
+            'x/y/z': None,
+            '': root,
+            'a/b/c': None,
+            })
+
+    def test_existing_cache(self):
+        root = DummyFolder()
+        root['a'] = testing.DummyResource()
+        cache = {'a': 'cached'}
+        self.assertEqual(self._callFUT(root, ['a'], cache), {'a': 'cached'})
+
+    def test_alias_folder_entry(self):
+        from ..folder import AliasRecord
+        root = DummyFolder()
+        root['go'] = DummyFolder()
+        root['go']['neat'] = AliasRecord('neat', root['go'], 1)
+        self.assertEqual(self._callFUT(root, ['go/neat', 'go/neat/x']),
+                         {'go/neat': None, 'go/neat/x': None})
+
+class Test_iter_keys_with_prefix(unittest.TestCase):
+    def _callFUT(self, container, prefix):
+        from .. import iter_keys_with_prefix
+        return list(iter_keys_with_prefix(container, prefix))
+
+    def test_btree_stops_at_first_mismatch(self):
+        from BTrees.OOBTree import OOBTree
+        container = testing.DummyResource()
+        names = ['a', 'b1', 'b2', 'c']
+        container.data = DummyBTree(OOBTree(dict.fromkeys(names)))
+        self.assertEqual(self._callFUT(container, 'b'), ['b1', 'b2'])
+        self.assertEqual(container.data.seen, ['b1', 'b2', 'c'])
+
+    def test_unordered_container(self):
+        container = DummyFolder()
+        for name in ('c', 'b2', 'a', 'b1'):
+            container[name] = testing.DummyResource()
+        self.assertEqual(self._callFUT(container, 'b'), ['b1', 'b2'])
+
+    def test_no_match(self):
+        container = DummyFolder()
+        container['a'] = testing.DummyResource()
+        self.assertEqual(self._callFUT(container, 'z'), [])
+
+class DummyBTree(object):
+    def __init__(self, tree):
+        self.tree = tree
+        self.seen = []
+
+    def keys(self, min=None):
+        for key in self.tree.keys(min=min):
+            self.seen.append(key)
+            yield key
+
 @implementer(IFolder)
 class DummyFolder(testing.DummyResource):
 
@@ -300,3 +1214,30 @@ class DummyFolder(testing.DummyResource):
         del self[oldname]
         self[newname] = old
 
+class CountingFolder(DummyFolder):
+    lookups = 0
+
+    def __getitem__(self, name):
+        self.lookups += 1
+        return DummyFolder.__getitem__(self, name)
+
+class DummyObjectMap(object):
+    def __init__(self):
+        self.references = set()
+
+    def connect(self, source, target, reftype):
+        self.references.add((source, target, reftype))
+
+    def disconnect(self, source, target, reftype):
+        self.references.discard((source, target, reftype))
+
+    def sources(self, obj, reftype):
+        for source, target, rt in self.references:
+            if target is obj and rt is reftype:
+                yield source
+
+    def sourceids(self, obj, reftype):
+        return set(id(source) for source in self.sources(obj, reftype))
+
+    def object_for(self, oid):
+        return self.objects.get(oid)
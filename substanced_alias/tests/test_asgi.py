@@ -0,0 +1,155 @@
+import asyncio
+import unittest
+from . import DummyFolder
+from .test_counters import DummyDB
+from .test_redirectmap import DummyObjectMap
+
+def _makeRoot():
+    root = DummyFolder(__oid__=1)
+    root.__objectmap__ = DummyObjectMap({
+        1: ('',),
+        2: ('', 'target'),
+        3: ('', 'NEAT'),
+        4: ('', 'cached'),
+        })
+    root.__alias_redirect_index__ = {
+        3: (2, (('p', '1'),), None, None, None, 'passthrough'),
+        4: (2, (), None, 301, 60),
+        }
+    return root
+
+class TestRedirectSnapshot(unittest.TestCase):
+    def _makeOne(self, root):
+        from ..asgi import RedirectSnapshot
+        return RedirectSnapshot(DummyDB(root), 1)
+
+    def test_refresh(self):
+        inst = self._makeOne(_makeRoot())
+        self.assertTrue(inst.refresh())
+        self.assertEqual(inst.get('/NEAT/'),
+                         ('/target/?p=1', None, None, 'passthrough'))
+        self.assertEqual(inst.get('/cached'), ('/target/', 301, 60, None))
+        self.assertEqual(inst.get('/other'), None)
+        self.assertTrue(inst.db.conn.closed)
+
+    def test_refresh_unchanged_generation(self):
+        from BTrees.Length import Length
+        root = _makeRoot()
+        inst = self._makeOne(root)
+        inst.refresh()
+        del root.__alias_redirect_index__[3]
+        self.assertFalse(inst.refresh())
+        self.assertNotEqual(inst.get('/NEAT'), None)
+        root.__alias_table_generation__ = Length(1)
+        self.assertTrue(inst.refresh())
+        self.assertEqual(inst.get('/NEAT'), None)
+
+    def test_refresh_without_index(self):
+        root = _makeRoot()
+        del root.__alias_redirect_index__
+        inst = self._makeOne(root)
+        inst.refresh()
+        self.assertEqual(inst.redirects, {})
+
+
+class TestAliasRedirectApp(unittest.TestCase):
+    def _makeOne(self, app=None, **kw):
+        from ..asgi import (
+            AliasRedirectApp,
+            RedirectSnapshot,
+            )
+        snapshot = RedirectSnapshot(DummyDB(_makeRoot()), 1)
+        return AliasRedirectApp(snapshot, app, **kw)
+
+    def _call(self, app, path, method='GET', query_string=b''):
+        scope = {'type': 'http', 'method': method, 'path': path,
+                 'query_string': query_string,
+                 'scheme': 'https', 'root_path': '',
+                 'headers': [(b'host', b'example.com')]}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request'}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(app(scope, receive, send))
+        return messages
+
+    def test_redirect(self):
+        start, body = self._call(self._makeOne(), '/NEAT')
+        self.assertEqual(start['status'], 302)
+        headers = dict(start['headers'])
+        self.assertEqual(headers[b'location'],
+                         b'https://example.com/target/?p=1')
+        self.assertFalse(b'cache-control' in headers)
+        self.assertEqual(body['body'], b'')
+
+    def test_redirect_query_mode(self):
+        start, body = self._call(self._makeOne(), '/NEAT', 'GET', b'q=%20')
+        self.assertEqual(dict(start['headers'])[b'location'],
+                         b'https://example.com/target/?p=1&q=%20')
+        start, body = self._call(self._makeOne(), '/cached', 'GET', b'q=1')
+        self.assertEqual(dict(start['headers'])[b'location'],
+                         b'https://example.com/target/')
+
+    def test_redirect_policy(self):
+        start, body = self._call(self._makeOne(status=308, max_age=10),
+                                 '/cached/', 'HEAD')
+        self.assertEqual(start['status'], 301)
+        self.assertEqual(dict(start['headers'])[b'cache-control'],
+                         b'public, max-age=60')
+        start, body = self._call(self._makeOne(status=308, max_age=10),
+                                 '/NEAT')
+        self.assertEqual(start['status'], 308)
+        self.assertEqual(dict(start['headers'])[b'cache-control'],
+                         b'public, max-age=10')
+
+    def test_miss_without_app(self):
+        start, body = self._call(self._makeOne(), '/other')
+        self.assertEqual(start['status'], 404)
+
+    def test_miss_and_post_passed_to_app(self):
+        calls = []
+
+        async def app(scope, receive, send):
+            calls.append(scope['path'])
+
+        inst = self._makeOne(app)
+        self._call(inst, '/other')
+        self._call(inst, '/NEAT', 'POST')
+        self.assertEqual(calls, ['/other', '/NEAT'])
+
+    def test_lifespan(self):
+        inst = self._makeOne()
+        incoming = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return incoming.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(inst({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
+        self.assertEqual(inst.snapshot.generation, 0)
+
+
+class Test_base_url(unittest.TestCase):
+    def _callFUT(self, scope):
+        from ..asgi import base_url
+        return base_url(scope)
+
+    def test_host_header(self):
+        self.assertEqual(self._callFUT({
+            'scheme': 'https', 'root_path': '/site',
+            'headers': [(b'host', b'example.com:8443')]}),
+            'https://example.com:8443/site')
+
+    def test_server(self):
+        self.assertEqual(self._callFUT({'server': ('10.0.0.1', 8080)}),
+                         'http://10.0.0.1:8080')
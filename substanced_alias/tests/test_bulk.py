@@ -0,0 +1,276 @@
+import unittest
+from pyramid import testing
+from . import DummyFolder
+
+class Test_parse_query(unittest.TestCase):
+    def _callFUT(self, value):
+        from ..bulk import parse_query
+        return parse_query(value)
+
+    def test_empty(self):
+        self.assertEqual(self._callFUT(''), None)
+        self.assertEqual(self._callFUT(None), None)
+
+    def test_string(self):
+        self.assertEqual(self._callFUT('a=1&b'), ['a=1', 'b'])
+
+    def test_list(self):
+        self.assertEqual(self._callFUT(('a=1',)), ['a=1'])
+
+class TestReadWrite(unittest.TestCase):
+    rows = [
+        {'name': 'a', 'resource': '/x/', 'query': ['one=1', 'two=2'],
+         'anchor': 'top', 'container': '/'},
+        {'name': 'b', 'resource': '/y/', 'query': None, 'anchor': None,
+         'container': '/f/'},
+        ]
+
+    def test_csv_roundtrip(self):
+        from io import StringIO
+        from ..bulk import (
+            read_csv,
+            write_csv,
+            )
+        stream = StringIO()
+        write_csv(self.rows, stream)
+        stream.seek(0)
+        result = list(read_csv(stream))
+        self.assertEqual(result[0]['query'], 'one=1&two=2')
+        self.assertEqual(result[0]['anchor'], 'top')
+        self.assertEqual(result[1]['query'], '')
+        self.assertEqual(result[1]['container'], '/f/')
+
+    def test_jsonl_roundtrip(self):
+        from io import StringIO
+        from ..bulk import (
+            read_jsonl,
+            write_jsonl,
+            )
+        stream = StringIO()
+        write_jsonl(self.rows, stream)
+        stream.write('\n')
+        stream.seek(0)
+        self.assertEqual(list(read_jsonl(stream)), self.rows)
+
+class Test_validate_row(unittest.TestCase):
+    def _callFUT(self, root, row):
+        from ..bulk import validate_row
+        return validate_row(root, row)
+
+    def _makeRoot(self):
+        root = DummyFolder()
+        root['f'] = DummyFolder()
+        root['target'] = testing.DummyResource()
+        return root
+
+    def test_valid(self):
+        root = self._makeRoot()
+        row = {'name': 'a', 'resource': 'target', 'container': 'f'}
+        self.assertEqual(self._callFUT(root, row), root['f'])
+
+    def test_root_container(self):
+        root = self._makeRoot()
+        row = {'name': 'a', 'resource': 'target', 'container': ''}
+        self.assertEqual(self._callFUT(root, row), root)
+
+    def test_name_taken(self):
+        import colander
+        root = self._makeRoot()
+        row = {'name': 'f', 'resource': 'target', 'container': ''}
+        self.assertRaises(colander.Invalid, self._callFUT, root, row)
+
+    def test_bad_resource(self):
+        import colander
+        root = self._makeRoot()
+        row = {'name': 'a', 'resource': 'missing', 'container': ''}
+        self.assertRaises(colander.Invalid, self._callFUT, root, row)
+
+    def test_bad_container(self):
+        root = self._makeRoot()
+        row = {'name': 'a', 'resource': 'target', 'container': 'missing'}
+        self.assertRaises(KeyError, self._callFUT, root, row)
+
+class Test_check_batch_names(unittest.TestCase):
+    def test_it(self):
+        from ..bulk import check_batch_names
+        root = DummyFolder()
+        root['f'] = DummyFolder()
+        root['f']['taken'] = testing.DummyResource()
+        rows = [{'name': 'taken', 'container': 'f'},
+                {'name': 'taken', 'container': ''},
+                {'name': 'x', 'container': 'missing'}]
+        targets = {'f': root['f'], '': root, 'missing': None}
+        self.assertEqual(check_batch_names(rows, targets),
+                         {('f', 'taken'): 'taken'})
+
+class Test_import_aliases(unittest.TestCase):
+    def _callFUT(self, root, rows, **kw):
+        from ..bulk import import_aliases
+        return import_aliases(root, rows, DummyRegistry(), **kw)
+
+    def _makeRoot(self):
+        root = DummyFolder()
+        root['f'] = DummyFolder()
+        root['target'] = testing.DummyResource()
+        return root
+
+    def test_it(self):
+        root = self._makeRoot()
+        txn = DummyTransaction()
+        rows = [
+            {'name': 'a', 'resource': 'target', 'query': 'one=1',
+             'anchor': '', 'container': 'f'},
+            {'name': 'b', 'resource': '/target', 'container': ''},
+            ]
+        created, errors = self._callFUT(root, rows, txn=txn)
+        self.assertEqual((created, errors), (2, []))
+        self.assertEqual(root['f']['a'].resource, root['target'])
+        self.assertEqual(root['f']['a'].query, ['one=1'])
+        self.assertEqual(root['f']['a'].anchor, None)
+        self.assertEqual(root['b'].query, None)
+        self.assertEqual(txn.commits, 1)
+
+    def test_errors_skipped(self):
+        root = self._makeRoot()
+        rows = [
+            {'name': 'a', 'resource': 'missing', 'container': ''},
+            {'name': 'a', 'resource': 'target', 'container': 'missing'},
+            {'name': 'a', 'resource': 'target', 'container': ''},
+            {'name': 'a', 'resource': 'target', 'container': ''},
+            ]
+        created, errors = self._callFUT(root, rows, txn=DummyTransaction())
+        self.assertEqual(created, 1)
+        self.assertEqual([lineno for lineno, msg in errors], [1, 2, 4])
+        self.assertEqual(errors[0][1], 'Resource not found')
+        self.assertEqual(errors[1][1], 'Container not found')
+
+    def test_malformed_rows_skipped(self):
+        root = self._makeRoot()
+        rows = [
+            {'resource': 'target'},
+            {'name': 'a', 'container': ''},
+            {'name': None, 'resource': 'target'},
+            {'name': 'a', 'resource': 7},
+            {'name': 'a', 'resource': 'target', 'container': ['f']},
+            ['a', 'target'],
+            {'name': 'a', 'resource': 'target'},
+            ]
+        created, errors = self._callFUT(root, rows, txn=DummyTransaction())
+        self.assertEqual(created, 1)
+        self.assertEqual(errors, [
+            (1, 'Missing name'),
+            (2, 'Missing resource'),
+            (3, 'Missing name'),
+            (4, 'Invalid resource'),
+            (5, 'Invalid container'),
+            (6, 'Not a row of fields'),
+            ])
+
+    def test_batches(self):
+        root = self._makeRoot()
+        root._p_jar = DummyJar()
+        txn = DummyTransaction()
+        rows = [{'name': 'a%s' % i, 'resource': 'target', 'container': ''}
+                for i in range(7)]
+        self._callFUT(root, rows, txn=txn, commit_size=4, savepoint_size=2)
+        self.assertEqual(txn.commits, 2)
+        self.assertEqual(txn.savepoints, 3)
+        self.assertEqual(root._p_jar.minimized, 1)
+
+    def test_target_is_container(self):
+        root = self._makeRoot()
+        rows = [{'name': 'a', 'resource': '/f', 'container': '/f/'}]
+        created, errors = self._callFUT(root, rows, txn=DummyTransaction())
+        self.assertEqual((created, errors), (1, []))
+        self.assertEqual(root['f']['a'].resource, root['f'])
+
+    def test_duplicate_names_in_batch(self):
+        root = self._makeRoot()
+        rows = [{'name': 'a', 'resource': 'target', 'container': ''}] * 2
+        created, errors = self._callFUT(root, rows, txn=DummyTransaction())
+        self.assertEqual(created, 1)
+        self.assertEqual([lineno for lineno, msg in errors], [2])
+
+    def test_no_commit(self):
+        root = self._makeRoot()
+        txn = DummyTransaction()
+        rows = [{'name': 'a', 'resource': 'target', 'container': ''}]
+        self._callFUT(root, rows, txn=txn, commit_size=None)
+        self.assertEqual(txn.commits, 0)
+
+    def test_alias_folder_container(self):
+        from ..folder import AliasFolder
+        root = self._makeRoot()
+        root['af'] = AliasFolder()
+        root['target'].__oid__ = 1
+        rows = [
+            {'name': 'a', 'resource': 'target', 'query': 'one=1',
+             'anchor': 'top', 'container': 'af'},
+            {'name': 'a', 'resource': 'target', 'container': 'af'},
+            ]
+        created, errors = self._callFUT(root, rows, txn=DummyTransaction())
+        self.assertEqual(created, 1)
+        self.assertEqual([lineno for lineno, msg in errors], [2])
+        self.assertEqual(root['af'].aliases['a'], (1, (('one', '1'),), 'top'))
+        self.assertEqual(len(root['af']), 0)
+
+class Test_export_aliases(unittest.TestCase):
+    def test_it(self):
+        from .. import Alias
+        from ..bulk import export_aliases
+        root = DummyFolder()
+        root['f'] = DummyFolder()
+        root['target'] = testing.DummyResource()
+        root['f']['a'] = Alias('a', root['target'], ['one=1'], 'top')
+        self.assertEqual(list(export_aliases(root)), [
+            {'name': 'a', 'resource': '/target', 'query': ['one=1'],
+             'anchor': 'top', 'container': '/f'},
+            ])
+
+    def test_alias_folder_entries(self):
+        from ..folder import AliasFolder
+        from ..bulk import export_aliases
+        root = DummyFolder()
+        root.__objectmap__ = DummyObjectMap({1: ('', 'a b')})
+        root['af'] = AliasFolder()
+        root['af'].add_alias('x', testing.DummyResource(__oid__=1),
+                             ['one=1'], 'top')
+        root['af'].add_alias('y', testing.DummyResource(__oid__=1))
+        root['af'].add_alias('z', testing.DummyResource(__oid__=2))
+        self.assertEqual(list(export_aliases(root)), [
+            {'name': 'x', 'resource': '/a%20b', 'query': ['one=1'],
+             'anchor': 'top', 'container': '/af'},
+            {'name': 'y', 'resource': '/a%20b', 'query': None,
+             'anchor': None, 'container': '/af'},
+            ])
+
+class DummyObjectMap(object):
+    def __init__(self, paths):
+        self.paths = paths
+
+    def path_for(self, oid):
+        return self.paths.get(oid)
+
+class DummyContentRegistry(object):
+    def create(self, iface, *arg, **kw):
+        from .. import Alias
+        return Alias(*arg, **kw)
+
+class DummyRegistry(object):
+    content = DummyContentRegistry()
+
+class DummyTransaction(object):
+    commits = 0
+    savepoints = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def savepoint(self, optimistic=False):
+        self.savepoints += 1
+
+class DummyJar(object):
+    minimized = 0
+
+    def cacheMinimize(self):
+        self.minimized += 1
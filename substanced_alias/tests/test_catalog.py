@@ -0,0 +1,204 @@
+import unittest
+from pyramid import testing
+from zope.interface import alsoProvides
+from . import DummyFolder
+
+class TestAliasIndexViews(unittest.TestCase):
+    def _makeOne(self, alias):
+        from ..catalog import AliasIndexViews
+        return AliasIndexViews(alias)
+
+    def _makeAlias(self, **kw):
+        from .. import Alias
+        root = DummyFolder()
+        root['blog'] = DummyFolder()
+        root['blog']['post'] = testing.DummyResource()
+        root['promo-1'] = Alias('promo-1', root['blog']['post'], **kw)
+        return root['promo-1']
+
+    def test_alias_name(self):
+        inst = self._makeOne(self._makeAlias())
+        self.assertEqual(inst.alias_name(None), 'promo-1')
+        inst = self._makeOne(testing.DummyResource())
+        self.assertEqual(inst.alias_name(None), None)
+
+    def test_target_path(self):
+        alias = self._makeAlias()
+        self.assertEqual(self._makeOne(alias).target_path(None), '/blog/post')
+        alias.dangling = True
+        self.assertEqual(self._makeOne(alias).target_path(None), '')
+
+    def test_target_path_objectmap(self):
+        alias = self._makeAlias()
+        alias.__parent__.__objectmap__ = DummyTargetMap({1: ('', 'moved')})
+        self.assertEqual(self._makeOne(alias).target_path(None), '/moved')
+
+    def test_query_keys(self):
+        inst = self._makeOne(self._makeAlias(query=['a=1', 'b', 'a=2']))
+        self.assertEqual(inst.query_keys(None), ['a', 'b', 'a'])
+        inst = self._makeOne(self._makeAlias())
+        self.assertEqual(inst.query_keys(None), None)
+
+    def test_anchor(self):
+        inst = self._makeOne(self._makeAlias(anchor='top'))
+        self.assertEqual(inst.anchor(None), 'top')
+        inst = self._makeOne(self._makeAlias())
+        self.assertEqual(inst.anchor(None), None)
+
+
+class Test_add_alias_catalog(unittest.TestCase):
+    def setUp(self):
+        from .. import catalog
+        self.config = testing.setUp()
+        for name in ('substanced.content', 'substanced.property',
+                     'substanced.evolution', 'substanced.catalog'):
+            self.config.include(name)
+        self.config.scan(catalog)
+        self.config.commit()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _callFUT(self, root, **kw):
+        from ..catalog import add_alias_catalog
+        self.txn = DummyTransaction()
+        return add_alias_catalog(root, txn=self.txn, **kw)
+
+    def _makeRoot(self):
+        from substanced.catalog import CatalogsService
+        from substanced.objectmap import ObjectMap
+        from .. import Alias
+        root = DummyFolder()
+        objectmap = root.__objectmap__ = ObjectMap(root)
+        objectmap.add(root, ('',))
+        root['blog'] = DummyFolder()
+        objectmap.add(root['blog'], ('', 'blog'))
+        for name in ('a', 'b', 'c'):
+            root[name] = Alias(name, root['blog'])
+            objectmap.add(root[name], ('', name))
+        root['catalogs'] = CatalogsService()
+        objectmap.add(root['catalogs'], ('', 'catalogs'))
+        return root
+
+    def test_existing_aliases_indexed(self):
+        from ..catalog import search_aliases
+        root = self._makeRoot()
+        self._callFUT(root, batch_size=2)
+        catalog = root['catalogs']['alias']
+        result = search_aliases(catalog, target='/blog')
+        self.assertEqual(sorted(result.ids),
+                         sorted(root[name].__oid__ for name in 'abc'))
+        self.assertEqual(self.txn.savepoints, 1)
+
+    def test_already_added(self):
+        root = self._makeRoot()
+        self._callFUT(root)
+        catalog = root['catalogs']['alias']
+        self._callFUT(root)
+        self.assertTrue(root['catalogs']['alias'] is catalog)
+
+
+class Test_reindex_alias_targets(unittest.TestCase):
+    def test_it(self):
+        from substanced.interfaces import IService
+        from ..catalog import reindex_alias_targets
+        root = DummyFolder()
+        catalogs = DummyFolder(__is_service__=True)
+        alsoProvides(catalogs, IService)
+        catalogs['alias'] = DummyCatalog()
+        root['catalogs'] = catalogs
+        root['alias'] = DummyAlias()
+        root['moved'] = DummyFolder()
+        root.__objectmap__ = DummyTargetMap({}, sources={3: [1]},
+                                            objects={1: root['alias']},
+                                            subtree=[2, 3])
+        reindex_alias_targets(root['moved'])
+        self.assertEqual(catalogs['alias'].reindexed, [(root['alias'], 1)])
+        self.assertEqual(root['alias'].refreshed, 1)
+
+    def test_without_catalog(self):
+        from ..catalog import reindex_alias_targets
+        root = DummyFolder()
+        root['alias'] = DummyAlias()
+        root['moved'] = DummyFolder()
+        root.__objectmap__ = DummyTargetMap({}, sources={3: [1, 4]},
+                                            objects={1: root['alias']},
+                                            subtree=[2, 3])
+        reindex_alias_targets(root['moved'])
+        self.assertEqual(root['alias'].refreshed, 1)
+
+
+class Test_search_aliases(unittest.TestCase):
+    def _makeCatalog(self, docs):
+        from hypatia.field import FieldIndex
+        from hypatia.keyword import KeywordIndex
+        catalog = {
+            'alias_name': FieldIndex(lambda doc, default: doc[0]),
+            'target_path': FieldIndex(lambda doc, default: doc[1]),
+            'query_keys': KeywordIndex(lambda doc, default: doc[2] or default),
+            }
+        for docid, doc in enumerate(docs):
+            for index in catalog.values():
+                index.index_doc(docid, doc)
+        return catalog
+
+    def _callFUT(self, catalog, **kw):
+        from ..catalog import search_aliases
+        return sorted(search_aliases(catalog, **kw).ids)
+
+    def test_it(self):
+        catalog = self._makeCatalog([
+            ('promo-1', '/blog/a', ['utm']),
+            ('promo-2', '/shop', []),
+            ('other', '/blog', ['utm', 'page']),
+            ('promo', '/blogger', []),
+            ])
+        self.assertEqual(self._callFUT(catalog), [0, 1, 2, 3])
+        self.assertEqual(self._callFUT(catalog, name='promo-'), [0, 1])
+        self.assertEqual(self._callFUT(catalog, target='/blog/'), [0])
+        self.assertEqual(self._callFUT(catalog, target='/blog'), [0, 2, 3])
+        self.assertEqual(self._callFUT(catalog, name='promo', query_key='utm'),
+                         [0])
+
+
+class DummyTargetMap(object):
+    def __init__(self, paths, sources=None, objects=None, subtree=()):
+        self.paths = paths
+        self.sources = sources or {}
+        self.objects = objects or {}
+        self.subtree = subtree
+
+    def targetids(self, obj, reftype):
+        return set(self.paths)
+
+    def path_for(self, oid):
+        return self.paths.get(oid)
+
+    def pathlookup(self, obj):
+        return self.subtree
+
+    def sourceids(self, oid, reftype):
+        return self.sources.get(oid, ())
+
+    def object_for(self, oid):
+        return self.objects.get(oid)
+
+class DummyTransaction(object):
+    savepoints = 0
+
+    def savepoint(self, optimistic=False):
+        self.savepoints += 1
+
+class DummyCatalog(DummyFolder):
+    def __init__(self):
+        DummyFolder.__init__(self)
+        self.reindexed = []
+
+    def reindex_resource(self, resource, oid=None):
+        self.reindexed.append((resource, oid))
+
+class DummyAlias(testing.DummyResource):
+    refreshed = 0
+
+    def refresh_location(self):
+        self.refreshed += 1
@@ -0,0 +1,163 @@
+import unittest
+from pyramid import testing
+from . import DummyFolder
+
+class TestHitCounter(unittest.TestCase):
+    def _makeOne(self, **kw):
+        from ..counters import HitCounter
+        return HitCounter(**kw)
+
+    def test_hit_and_drain(self):
+        inst = self._makeOne(stripes=2)
+        inst.hit('/a')
+        inst.hit('/a')
+        inst.hit('/b', 5)
+        self.assertEqual(inst.drain(), {'/a': 2, '/b': 5})
+        self.assertEqual(inst.drain(), {})
+
+    def test_flush(self):
+        from ..counters import get_hits
+        inst = self._makeOne()
+        root = DummyFolder()
+        db = DummyDB(root)
+        inst.hit('/a')
+        inst.flush(db, 'rootoid')
+        inst.hit('/a', 2)
+        inst.flush(db, 'rootoid')
+        self.assertEqual(get_hits(root, '/a'), 3)
+        self.assertTrue(db.conn.closed)
+
+    def test_flush_nothing(self):
+        inst = self._makeOne()
+        db = DummyDB(DummyFolder())
+        inst.flush(db, 'rootoid')
+        self.assertEqual(db.conn, None)
+
+    def test_flush_conflicts_put_back(self):
+        inst = self._makeOne(retries=2)
+        root = ConflictingRoot(2)
+        db = DummyDB(root)
+        inst.hit('/a')
+        inst.flush(db, 'rootoid')
+        self.assertEqual(inst.drain(), {'/a': 1})
+        self.assertEqual(root.conflicts, 0)
+
+    def test_flush_conflict_retried(self):
+        from ..counters import get_hits
+        inst = self._makeOne(retries=2)
+        root = ConflictingRoot(1)
+        db = DummyDB(root)
+        inst.hit('/a')
+        inst.flush(db, 'rootoid')
+        self.assertEqual(get_hits(root, '/a'), 1)
+
+    def test_maybe_flush_not_due(self):
+        inst = self._makeOne(interval=1000)
+        db = DummyDB(DummyFolder())
+        inst.hit('/a')
+        inst.maybe_flush(db, 'rootoid')
+        self.assertEqual(db.conn, None)
+
+    def test_maybe_flush_due(self):
+        from ..counters import get_hits
+        inst = self._makeOne(interval=0)
+        root = DummyFolder()
+        db = DummyDB(root)
+        inst.hit('/a')
+        inst.maybe_flush(db, 'rootoid')
+        with inst._flushing:
+            pass
+        self.assertEqual(get_hits(root, '/a'), 1)
+
+    def test_maybe_flush_already_flushing(self):
+        inst = self._makeOne(interval=0)
+        db = DummyDB(DummyFolder())
+        inst._flushing.acquire()
+        inst.maybe_flush(db, 'rootoid')
+        self.assertEqual(db.conn, None)
+
+class Test_hits_queries(unittest.TestCase):
+    def _makeRoot(self):
+        from ..counters import add_hits
+        root = DummyFolder()
+        add_hits(root, {'/a': 3, '/b': 10, '/c': 1})
+        return root
+
+    def test_iter_hits(self):
+        from ..counters import iter_hits
+        self.assertEqual(list(iter_hits(self._makeRoot())),
+                         [('/a', 3), ('/b', 10), ('/c', 1)])
+        self.assertEqual(list(iter_hits(DummyFolder())), [])
+
+    def test_get_hits(self):
+        from ..counters import get_hits
+        root = self._makeRoot()
+        self.assertEqual(get_hits(root, '/b/'), 10)
+        self.assertEqual(get_hits(root, '/missing'), 0)
+        self.assertEqual(get_hits(DummyFolder(), '/a'), 0)
+
+    def test_top_hits(self):
+        from ..counters import top_hits
+        self.assertEqual(top_hits(self._makeRoot(), 2),
+                         [('/b', 10), ('/a', 3)])
+
+class Test_count_hit(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def test_disabled(self):
+        from ..counters import count_hit
+        request = testing.DummyRequest(path='/NEAT')
+        self.assertEqual(count_hit(request), None)
+
+    def test_enabled(self):
+        from ..counters import (
+            HitCounter,
+            IAliasHitCounter,
+            count_hit,
+            )
+        counter = HitCounter(interval=1000)
+        self.config.registry.registerUtility(counter, IAliasHitCounter)
+        request = testing.DummyRequest(path='/NEAT/')
+        request.root = DummyFolder()
+        count_hit(request)
+        self.assertEqual(counter.drain(), {'/NEAT': 1})
+
+class ConflictingRoot(object):
+    """ A root raising ``ConflictError`` the first ``conflicts`` times its
+    hits are looked up.
+    """
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+
+    def __getattr__(self, name):
+        from ZODB.POSException import ConflictError
+        if name.startswith('__alias') and self.conflicts:
+            self.conflicts -= 1
+            raise ConflictError()
+        raise AttributeError(name)
+
+class DummyConnection(object):
+    closed = False
+
+    def __init__(self, root):
+        self.root = root
+
+    def get(self, oid):
+        return self.root
+
+    def close(self):
+        self.closed = True
+
+class DummyDB(object):
+    conn = None
+
+    def __init__(self, root):
+        self.root = root
+
+    def open(self, transaction_manager=None):
+        self.conn = DummyConnection(self.root)
+        return self.conn
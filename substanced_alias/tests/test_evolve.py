@@ -0,0 +1,41 @@
+import unittest
+from pyramid import testing
+from . import DummyFolder
+
+class Test_compact_alias_storage(unittest.TestCase):
+    def _callFUT(self, root, txn):
+        from ..evolve import compact_alias_storage
+        return compact_alias_storage(root, None, txn=txn)
+
+    def test_it(self):
+        from .. import Alias
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        alias = Alias('a', root['target'])
+        alias.__setstate__({'name': 'a', 'resource': root['target'],
+                            'anchor': None, 'query': ['one=1'],
+                            '_querydict': {'one': '1'}})
+        root['a'] = alias
+        txn = DummyTransaction()
+        self._callFUT(root, txn)
+        self.assertEqual(alias._location, '/target/?one=1')
+        self.assertEqual(alias._query, (('one', '1'),))
+        self.assertFalse('query' in alias.__getstate__())
+        self.assertFalse('_querydict' in alias.__getstate__())
+        self.assertEqual(txn.savepoints, 0)
+
+    def test_savepoints(self):
+        from .. import Alias
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        for i in range(1000):
+            root['a%s' % i] = Alias('a%s' % i, root['target'])
+        txn = DummyTransaction()
+        self._callFUT(root, txn)
+        self.assertEqual(txn.savepoints, 1)
+
+class DummyTransaction(object):
+    savepoints = 0
+
+    def savepoint(self, optimistic=False):
+        self.savepoints += 1
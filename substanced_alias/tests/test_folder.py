@@ -0,0 +1,158 @@
+import unittest
+from pyramid import testing
+from zope.interface import alsoProvides
+
+class TestAliasFolder(unittest.TestCase):
+    def _makeOne(self):
+        from ..folder import AliasFolder
+        return AliasFolder()
+
+    def _makeResource(self, oid=1):
+        resource = testing.DummyResource()
+        resource.__oid__ = oid
+        return resource
+
+    def test_add_alias(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        inst = self._makeOne()
+        inst.add_alias('NEAT', self._makeResource(), ['page=7'], 'top')
+        self.assertEqual(inst.aliases['NEAT'], (1, (('page', '7'),), 'top'))
+        self.assertEqual(inst.num_aliases(), 1)
+        self.assertEqual(get_generation(inst, TABLE_GENERATION_ATTR), 1)
+        self.assertEqual(len(inst), 0)
+
+    def test_add_alias_name_taken(self):
+        inst = self._makeOne()
+        inst.add_alias('NEAT', self._makeResource())
+        self.assertRaises(KeyError, inst.add_alias, 'NEAT',
+                          self._makeResource())
+
+    def test_add_alias_child_name_taken(self):
+        inst = self._makeOne()
+        inst['child'] = testing.DummyResource()
+        self.assertRaises(KeyError, inst.add_alias, 'child',
+                          self._makeResource())
+
+    def test_add_child_alias_name_taken(self):
+        inst = self._makeOne()
+        inst.add_alias('NEAT', self._makeResource())
+        self.assertRaises(KeyError, inst.check_name, 'NEAT')
+
+    def test_retarget_alias(self):
+        inst = self._makeOne()
+        inst.add_alias('NEAT', self._makeResource())
+        resource = testing.DummyResource(__oid__=2)
+        inst.retarget_alias('NEAT', resource, ['a=1'], 'top')
+        self.assertEqual(inst.aliases['NEAT'], (2, (('a', '1'),), 'top'))
+        self.assertEqual(inst.num_aliases(), 1)
+        self.assertEqual(inst.alias_names_for([1]), [])
+        self.assertEqual(inst.alias_names_for([2]), ['NEAT'])
+        self.assertRaises(KeyError, inst.retarget_alias, 'missing', resource)
+
+    def test_remove_alias(self):
+        inst = self._makeOne()
+        inst.add_alias('NEAT', self._makeResource())
+        inst.remove_alias('NEAT')
+        self.assertEqual(inst.num_aliases(), 0)
+        self.assertEqual(len(inst.targets), 0)
+        self.assertRaises(KeyError, inst.remove_alias, 'NEAT')
+
+    def test_alias_names_for(self):
+        inst = self._makeOne()
+        inst.add_alias('b', self._makeResource(1))
+        inst.add_alias('a', self._makeResource(1))
+        inst.add_alias('c', self._makeResource(2))
+        inst.add_alias('d', self._makeResource(3))
+        self.assertEqual(inst.alias_names_for([1, 2, 4]), ['a', 'b', 'c'])
+
+    def test_getitem(self):
+        from .. import IAlias
+        inst = self._makeOne()
+        child = testing.DummyResource()
+        inst['child'] = child
+        inst.add_alias('NEAT', self._makeResource())
+        record = inst['NEAT']
+        self.assertTrue(IAlias.providedBy(record))
+        self.assertEqual(record.__name__, 'NEAT')
+        self.assertEqual(record.__parent__, inst)
+        self.assertEqual(inst['child'], child)
+        self.assertRaises(KeyError, inst.__getitem__, 'missing')
+
+    def test_get(self):
+        inst = self._makeOne()
+        child = testing.DummyResource()
+        inst['child'] = child
+        inst.add_alias('NEAT', self._makeResource())
+        self.assertEqual(inst.get('NEAT').oid, 1)
+        self.assertEqual(inst.get('child'), child)
+        self.assertEqual(inst.get('missing', 'default'), 'default')
+
+class TestAliasRecord(unittest.TestCase):
+    def _makeOne(self, oid=1, query=(), anchor=None):
+        from ..folder import AliasRecord
+        parent = testing.DummyResource()
+        parent.__objectmap__ = DummyObjectMap({1: ('', 'a b', 'c')})
+        return AliasRecord('NEAT', parent, oid, query, anchor)
+
+    def test_get_location(self):
+        inst = self._makeOne(query=(('page', '7'), ('page', '8')),
+                             anchor='top')
+        self.assertEqual(inst.get_location(), '/a%20b/c/?page=7&page=8#top')
+
+    def test_get_location_missing(self):
+        inst = self._makeOne(oid=2)
+        self.assertRaises(KeyError, inst.get_location)
+
+    def test_get_location_root(self):
+        inst = self._makeOne()
+        inst.__parent__.__objectmap__.paths[1] = ('',)
+        self.assertEqual(inst.get_location(), '/')
+
+    def test_redirect(self):
+        inst = self._makeOne()
+        resp = inst.redirect(testing.DummyRequest())
+        self.assertEqual(resp.location, 'http://example.com/a%20b/c/')
+
+    def test_redirect_target_removed(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        inst = self._makeOne(oid=2)
+        self.assertRaises(HTTPNotFound, inst.redirect, testing.DummyRequest())
+
+    def test_redirect_follows_chain(self):
+        inst = self._makeOne()
+        objectmap = inst.__parent__.__objectmap__
+        objectmap.alias_oids = (1,)
+        objectmap.object_for = lambda oid: DummyAlias()
+        resp = inst.redirect(testing.DummyRequest())
+        self.assertEqual(resp.location, 'http://example.com/final/')
+
+    def test_resource(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.resource, 'object 1')
+
+class DummyAlias(object):
+    resource = None
+
+    def __init__(self):
+        from .. import IAlias
+        alsoProvides(self, IAlias)
+
+    def generate_url(self, request):
+        return request.application_url + '/final/'
+
+class DummyObjectMap(object):
+    def __init__(self, paths, alias_oids=()):
+        self.paths = paths
+        self.alias_oids = alias_oids
+
+    def targetids(self, oid, reftype):
+        return set([oid]) if oid in self.alias_oids else set()
+
+    def path_for(self, oid):
+        return self.paths.get(oid)
+
+    def object_for(self, oid):
+        return 'object %s' % oid
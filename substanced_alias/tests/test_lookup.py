@@ -0,0 +1,300 @@
+import unittest
+from pyramid import testing
+from zope.interface import alsoProvides
+from . import DummyFolder
+
+class TestAliasTable(unittest.TestCase):
+    def _makeOne(self, size=3):
+        from ..lookup import AliasTable
+        return AliasTable(size)
+
+    def test_get_miss(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.get('/a', 0), None)
+
+    def test_set_get(self):
+        inst = self._makeOne()
+        inst.set('/a', 0, '/target/')
+        self.assertEqual(inst.get('/a', 0), '/target/')
+        self.assertEqual(len(inst), 1)
+
+    def test_new_generation_clears(self):
+        inst = self._makeOne()
+        inst.set('/a', 0, '/target/')
+        self.assertEqual(inst.get('/a', 1), None)
+        self.assertEqual(len(inst), 0)
+
+    def test_evicts_least_recently_used(self):
+        inst = self._makeOne(size=2)
+        inst.set('/a', 0, '/1/')
+        inst.set('/b', 0, '/2/')
+        inst.get('/a', 0)
+        inst.set('/c', 0, '/3/')
+        self.assertEqual(inst.get('/b', 0), None)
+        self.assertEqual(inst.get('/a', 0), '/1/')
+        self.assertEqual(inst.get('/c', 0), '/3/')
+
+    def test_set_existing(self):
+        inst = self._makeOne(size=2)
+        inst.set('/a', 0, '/1/')
+        inst.set('/a', 0, '/2/')
+        self.assertEqual(len(inst), 1)
+        self.assertEqual(inst.get('/a', 0), '/2/')
+
+    def test_clear(self):
+        inst = self._makeOne()
+        inst.set('/a', 0, '/1/')
+        inst.clear()
+        self.assertEqual(len(inst), 0)
+
+
+class TestMissTable(unittest.TestCase):
+    def _makeOne(self, size=2, ttl=10):
+        from ..lookup import MissTable
+        self.now = 100
+        return MissTable(size, ttl, clock=lambda: self.now)
+
+    def test_it(self):
+        inst = self._makeOne()
+        self.assertFalse(inst.is_miss('/a', 0))
+        inst.add('/a', 0)
+        self.assertTrue(inst.is_miss('/a', 0))
+        self.assertFalse(inst.is_miss('/a', 1))
+        self.assertFalse(inst.is_miss('/a', 0))
+
+    def test_expires(self):
+        inst = self._makeOne()
+        inst.add('/a', 0)
+        self.now = 110
+        self.assertFalse(inst.is_miss('/a', 0))
+        self.assertEqual(len(inst), 0)
+
+    def test_bounded(self):
+        inst = self._makeOne()
+        for path in ('/a', '/b', '/c'):
+            inst.add(path, 0)
+        self.assertEqual(len(inst), 2)
+        self.assertFalse(inst.is_miss('/a', 0))
+
+class Test_alias_tween_factory(unittest.TestCase):
+    def setUp(self):
+        from pyramid.interfaces import IRootFactory
+        self.config = testing.setUp()
+        self.root = DummyFolder()
+        root = self.root
+        self.config.registry.registerUtility(lambda request: root,
+                                             IRootFactory)
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, handler):
+        from ..lookup import alias_tween_factory
+        return alias_tween_factory(handler, self.config.registry)
+
+    def _makeRequest(self, path='/NEAT', method='GET'):
+        request = testing.DummyRequest(path=path)
+        request.method = method
+        request.registry = self.config.registry
+        request.view_name = ''
+        request.subpath = ()
+        return request
+
+    def _makeHandler(self):
+        from pyramid.httpexceptions import HTTPFound
+        calls = []
+        def handler(request):
+            calls.append(request)
+            request.context = DummyAlias()
+            return HTTPFound(location='http://example.com/target/')
+        handler.calls = calls
+        return handler
+
+    def test_miss_then_hit(self):
+        handler = self._makeHandler()
+        tween = self._makeOne(handler)
+        tween(self._makeRequest())
+        resp = tween(self._makeRequest())
+        self.assertEqual(len(handler.calls), 1)
+        self.assertEqual(resp.location, 'http://example.com/target/')
+
+    def test_hit_counted(self):
+        from ..counters import (
+            HitCounter,
+            IAliasHitCounter,
+            )
+        counter = HitCounter(interval=1000)
+        self.config.registry.registerUtility(counter, IAliasHitCounter)
+        tween = self._makeOne(self._makeHandler())
+        tween(self._makeRequest())
+        tween(self._makeRequest())
+        self.assertEqual(counter.drain(), {'/NEAT': 1})
+
+    def test_generation_change(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            bump_generation,
+            )
+        handler = self._makeHandler()
+        tween = self._makeOne(handler)
+        tween(self._makeRequest())
+        bump_generation(self.root, TABLE_GENERATION_ATTR)
+        tween(self._makeRequest())
+        self.assertEqual(len(handler.calls), 2)
+
+    def test_post_not_cached(self):
+        handler = self._makeHandler()
+        tween = self._makeOne(handler)
+        tween(self._makeRequest(method='POST'))
+        tween(self._makeRequest(method='POST'))
+        self.assertEqual(len(handler.calls), 2)
+        self.assertEqual(len(tween.table), 0)
+
+    def test_not_alias(self):
+        def handler(request):
+            request.context = testing.DummyResource()
+            return testing.DummyResource(status_int=200)
+        tween = self._makeOne(handler)
+        tween(self._makeRequest())
+        self.assertEqual(len(tween.table), 0)
+
+    def test_misses_not_kept_by_default(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        handler = lambda request: HTTPNotFound()
+        tween = self._makeOne(handler)
+        tween(self._makeRequest())
+        self.assertEqual(tween.misses, None)
+
+    def test_miss_cached(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        from .. import (
+            PATTERN_GENERATION_ATTR,
+            TABLE_GENERATION_ATTR,
+            bump_generation,
+            )
+        self.config.registry.settings['substanced_alias.miss_cache_size'] = 2
+        calls = []
+        def handler(request):
+            calls.append(request)
+            request.context = self.root
+            request.view_name = 'probe'
+            raise HTTPNotFound()
+        tween = self._makeOne(handler)
+        self.assertRaises(HTTPNotFound, tween, self._makeRequest('/probe'))
+        response = tween(self._makeRequest('/probe'))
+        self.assertEqual(response.status_int, 404)
+        self.assertEqual(len(calls), 1)
+        for name in (TABLE_GENERATION_ATTR, PATTERN_GENERATION_ATTR):
+            bump_generation(self.root, name)
+            self.assertRaises(HTTPNotFound, tween,
+                              self._makeRequest('/probe'))
+        self.assertEqual(len(calls), 3)
+
+    def test_miss_response_cached(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        self.config.registry.settings['substanced_alias.miss_cache_size'] = 2
+        not_found = HTTPNotFound()
+        def handler(request):
+            request.context = self.root
+            request.view_name = 'probe'
+            return not_found
+        tween = self._makeOne(handler)
+        self.assertTrue(tween(self._makeRequest('/probe')) is not_found)
+        self.assertFalse(tween(self._makeRequest('/probe')) is not_found)
+        self.assertTrue(tween.misses.is_miss('/probe', (0, 0)))
+
+    def test_miss_not_cached(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        from pyramid.interfaces import (
+            IRequest,
+            IView,
+            IViewClassifier,
+            )
+        from zope.interface import Interface
+        self.config.registry.settings['substanced_alias.miss_cache_size'] = 2
+        self.config.registry.registerAdapter(
+            lambda context, request: None,
+            (IViewClassifier, IRequest, Interface), IView, name='view')
+        def handler(request):
+            request.context = self.root
+            request.view_name = request.path_info.strip('/').split('/')[0]
+            request.subpath = tuple(request.path_info.split('/')[2:])
+            raise HTTPNotFound()
+        tween = self._makeOne(handler)
+        request = self._makeRequest('/probe')
+        request.query_string = 'a=1'
+        self.assertRaises(HTTPNotFound, tween, request)
+        for path in ('/view', '/probe/deeper'):
+            self.assertRaises(HTTPNotFound, tween, self._makeRequest(path))
+        self.assertEqual(len(tween.misses), 0)
+        def handler(request):
+            request.context = testing.DummyResource()
+            request.view_name = 'probe'
+            raise HTTPNotFound()
+        tween = self._makeOne(handler)
+        self.assertRaises(HTTPNotFound, tween, self._makeRequest('/probe'))
+        self.assertEqual(len(tween.misses), 0)
+
+    def test_status_and_headers_replayed(self):
+        from pyramid.httpexceptions import HTTPMovedPermanently
+        calls = []
+        def handler(request):
+            calls.append(request)
+            request.context = DummyAlias()
+            response = HTTPMovedPermanently(
+                location='http://example.com/target/')
+            response.cache_control.max_age = 60
+            response.etag = 'abc'
+            return response
+        tween = self._makeOne(handler)
+        tween(self._makeRequest())
+        resp = tween(self._makeRequest())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(resp.status_int, 301)
+        self.assertEqual(resp.location, 'http://example.com/target/')
+        self.assertEqual(resp.cache_control.max_age, 60)
+        self.assertEqual(resp.etag, 'abc')
+        self.assertTrue(resp.conditional_response)
+
+    def test_query_mode_replayed(self):
+        from pyramid.httpexceptions import HTTPFound
+        def handler(request):
+            request.context = DummyAlias()
+            request.context.query_mode = 'passthrough'
+            response = HTTPFound(location='http://example.com/target/?a=1')
+            response.etag = 'abc'
+            return response
+        tween = self._makeOne(handler)
+        request = self._makeRequest()
+        request.query_string = 'b=2'
+        tween(request)
+        self.assertEqual(len(tween.table), 0)
+        tween(self._makeRequest())
+        self.assertEqual(len(tween.table), 1)
+        request = self._makeRequest()
+        request.query_string = 'b=2'
+        resp = tween(request)
+        self.assertEqual(resp.location, 'http://example.com/target/?a=1&b=2')
+        self.assertEqual(resp.etag, None)
+        resp = tween(self._makeRequest())
+        self.assertEqual(resp.etag, 'abc')
+
+    def test_other_host_not_cached(self):
+        from pyramid.httpexceptions import HTTPFound
+        def handler(request):
+            request.context = DummyAlias()
+            return HTTPFound(location='http://example.org/target/')
+        tween = self._makeOne(handler)
+        tween(self._makeRequest())
+        self.assertEqual(len(tween.table), 0)
+
+    def test_size_setting(self):
+        self.config.registry.settings[
+            'substanced_alias.lookup_table_size'] = '5'
+        tween = self._makeOne(self._makeHandler())
+        self.assertEqual(tween.table.size, 5)
+
+class DummyAlias(object):
+    def __init__(self):
+        from .. import IAlias
+        alsoProvides(self, IAlias)
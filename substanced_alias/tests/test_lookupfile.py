@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pyramid import testing
+
+class Test_write_lookup_file(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'aliases.idx')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, rows):
+        from ..lookupfile import write_lookup_file
+        write_lookup_file(rows, self.filename)
+
+    def _makeOne(self):
+        from ..lookupfile import LookupFile
+        return LookupFile(self.filename, check_interval=0)
+
+    def test_round_trip(self):
+        rows = [('/b/c', '/target/?a=1', None, None, 'merge'),
+                ('/a', '/x/', 301, 0, None),
+                (u'/caf\xe9', u'/t/#caf\xe9', 308, 60, None)]
+        self._write(rows)
+        inst = self._makeOne()
+        self.assertEqual(inst.get('/a'), ('/x/', 301, 0, None))
+        self.assertEqual(inst.get('/b/c'),
+                         ('/target/?a=1', None, None, 'merge'))
+        self.assertEqual(inst.get(u'/caf\xe9'),
+                         (u'/t/#caf\xe9', 308, 60, None))
+
+    def test_miss(self):
+        self._write([('/%d' % i, '/t/', None, None, None)
+                     for i in range(50)])
+        inst = self._makeOne()
+        self.assertEqual(inst.get('/7'), ('/t/', None, None, None))
+        self.assertEqual(inst.get('/7a'), None)
+        self.assertEqual(inst.get('/0'), ('/t/', None, None, None))
+        self.assertEqual(inst.get('/'), None)
+        self.assertEqual(inst.get('/99'), None)
+
+    def test_trailing_slash(self):
+        self._write([('/a/', '/t/', None, None, None)])
+        inst = self._makeOne()
+        self.assertEqual(inst.get('/a'), ('/t/', None, None, None))
+        self.assertEqual(inst.get('/a/'), ('/t/', None, None, None))
+
+    def test_empty(self):
+        self._write([])
+        self.assertEqual(self._makeOne().get('/a'), None)
+
+    def test_missing_file(self):
+        self.assertEqual(self._makeOne().get('/a'), None)
+
+    def test_reloads_replaced_file(self):
+        self._write([('/a', '/1/', None, None, None)])
+        inst = self._makeOne()
+        self.assertEqual(inst.get('/a'), ('/1/', None, None, None))
+        self._write([('/a', '/2/', None, None, None),
+                     ('/b', '/3/', None, None, None)])
+        self.assertEqual(inst.get('/a'), ('/2/', None, None, None))
+        self.assertEqual(inst.get('/b'), ('/3/', None, None, None))
+        os.unlink(self.filename)
+        self.assertEqual(inst.get('/a'), None)
+
+    def test_not_a_lookup_file(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'x' * 20)
+        self.assertRaises(ValueError, self._makeOne().get, '/a')
+
+    def test_write_leaves_no_temporary_files(self):
+        self._write([('/a', '/1/', None, None, None)])
+        self.assertEqual(os.listdir(self.tmpdir), ['aliases.idx'])
+
+
+class Test_lookup_file_tween_factory(unittest.TestCase):
+    def setUp(self):
+        from ..lookupfile import write_lookup_file
+        self.tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(self.tmpdir, 'aliases.idx')
+        write_lookup_file([('/alias', '/target/', 301, 60, None),
+                           ('/utm', '/target/?a=1', None, None, 'override')],
+                          filename)
+        self.config = testing.setUp(settings={
+            'substanced_alias.lookup_file': filename})
+
+    def tearDown(self):
+        testing.tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def _makeOne(self, handler):
+        from ..lookupfile import lookup_file_tween_factory
+        return lookup_file_tween_factory(handler, self.config.registry)
+
+    def _makeRequest(self, path, **kw):
+        request = testing.DummyRequest(path=path, **kw)
+        request.registry = self.config.registry
+        return request
+
+    def test_hit(self):
+        def handler(request):
+            raise AssertionError('handler called')
+        tween = self._makeOne(handler)
+        response = tween(self._makeRequest('/alias/'))
+        self.assertEqual(response.status_int, 301)
+        self.assertEqual(response.location, 'http://example.com/target/')
+        self.assertEqual(response.cache_control.max_age, 60)
+
+    def test_hit_query_mode(self):
+        tween = self._makeOne(None)
+        request = self._makeRequest('/utm')
+        request.query_string = 'a=2&utm_source=x'
+        response = tween(request)
+        self.assertEqual(response.location,
+                         'http://example.com/target/?a=2&utm_source=x')
+
+    def test_miss(self):
+        response = object()
+        tween = self._makeOne(lambda request: response)
+        self.assertTrue(tween(self._makeRequest('/other')) is response)
+
+    def test_skips_post_and_virtual_roots(self):
+        response = object()
+        tween = self._makeOne(lambda request: response)
+        request = self._makeRequest('/alias')
+        request.method = 'POST'
+        self.assertTrue(tween(request) is response)
+        request = self._makeRequest('/alias',
+                                    environ={'HTTP_X_VHM_ROOT': '/site'})
+        self.assertTrue(tween(request) is response)
@@ -0,0 +1,344 @@
+import unittest
+from pyramid import testing
+from zope.interface import alsoProvides
+from . import DummyFolder
+
+class Test_flatten_aliases(unittest.TestCase):
+    def _callFUT(self, root, **kw):
+        from ..maintenance import flatten_aliases
+        return flatten_aliases(root, txn=DummyTransaction(), **kw)
+
+    def test_chain(self):
+        from .. import (
+            Alias,
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        root['c'] = Alias('c', root['target'], query=['a=1'], anchor='top')
+        root['b'] = Alias('b', root['c'])
+        root['a'] = Alias('a', root['b'])
+        flattened, cycles = self._callFUT(root)
+        self.assertEqual(flattened, 2)
+        self.assertEqual(cycles, [])
+        for name in ('a', 'b'):
+            self.assertEqual(root[name].resource, root['target'])
+            self.assertEqual(root[name].get_location(), '/target/?a=1#top')
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 1)
+
+    def test_cycle(self):
+        from .. import Alias
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        root['a'] = Alias('a', root['target'])
+        root['b'] = Alias('b', root['a'])
+        root['a'].resource = root['b']
+        flattened, cycles = self._callFUT(root)
+        self.assertEqual(flattened, 0)
+        self.assertEqual(sorted(cycles), ['/a', '/b'])
+
+    def test_dangling_last_alias(self):
+        from .. import Alias
+        root = DummyFolder()
+        removed = testing.DummyResource()
+        root['b'] = Alias('b', removed)
+        root['b'].dangling = True
+        root['a'] = Alias('a', root['b'])
+        self.assertEqual(self._callFUT(root), (0, []))
+        self.assertEqual(root['a'].resource, root['b'])
+        self.assertFalse(root['a'].dangling)
+
+    def test_nothing_to_do(self):
+        from .. import (
+            Alias,
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        root['a'] = Alias('a', root['target'])
+        self.assertEqual(self._callFUT(root), (0, []))
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 0)
+
+class Test_flatten_alias_folder(unittest.TestCase):
+    def _callFUT(self, folder):
+        from ..maintenance import flatten_alias_folder
+        return flatten_alias_folder(folder)
+
+    def test_it(self):
+        from .. import Alias
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        root['alias'] = Alias('alias', root['target'], query=['a=1'])
+        root.__objectmap__ = DummyObjectMap({1: root['target'],
+                                             2: root['alias']})
+        root['go'] = folder = DummyAliasFolder({
+            'direct': (1, (), None),
+            'chained': (2, (), None),
+            })
+        self.assertEqual(self._callFUT(folder), (1, []))
+        self.assertEqual(folder.retargeted,
+                         [('chained', root['target'], ['a=1'], None)])
+
+    def test_cycle(self):
+        from .. import Alias
+        root = DummyFolder()
+        root['target'] = testing.DummyResource()
+        root['a'] = Alias('a', root['target'])
+        root['b'] = Alias('b', root['a'])
+        root['a'].resource = root['b']
+        root.__objectmap__ = DummyObjectMap({1: root['a']})
+        root['go'] = folder = DummyAliasFolder({'x': (1, (), None)})
+        self.assertEqual(self._callFUT(folder), (0, ['/go/x']))
+        self.assertEqual(folder.retargeted, [])
+
+    def test_dangling_last_alias(self):
+        from .. import Alias
+        root = DummyFolder()
+        root['a'] = Alias('a', testing.DummyResource())
+        root['a'].dangling = True
+        root.__objectmap__ = DummyObjectMap({1: root['a']})
+        root['go'] = folder = DummyAliasFolder({'x': (1, (), None)})
+        self.assertEqual(self._callFUT(folder), (0, []))
+        self.assertEqual(folder.retargeted, [])
+
+class Test_clean_dangling_aliases(unittest.TestCase):
+    def _callFUT(self, root, action='report', **kw):
+        from ..maintenance import clean_dangling_aliases
+        self.txn = DummyTransaction()
+        return clean_dangling_aliases(root, action, txn=self.txn, **kw)
+
+    def _makeRoot(self):
+        from .. import Alias
+        root = RemovingFolder()
+        root['target'] = testing.DummyResource()
+        root['ok'] = Alias('ok', root['target'])
+        root['sub'] = RemovingFolder()
+        root['sub']['gone'] = Alias('gone', testing.DummyResource())
+        return root
+
+    def test_report(self):
+        root = self._makeRoot()
+        self.assertEqual(self._callFUT(root), ['/sub/gone'])
+        self.assertFalse(root['sub']['gone'].dangling)
+
+    def test_disable(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        root = self._makeRoot()
+        self.assertEqual(self._callFUT(root, 'disable', batch_size=1),
+                         ['/sub/gone'])
+        self.assertTrue(root['sub']['gone'].dangling)
+        self.assertFalse(root['ok'].dangling)
+        self.assertEqual(self.txn.savepoints, 1)
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 1)
+
+    def test_remove(self):
+        root = self._makeRoot()
+        self.assertEqual(self._callFUT(root, 'remove'), ['/sub/gone'])
+        self.assertFalse('gone' in root['sub'])
+        self.assertTrue('ok' in root)
+
+    def test_alias_folder_entries(self):
+        from ..folder import IAliasFolder
+        root = self._makeRoot()
+        root['target'].__oid__ = 1
+        root.__objectmap__ = DummyPathMap({1: ('', 'target')})
+        root['go'] = DummyAliasFolder({'ok': (1, (), None),
+                                       'gone': (2, (), None)})
+        root['go'].removed = []
+        root['go'].remove_alias = root['go'].removed.append
+        alsoProvides(root['go'], IAliasFolder)
+        self.assertEqual(sorted(self._callFUT(root, 'remove')),
+                         ['/go/gone', '/sub/gone'])
+        self.assertEqual(root['go'].removed, ['gone'])
+
+    def test_unknown_action(self):
+        self.assertRaises(ValueError, self._callFUT, DummyFolder(), 'delete')
+
+class Test_retarget_aliases(unittest.TestCase):
+    def _callFUT(self, root, old, new, **kw):
+        from ..maintenance import retarget_aliases
+        return retarget_aliases(root, old, new, txn=self.txn, **kw)
+
+    def setUp(self):
+        self.txn = DummyTransaction()
+
+    def _makeRoot(self):
+        from substanced.objectmap import ObjectMap
+        from .. import (
+            Alias,
+            connect_alias,
+            )
+        root = DummyFolder()
+        objectmap = root.__objectmap__ = ObjectMap(root)
+        objectmap.add(root, ('',))
+        for path in (('old',), ('old', 'a'), ('old', 'a', 'b'), ('old', 'c'),
+                     ('new',), ('new', 'a'), ('new', 'a', 'b'), ('other',),
+                     ('aliases',)):
+            parent = root
+            for name in path[:-1]:
+                parent = parent[name]
+            parent[path[-1]] = DummyFolder()
+            objectmap.add(parent[path[-1]], ('',) + path)
+        for name, target in (('x', root['old']['a']['b']),
+                             ('y', root['old']['c']),
+                             ('z', root['other'])):
+            alias = Alias(name, target, query=['q=1'])
+            root['aliases'][name] = alias
+            objectmap.add(alias, ('', 'aliases', name))
+            connect_alias(alias)
+        return root
+
+    def test_it(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        root = self._makeRoot()
+        progress = []
+        retargeted, missing = self._callFUT(
+            root, '/old/', '/new', commit_size=1,
+            progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual(retargeted, 1)
+        self.assertEqual(missing, [('/aliases/y', '/new/c')])
+        aliases = root['aliases']
+        self.assertTrue(aliases['x'].resource is root['new']['a']['b'])
+        self.assertEqual(aliases['x'].get_location(), '/new/a/b/?q=1')
+        self.assertTrue(aliases['y'].resource is root['old']['c'])
+        self.assertTrue(aliases['z'].resource is root['other'])
+        objectmap = root.__objectmap__
+        from ..maintenance import find_prefix_alias_oids
+        self.assertEqual(find_prefix_alias_oids(objectmap, ('', 'new')),
+                         [aliases['x'].__oid__])
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+        self.assertEqual(self.txn.commits, 3)
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 1)
+
+    def test_conflict_retried(self):
+        root = self._makeRoot()
+        self.txn.conflicts = 1
+        self._callFUT(root, '/old/a', '/new/a')
+        self.assertTrue(root['aliases']['x'].resource is
+                        root['new']['a']['b'])
+        self.assertEqual(self.txn.aborts, 1)
+        self.assertEqual(self.txn.commits, 2)
+
+    def test_conflict_without_commits(self):
+        from ZODB.POSException import ConflictError
+        root = self._makeRoot()
+        self.txn.savepoint_conflicts = 1
+        self.assertRaises(ConflictError, self._callFUT, root, '/old', '/new',
+                          commit_size=None)
+
+    def test_alias_folder_entries(self):
+        from ..folder import IAliasFolder
+        root = self._makeRoot()
+        objectmap = root.__objectmap__
+        old_b = root['old']['a']['b'].__oid__
+        other = root['other'].__oid__
+        root['go'] = DummyAliasFolder({'b': (old_b, (('q', '1'),), 'top'),
+                                       'o': (other, (), None)})
+        alsoProvides(root['go'], IAliasFolder)
+        retargeted, missing = self._callFUT(root, '/old', '/new',
+                                            commit_size=None)
+        self.assertEqual(retargeted, 2)
+        self.assertEqual(root['go'].retargeted,
+                         [('b', root['new']['a']['b'], ['q=1'], 'top')])
+        self.assertEqual(self.txn.commits, 0)
+
+    def test_alias_folder_entries_chunked(self):
+        from ..folder import IAliasFolder
+        root = self._makeRoot()
+        new_b = root['new']['a']['b'].__oid__
+        old_c = root['old']['c'].__oid__
+        root['go'] = DummyAliasFolder({'b': (new_b, (), None),
+                                       'c': (old_c, (), None),
+                                       'd': (new_b, (), None)})
+        alsoProvides(root['go'], IAliasFolder)
+        self.txn.conflicts = 1
+        retargeted, missing = self._callFUT(root, '/new/a', '/old/a',
+                                            commit_size=1)
+        self.assertEqual(retargeted, 2)
+        # the dummy transaction does not undo the aborted attempt
+        self.assertEqual([name for name, resource, query, anchor
+                          in root['go'].retargeted], ['b', 'b', 'd'])
+        self.assertTrue(root['go'].retargeted[0][1] is
+                        root['old']['a']['b'])
+        self.assertEqual(self.txn.aborts, 1)
+        self.assertEqual(self.txn.commits, 3)
+
+    def test_relative_prefix(self):
+        self.assertRaises(ValueError, self._callFUT, self._makeRoot(),
+                          'old', '/new')
+
+class RemovingFolder(DummyFolder):
+    def remove(self, name):
+        del self[name]
+
+class DummyPathMap(object):
+    def __init__(self, paths):
+        self.paths = paths
+
+    def path_for(self, oid):
+        return self.paths.get(oid)
+
+    def targetids(self, obj, reftype):
+        return set()
+
+class DummyAliasFolder(DummyFolder):
+    def __init__(self, aliases):
+        DummyFolder.__init__(self)
+        self.aliases = aliases
+        self.retargeted = []
+
+    def get_alias(self, name):
+        from ..folder import AliasRecord
+        return AliasRecord(name, self, *self.aliases[name])
+
+    def alias_names_for(self, oids):
+        return sorted(name for name, entry in self.aliases.items()
+                      if entry[0] in oids)
+
+    def retarget_alias(self, name, resource, query=None, anchor=None):
+        self.retargeted.append((name, resource, query, anchor))
+
+class DummyObjectMap(object):
+    def __init__(self, objects):
+        from .. import IAlias
+        self.objects = objects
+        self.alias_oids = set(oid for oid, obj in objects.items()
+                              if IAlias.providedBy(obj))
+
+    def targetids(self, oid, reftype):
+        return set([oid]) if oid in self.alias_oids else set()
+
+    def object_for(self, oid):
+        return self.objects.get(oid)
+
+class DummyTransaction(object):
+    savepoints = 0
+    commits = 0
+    aborts = 0
+    conflicts = 0
+    savepoint_conflicts = 0
+
+    def savepoint(self, optimistic=False):
+        from ZODB.POSException import ConflictError
+        if self.savepoint_conflicts:
+            self.savepoint_conflicts -= 1
+            raise ConflictError()
+        self.savepoints += 1
+
+    def commit(self):
+        from ZODB.POSException import ConflictError
+        if self.conflicts:
+            self.conflicts -= 1
+            raise ConflictError()
+        self.commits += 1
+
+    def abort(self):
+        self.aborts += 1
@@ -0,0 +1,169 @@
+import unittest
+from pyramid import testing
+from . import DummyFolder
+
+class Test_parse_pattern(unittest.TestCase):
+    def _callFUT(self, pattern):
+        from ..patterns import parse_pattern
+        return parse_pattern(pattern)
+
+    def test_it(self):
+        self.assertEqual(self._callFUT('/p/{id}/'), ('p', ('id',)))
+        self.assertEqual(self._callFUT('/old/*'), ('old', '*'))
+        self.assertEqual(self._callFUT('/'), ())
+
+    def test_malformed(self):
+        from ..patterns import PatternError
+        for pattern in ('p/{id}', '/*/a', '/p-{id}', '/{a}/{a}', '/a*'):
+            self.assertRaises(PatternError, self._callFUT, pattern)
+
+class Test_check_target(unittest.TestCase):
+    def _callFUT(self, pattern, target):
+        from ..patterns import (
+            check_target,
+            parse_pattern,
+            )
+        return check_target(parse_pattern(pattern), target)
+
+    def test_it(self):
+        from ..patterns import PatternError
+        self._callFUT('/p/{id}', '/products/{id}/?from=p')
+        self._callFUT('/old/*', '/new/*')
+        self.assertRaises(PatternError, self._callFUT, '/p/{id}', '/{slug}')
+        self.assertRaises(PatternError, self._callFUT, '/p/{id}', '/new/*')
+        self.assertRaises(PatternError, self._callFUT, '/p', 'products')
+
+class TestPatternMatcher(unittest.TestCase):
+    def _makeOne(self, patterns):
+        from ..patterns import PatternMatcher
+        return PatternMatcher(patterns)
+
+    def test_match(self):
+        inst = self._makeOne([
+            ('/p/{id}', ('/products/{id}', None, None)),
+            ('/p/special', ('/offers/', 301, None)),
+            ('/p/{id}/{page}', ('/products/{id}/{page}', None, 'merge')),
+            ('/old/*', ('/new/*', 308, None)),
+            ('/old/keep/{name}', ('/kept/{name}', None, None)),
+            ])
+        self.assertEqual(inst.size, 5)
+        self.assertEqual(inst.match('/p/12/'), ('/products/12', None, None))
+        self.assertEqual(inst.match('/p/special'), ('/offers/', 301, None))
+        self.assertEqual(inst.match('/p/1/2'), ('/products/1/2', None,
+                                                'merge'))
+        self.assertEqual(inst.match('/p/a b'), ('/products/a%20b', None,
+                                                None))
+        self.assertEqual(inst.match('/old/a/b'), ('/new/a/b', 308, None))
+        self.assertEqual(inst.match('/old'), ('/new/', 308, None))
+        self.assertEqual(inst.match('/old/keep/x'), ('/kept/x', None, None))
+        self.assertEqual(inst.match('/old/keep/x/y'),
+                         ('/new/keep/x/y', 308, None))
+        self.assertEqual(inst.match('/p'), None)
+        self.assertEqual(inst.match('/p/1/2/3'), None)
+        self.assertEqual(inst.match('/other'), None)
+
+    def test_backtracking(self):
+        inst = self._makeOne([
+            ('/a/b/c', ('/literal', None, None)),
+            ('/a/{x}/d', ('/param/{x}', None, None)),
+            ])
+        self.assertEqual(inst.match('/a/b/d'), ('/param/b', None, None))
+
+class Test_add_remove_pattern(unittest.TestCase):
+    def test_it(self):
+        from ..patterns import (
+            PATTERN_GENERATION_ATTR,
+            add_pattern,
+            get_patterns,
+            remove_pattern,
+            )
+        from .. import get_generation
+        root = DummyFolder()
+        self.assertEqual(get_patterns(root), None)
+        self.assertRaises(KeyError, remove_pattern, root, '/p/{id}')
+        add_pattern(root, '/p/{id}', '/products/{id}', 301, 'passthrough')
+        add_pattern(root, '/p/{id}', '/items/{id}')
+        self.assertEqual(dict(get_patterns(root)),
+                         {'/p/{id}': ('/items/{id}', None, None)})
+        remove_pattern(root, '/p/{id}')
+        self.assertEqual(len(get_patterns(root)), 0)
+        self.assertEqual(get_generation(root, PATTERN_GENERATION_ATTR), 3)
+
+    def test_invalid(self):
+        from ..patterns import (
+            PatternError,
+            add_pattern,
+            get_patterns,
+            )
+        root = DummyFolder()
+        self.assertRaises(PatternError, add_pattern, root, '/p', '/x', 303)
+        self.assertRaises(PatternError, add_pattern, root, '/p', '/x', None,
+                          'replace')
+        self.assertRaises(PatternError, add_pattern, root, '/p', '/{id}')
+        self.assertEqual(get_patterns(root), None)
+
+class TestPatternCache(unittest.TestCase):
+    def test_rebuilt_on_generation_change(self):
+        from ..patterns import (
+            PatternCache,
+            add_pattern,
+            )
+        root = DummyFolder()
+        inst = PatternCache()
+        empty = inst.get(root)
+        self.assertEqual(empty.size, 0)
+        self.assertTrue(inst.get(root) is empty)
+        add_pattern(root, '/p/{id}', '/products/{id}')
+        matcher = inst.get(root)
+        self.assertEqual(matcher.match('/p/1'), ('/products/1', None, None))
+        self.assertTrue(inst.get(root) is matcher)
+
+class Test_pattern_tween_factory(unittest.TestCase):
+    def setUp(self):
+        from pyramid.interfaces import IRootFactory
+        from ..patterns import add_pattern
+        self.config = testing.setUp()
+        root = self.root = DummyFolder()
+        self.config.registry.registerUtility(lambda request: root,
+                                             IRootFactory)
+        add_pattern(root, '/p/{id}', '/products/{id}', 301, 'passthrough')
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, handler):
+        from ..patterns import pattern_tween_factory
+        return pattern_tween_factory(handler, self.config.registry)
+
+    def _makeRequest(self, path, method='GET'):
+        request = testing.DummyRequest(path=path)
+        request.method = method
+        request.registry = self.config.registry
+        return request
+
+    def test_not_found_response(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        tween = self._makeOne(lambda request: HTTPNotFound())
+        request = self._makeRequest('/p/7')
+        request.query_string = 'utm=x'
+        response = tween(request)
+        self.assertEqual(response.status_int, 301)
+        self.assertEqual(response.location,
+                         'http://example.com/products/7?utm=x')
+
+    def test_not_found_raised(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        def handler(request):
+            raise HTTPNotFound()
+        tween = self._makeOne(handler)
+        self.assertEqual(tween(self._makeRequest('/p/7')).status_int, 301)
+        self.assertRaises(HTTPNotFound, tween, self._makeRequest('/q/7'))
+
+    def test_found_and_post_passed_through(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        response = testing.DummyResource(status_int=200)
+        tween = self._makeOne(lambda request: response)
+        self.assertTrue(tween(self._makeRequest('/p/7')) is response)
+        not_found = HTTPNotFound()
+        tween = self._makeOne(lambda request: not_found)
+        self.assertTrue(tween(self._makeRequest('/p/7', 'POST')) is not_found)
@@ -0,0 +1,341 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pyramid import testing
+from zope.interface import alsoProvides
+from . import DummyFolder
+
+class Test_writers(unittest.TestCase):
+    def _rows(self):
+        return [('/NEAT', 'http://example.com/a/?b=1'),
+                ('/go/a "b"', '/c/')]
+
+    def test_nginx(self):
+        from io import StringIO
+        from ..redirectmap import write_nginx
+        stream = StringIO()
+        write_nginx(self._rows(), stream)
+        self.assertEqual(stream.getvalue().splitlines()[1:], [
+            '"/NEAT" "http://example.com/a/?b=1";',
+            '"/go/a \\"b\\"" "/c/";',
+            ])
+
+    def test_nginx_variables(self):
+        from io import StringIO
+        from ..redirectmap import write_nginx
+        stream = StringIO()
+        write_nginx([('/NEAT', '/a/?price=$5#$top')], stream)
+        self.assertEqual(stream.getvalue().splitlines()[1:],
+                         ['"/NEAT" "/a/?price=%245#%24top";'])
+
+    def test_text_map(self):
+        from io import StringIO
+        from ..redirectmap import write_text_map
+        stream = StringIO()
+        write_text_map(self._rows(), stream)
+        self.assertEqual(stream.getvalue().splitlines()[1:],
+                         ['/NEAT http://example.com/a/?b=1'])
+
+class Test_index(unittest.TestCase):
+    def _makeRoot(self):
+        from .. import Alias
+        root = DummyFolder(__oid__=1)
+        root['target'] = testing.DummyResource(__oid__=2)
+        root['alias'] = Alias('alias', root['target'], query=['a=1'])
+        root['alias'].__oid__ = 3
+        return root
+
+    def test_build_index(self):
+        from ..redirectmap import (
+            build_index,
+            get_index,
+            )
+        root = self._makeRoot()
+        self.assertEqual(get_index(root), None)
+        index = build_index(root)
+        self.assertEqual(dict(index),
+                         {3: (2, (('a', '1'),), None, None, None, None)})
+        self.assertTrue(get_index(root) is index)
+
+    def test_index_without_index(self):
+        from ..redirectmap import (
+            get_index,
+            index_alias,
+            unindex_alias,
+            )
+        root = self._makeRoot()
+        index_alias(root['alias'])
+        unindex_alias(root['alias'], root)
+        self.assertEqual(get_index(root), None)
+
+    def test_index_unindex(self):
+        from ..redirectmap import (
+            build_index,
+            index_alias,
+            unindex_alias,
+            )
+        root = self._makeRoot()
+        index = build_index(root)
+        root['alias'].anchor = 'top'
+        root['alias'].status = 301
+        index_alias(root['alias'])
+        self.assertEqual(index[3], (2, (('a', '1'),), 'top', 301, None, None))
+        unindex_alias(root['alias'], root)
+        self.assertEqual(len(index), 0)
+
+class Test_resolve_entry(unittest.TestCase):
+    def _callFUT(self, index, entry, max_depth=10):
+        from ..redirectmap import resolve_entry
+        return resolve_entry(index, entry, max_depth)
+
+    def test_chain(self):
+        index = {3: (4, (), None), 4: (5, (('a', '1'),), 'top')}
+        self.assertEqual(self._callFUT(index, (3, (), None)),
+                         (5, (('a', '1'),), 'top'))
+        self.assertEqual(self._callFUT(index, (3, (), None), 1),
+                         (4, (), None))
+
+    def test_cycle(self):
+        index = {3: (4, (), None), 4: (3, (), None)}
+        self.assertEqual(self._callFUT(index, (3, (), None)), None)
+
+class Test_write_map(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _makeRoot(self):
+        from ..folder import IAliasFolder
+        root = DummyFolder(__oid__=1)
+        root.__objectmap__ = DummyObjectMap({
+            1: ('',),
+            2: ('', 'a b'),
+            3: ('', 'NEAT'),
+            4: ('', 'chained'),
+            5: ('', 'go'),
+            })
+        root['go'] = DummyFolder(__oid__=5, aliases={'x': (2, (), 'top')})
+        alsoProvides(root['go'], IAliasFolder)
+        root.__alias_redirect_index__ = {
+            3: (2, (('p', '1'),), None, None, None),
+            4: (3, (), None, 301, 60, 'merge'),
+            6: (2, (), None, None, None),
+            }
+        return root
+
+    def test_iter_redirects(self):
+        from ..redirectmap import iter_redirects
+        self.assertEqual(sorted(iter_redirects(self._makeRoot())), [
+            ('/NEAT', '/a%20b/?p=1', None, None, None),
+            ('/chained', '/a%20b/?p=1', 301, 60, 'merge'),
+            ('/go/x', '/a%20b/#top', None, None, None),
+            ])
+
+    def test_write_map_file(self):
+        from ..redirectmap import write_map_file
+        filename = os.path.join(self.tmpdir, 'aliases.map')
+        write_map_file(self._makeRoot(), filename, 'haproxy',
+                       'http://example.com')
+        with open(filename) as f:
+            lines = sorted(f.read().splitlines()[1:])
+        self.assertEqual(lines, [
+            '/NEAT http://example.com/a%20b/?p=1',
+            '/chained http://example.com/a%20b/?p=1',
+            '/go/x http://example.com/a%20b/#top',
+            ])
+        self.assertEqual(os.stat(filename).st_mode & 0o777, 0o644)
+        self.assertEqual(os.listdir(self.tmpdir), ['aliases.map'])
+
+    def test_write_map_builds_index(self):
+        from io import StringIO
+        from ..redirectmap import write_map
+        root = self._makeRoot()
+        del root.__alias_redirect_index__
+        write_map(root, StringIO())
+        self.assertEqual(dict(root.__alias_redirect_index__), {})
+
+class Test_schedule_map_write(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _callFUT(self, context, txn):
+        from ..redirectmap import schedule_map_write
+        return schedule_map_write(context, self.config.registry, txn)
+
+    def test_not_configured(self):
+        txn = DummyTransaction()
+        self._callFUT(DummyFolder(), txn)
+        self.assertEqual(txn.hooks, [])
+
+    def test_scheduled_once(self):
+        self.config.registry.settings['substanced_alias.redirect_map'] = 'f'
+        root = DummyFolder()
+        txn = DummyTransaction()
+        self._callFUT(root, txn)
+        self._callFUT(root, txn)
+        self.assertEqual(len(txn.hooks), 1)
+        hook, args, kw = txn.hooks[0]
+        self.assertEqual(args, (root, self.config.registry))
+
+    def test_scheduled_for_lookup_file(self):
+        self.config.registry.settings['substanced_alias.lookup_file'] = 'f'
+        txn = DummyTransaction()
+        self._callFUT(DummyFolder(), txn)
+        self.assertEqual(len(txn.hooks), 1)
+
+    def test_hook_writes_files(self):
+        from ..redirectmap import _write_after_commit
+        from ..lookupfile import LookupFile
+        tmpdir = tempfile.mkdtemp()
+        try:
+            settings = self.config.registry.settings
+            settings['substanced_alias.redirect_map'] = os.path.join(
+                tmpdir, 'aliases.map')
+            settings['substanced_alias.lookup_file'] = os.path.join(
+                tmpdir, 'aliases.idx')
+            root = DummyFolder(__alias_redirect_index__={1: (2, (), None)})
+            root.__objectmap__ = DummyObjectMap({1: ('', 'a'), 2: ('', 'b')})
+            _write_after_commit(True, root, self.config.registry)
+            self.assertEqual(sorted(os.listdir(tmpdir)),
+                             ['aliases.idx', 'aliases.map'])
+            lookup = LookupFile(settings['substanced_alias.lookup_file'])
+            self.assertEqual(lookup.get('/a'), ('/b/', None, None, None))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_hook_schedules_writer(self):
+        from ..redirectmap import (
+            IAliasMapWriter,
+            _write_after_commit,
+            )
+        writer = DummyWriter()
+        self.config.registry.registerUtility(writer, IAliasMapWriter)
+        root = DummyFolder(__alias_redirect_index__={}, _p_oid=b'root')
+        root._p_jar = DummyJar()
+        _write_after_commit(True, root, self.config.registry)
+        self.assertEqual(writer.scheduled,
+                         [(root._p_jar.db(), b'root', self.config.registry)])
+
+    def test_hook_skips_failed_commit_and_missing_index(self):
+        from ..redirectmap import _write_after_commit
+        self.config.registry.settings[
+            'substanced_alias.redirect_map'] = '/nonexistent/f'
+        root = DummyFolder(__alias_redirect_index__={})
+        _write_after_commit(False, root, self.config.registry)
+        _write_after_commit(True, DummyFolder(), self.config.registry)
+
+class TestMapWriter(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.config.registry.settings['substanced_alias.redirect_map'] = (
+            os.path.join(self.tmpdir, 'aliases.map'))
+
+    def tearDown(self):
+        testing.tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def _makeOne(self, delay=0):
+        from ..redirectmap import MapWriter
+        return MapWriter(delay)
+
+    def _makeDB(self, root):
+        root.__objectmap__ = DummyObjectMap({1: ('', 'a'), 2: ('', 'b')})
+        return DummyDB(root)
+
+    def test_write(self):
+        db = self._makeDB(DummyFolder(
+            __alias_redirect_index__={1: (2, (), None)}))
+        self._makeOne().write(db, b'root', self.config.registry)
+        self.assertEqual(os.listdir(self.tmpdir), ['aliases.map'])
+        self.assertTrue(db.conn.closed)
+
+    def test_write_without_index(self):
+        db = self._makeDB(DummyFolder())
+        self._makeOne().write(db, b'root', self.config.registry)
+        self.assertEqual(os.listdir(self.tmpdir), [])
+        self.assertTrue(db.conn.closed)
+
+    def test_schedule_once(self):
+        db = self._makeDB(DummyFolder(__alias_redirect_index__={}))
+        inst = self._makeOne(delay=1000)
+        timer = inst.schedule(db, b'root', self.config.registry)
+        self.assertEqual(inst.schedule(db, b'root', self.config.registry),
+                         None)
+        self.assertTrue(inst.timer is timer)
+        timer.cancel()
+
+    def test_scheduled_write(self):
+        db = self._makeDB(DummyFolder(
+            __alias_redirect_index__={1: (2, (), None)}))
+        inst = self._makeOne()
+        inst.schedule(db, b'root', self.config.registry).join()
+        self.assertEqual(inst.timer, None)
+        self.assertEqual(os.listdir(self.tmpdir), ['aliases.map'])
+
+    def test_write_error_logged(self):
+        self.config.registry.settings['substanced_alias.redirect_map'] = (
+            '/nonexistent/aliases.map')
+        db = self._makeDB(DummyFolder(__alias_redirect_index__={}))
+        inst = self._makeOne()
+        inst._write(db, b'root', self.config.registry)
+        self.assertTrue(db.conn.closed)
+
+class DummyWriter(object):
+    def __init__(self):
+        self.scheduled = []
+
+    def schedule(self, db, root_oid, registry):
+        self.scheduled.append((db, root_oid, registry))
+
+class DummyJar(object):
+    def __init__(self):
+        self._db = object()
+
+    def db(self):
+        return self._db
+
+class DummyDB(object):
+    conn = None
+
+    def __init__(self, root):
+        self.root = root
+
+    def open(self, transaction_manager=None):
+        self.conn = DummyConnection(self.root)
+        return self.conn
+
+class DummyConnection(object):
+    closed = False
+
+    def __init__(self, root):
+        self.root = root
+
+    def get(self, oid):
+        return self.root
+
+    def close(self):
+        self.closed = True
+
+class DummyObjectMap(object):
+    def __init__(self, paths):
+        self.paths = paths
+
+    def path_for(self, oid):
+        return self.paths.get(oid)
+
+class DummyTransaction(object):
+    def __init__(self):
+        self.hooks = []
+
+    def getAfterCommitHooks(self):
+        return iter(self.hooks)
+
+    def addAfterCommitHook(self, hook, args=(), kws=None):
+        self.hooks.append((hook, args, kws or {}))
@@ -0,0 +1,219 @@
+import unittest
+from pyramid import testing
+from . import DummyFolder
+
+class Test_resource_moved(unittest.TestCase):
+    def _callFUT(self, event):
+        from ..subscribers import resource_moved
+        return resource_moved(event)
+
+    def test_moving(self):
+        from .. import (
+            Alias,
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        from .test_catalog import DummyTargetMap
+        root = DummyFolder()
+        root['a'] = DummyFolder()
+        root['a']['target'] = testing.DummyResource()
+        alias = root['alias'] = Alias('alias', root['a']['target'])
+        root.rename('a', 'b')
+        root.__objectmap__ = DummyTargetMap({}, sources={3: [1]},
+                                            objects={1: alias},
+                                            subtree=[2, 3])
+        event = DummyEvent(root['b'], root, moving=root)
+        self._callFUT(event)
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 1)
+        self.assertEqual(alias._location, '/b/target/')
+
+    def test_not_moving(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        root = DummyFolder()
+        event = DummyEvent(testing.DummyResource(), root, moving=None)
+        self._callFUT(event)
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 0)
+
+class Test_alias_added(unittest.TestCase):
+    def _callFUT(self, event):
+        from ..subscribers import alias_added
+        return alias_added(event)
+
+    def test_it(self):
+        from .. import (
+            AliasToTarget,
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        from . import DummyObjectMap
+        root = DummyFolder()
+        root.__objectmap__ = DummyObjectMap()
+        root['target'] = testing.DummyResource()
+        root['alias'] = testing.DummyResource(resource=root['target'])
+        self._callFUT(DummyEvent(root['alias'], root))
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 1)
+        self.assertEqual(root.__objectmap__.references,
+                         set([(root['alias'], root['target'], AliasToTarget)]))
+
+    def test_indexed(self):
+        root = DummyFolder(__alias_redirect_index__={})
+        root['target'] = testing.DummyResource(__oid__=1)
+        root['alias'] = testing.DummyResource(
+            resource=root['target'], _query=(), anchor=None, status=None,
+            max_age=None, query_mode=None, __oid__=2)
+        self._callFUT(DummyEvent(root['alias'], root))
+        self.assertEqual(root.__alias_redirect_index__,
+                         {2: (1, (), None, None, None, None)})
+
+    def test_moving_not_reconnected(self):
+        from . import DummyObjectMap
+        root = DummyFolder()
+        root.__objectmap__ = DummyObjectMap()
+        root['alias'] = testing.DummyResource(resource=None)
+        self._callFUT(DummyEvent(root['alias'], root, moving=root))
+        self.assertEqual(root.__objectmap__.references, set())
+
+class Test_alias_removed(unittest.TestCase):
+    def _callFUT(self, event):
+        from ..subscribers import alias_removed
+        return alias_removed(event)
+
+    def test_it(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        root = DummyFolder()
+        self._callFUT(DummyEvent(testing.DummyResource(), root))
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 1)
+
+    def test_unindexed(self):
+        root = DummyFolder(__alias_redirect_index__={2: (1, (), None)})
+        alias = testing.DummyResource(__oid__=2)
+        self._callFUT(DummyEvent(alias, root))
+        self.assertEqual(root.__alias_redirect_index__, {})
+
+    def test_moving_not_unindexed(self):
+        root = DummyFolder(__alias_redirect_index__={2: (1, (), None)})
+        alias = testing.DummyResource(__oid__=2)
+        self._callFUT(DummyEvent(alias, root, moving=root))
+        self.assertEqual(len(root.__alias_redirect_index__), 1)
+
+class Test_target_removed(unittest.TestCase):
+    def _callFUT(self, event):
+        from ..subscribers import target_removed
+        return target_removed(event)
+
+    def _makeRoot(self):
+        root = DummyFolder()
+        root['alias'] = testing.DummyResource()
+        root['removed'] = testing.DummyResource()
+        root.__objectmap__ = DummySourceMap({1: root['alias'],
+                                             2: root['removed']},
+                                            {3: [1], 4: [2]})
+        return root
+
+    def test_marks_dangling(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        root = self._makeRoot()
+        event = DummyEvent(root['removed'], root)
+        event.removed_oids = [2, 3]
+        self._callFUT(event)
+        self.assertTrue(root['alias'].dangling)
+        self.assertFalse(hasattr(root['removed'], 'dangling'))
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 1)
+
+    def test_no_aliases(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        root = self._makeRoot()
+        event = DummyEvent(root['removed'], root)
+        event.removed_oids = [5]
+        self._callFUT(event)
+        self.assertFalse(hasattr(root['alias'], 'dangling'))
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 0)
+
+    def test_alias_folder_entries(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        from ..folder import AliasFolder
+        root = self._makeRoot()
+        root['af'] = AliasFolder()
+        root['af'].add_alias('x', testing.DummyResource(__oid__=2))
+        event = DummyEvent(root['removed'], root)
+        event.removed_oids = [5]
+        self._callFUT(event)
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 1)
+        event.removed_oids = [2]
+        self._callFUT(event)
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 2)
+
+    def test_removed_alias_folder(self):
+        from .. import (
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        from ..folder import AliasFolder
+        root = self._makeRoot()
+        root['af'] = AliasFolder()
+        root['af'].__oid__ = 6
+        root['af'].add_alias('x', testing.DummyResource(__oid__=2))
+        event = DummyEvent(root['af'], root)
+        event.removed_oids = [2, 6]
+        self._callFUT(event)
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 1)
+
+    def test_moving(self):
+        root = self._makeRoot()
+        event = DummyEvent(root['removed'], root, moving=root)
+        event.removed_oids = [3]
+        self._callFUT(event)
+        self.assertFalse(hasattr(root['alias'], 'dangling'))
+
+class DummySourceMap(object):
+    def __init__(self, objects, sources):
+        self.objects = objects
+        self.sources = sources
+
+    def sourceids(self, oid, reftype):
+        return self.sources.get(oid, [])
+
+    def object_for(self, oid):
+        return self.objects.get(oid)
+
+class Test_alias_modified(unittest.TestCase):
+    def _callFUT(self, event):
+        from ..subscribers import alias_modified
+        return alias_modified(event)
+
+    def test_it(self):
+        from .. import (
+            Alias,
+            TABLE_GENERATION_ATTR,
+            get_generation,
+            )
+        root = DummyFolder()
+        resource = testing.DummyResource()
+        root['a'] = resource
+        alias = Alias('test', resource)
+        alias.updatequery(['one=1'])
+        root['alias'] = alias
+        self._callFUT(DummyEvent(alias, root))
+        self.assertEqual(alias._location, '/a/?one=1')
+        self.assertEqual(get_generation(root, TABLE_GENERATION_ATTR), 1)
+
+class DummyEvent(object):
+    def __init__(self, object, parent, moving=None):
+        self.object = object
+        self.parent = parent
+        self.moving = moving
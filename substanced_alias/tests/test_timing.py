@@ -0,0 +1,189 @@
+import logging
+import unittest
+from pyramid import testing
+from zope.interface import alsoProvides
+
+class TestHistogramSink(unittest.TestCase):
+    def _makeOne(self):
+        from ..timing import HistogramSink
+        return HistogramSink(bounds=(1, 10))
+
+    def test_snapshot(self):
+        inst = self._makeOne()
+        inst.record('stage', 0.0005)
+        inst.record('stage', 0.005)
+        inst.record('stage', 0.02)
+        result = inst.snapshot()['stage']
+        self.assertEqual(result['count'], 3)
+        self.assertAlmostEqual(result['mean'], 8.5)
+        self.assertAlmostEqual(result['max'], 20)
+        self.assertEqual(result['p50'], 10)
+        self.assertEqual(result['p99'], None)
+        self.assertEqual(result['buckets'], [(1, 1), (10, 1), (None, 1)])
+
+    def test_clear(self):
+        inst = self._makeOne()
+        inst.record('stage', 0.001)
+        inst.clear()
+        self.assertEqual(inst.snapshot(), {})
+
+class TestStatsdSink(unittest.TestCase):
+    def test_record(self):
+        from ..timing import StatsdSink
+        inst = StatsdSink(prefix='test')
+        inst._socket = DummySocket()
+        inst.record('stage', 0.0025)
+        self.assertEqual(inst._socket.sent,
+                         [(b'test.stage:2.500|ms', ('127.0.0.1', 8125))])
+
+    def test_record_error_ignored(self):
+        import socket
+        from ..timing import StatsdSink
+        inst = StatsdSink()
+        inst._socket = DummySocket(socket.error())
+        inst.record('stage', 0.001)
+
+class TestLoggingSink(unittest.TestCase):
+    def test_record(self):
+        from ..timing import LoggingSink
+        logger = DummyLogger()
+        inst = LoggingSink(logger, logging.INFO)
+        inst.record('stage', 0.001)
+        self.assertEqual(logger.logged,
+                         [(logging.INFO, 'alias %s %.3fms', ('stage', 1.0))])
+
+class Test_timed(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def test_disabled(self):
+        from ..timing import (
+            NULL_TIMER,
+            timed,
+            )
+        self.assertTrue(timed('stage') is NULL_TIMER)
+
+    def test_enabled(self):
+        from ..timing import (
+            IAliasTimingSink,
+            timed,
+            )
+        sink = DummySink()
+        self.config.registry.registerUtility(sink, IAliasTimingSink)
+        with timed('stage', self.config.registry):
+            pass
+        self.assertEqual([stage for stage, seconds in sink.records],
+                         ['stage'])
+
+    def test_generate_url_stages(self):
+        from ..timing import IAliasTimingSink
+        from .. import Alias
+        sink = DummySink()
+        self.config.registry.registerUtility(sink, IAliasTimingSink)
+        resource = testing.DummyResource()
+        alias = Alias('name', resource)
+        request = testing.DummyRequest()
+        alias.redirect(request)
+        self.assertEqual([stage for stage, seconds in sink.records],
+                         ['build_location', 'location', 'generate_url',
+                          'response'])
+
+class Test_make_sink(unittest.TestCase):
+    def _callFUT(self, **settings):
+        from ..timing import make_sink
+        return make_sink(dict(('substanced_alias.' + key, value)
+                              for key, value in settings.items()))
+
+    def test_none(self):
+        self.assertEqual(self._callFUT(), None)
+
+    def test_statsd(self):
+        from ..timing import StatsdSink
+        sink = self._callFUT(timing='statsd', statsd_port='9125',
+                             statsd_prefix='site')
+        self.assertTrue(isinstance(sink, StatsdSink))
+        self.assertEqual(sink.address, ('127.0.0.1', 9125))
+        self.assertEqual(sink.prefix, 'site')
+
+    def test_logging(self):
+        from ..timing import LoggingSink
+        self.assertTrue(isinstance(self._callFUT(timing='logging'),
+                                   LoggingSink))
+
+    def test_histogram(self):
+        from ..timing import HistogramSink
+        self.assertTrue(isinstance(self._callFUT(timing='histogram'),
+                                   HistogramSink))
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, self._callFUT, timing='nope')
+
+class Test_timing_tween_factory(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, handler):
+        from ..timing import timing_tween_factory
+        return timing_tween_factory(handler, self.config.registry)
+
+    def test_disabled(self):
+        handler = lambda request: None
+        self.assertTrue(self._makeOne(handler) is handler)
+
+    def test_alias_request(self):
+        from .. import IAlias
+        from ..timing import (
+            IAliasTimingSink,
+            record_since_start,
+            )
+        sink = DummySink()
+        self.config.registry.registerUtility(sink, IAliasTimingSink)
+        def handler(request):
+            request.context = testing.DummyResource()
+            alsoProvides(request.context, IAlias)
+            record_since_start(request, 'traverse')
+            return 'response'
+        request = testing.DummyRequest()
+        request.registry = self.config.registry
+        self.assertEqual(self._makeOne(handler)(request), 'response')
+        self.assertEqual([stage for stage, seconds in sink.records],
+                         ['traverse', 'request'])
+
+    def test_other_request(self):
+        from ..timing import IAliasTimingSink
+        sink = DummySink()
+        self.config.registry.registerUtility(sink, IAliasTimingSink)
+        def handler(request):
+            request.context = testing.DummyResource()
+        self._makeOne(handler)(testing.DummyRequest())
+        self.assertEqual(sink.records, [])
+
+class DummySink(object):
+    def __init__(self):
+        self.records = []
+
+    def record(self, stage, seconds):
+        self.records.append((stage, seconds))
+
+class DummySocket(object):
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    def sendto(self, data, address):
+        if self.error is not None:
+            raise self.error
+        self.sent.append((data, address))
+
+class DummyLogger(object):
+    def __init__(self):
+        self.logged = []
+
+    def log(self, level, msg, *args):
+        self.logged.append((level, msg, args))
@@ -49,6 +49,100 @@ class Test_alias_key_lookup(unittest.TestCase):
         result = inst(request)
         self.assertEqual(result, [])
 
+    def test_limit_offset(self):
+        request = self._makeRequest()
+        request.params['term'] = 'foo/'
+        request.params['limit'] = '1'
+        request.params['offset'] = '1'
+        inst = self._makeOne()
+        result = inst(request)
+        self.assertEqual(result, ['foo/baz'])
+
+    def test_limit_capped(self):
+        from ..views import KEY_LOOKUP_MAX_LIMIT
+        request = self._makeRequest()
+        for i in range(KEY_LOOKUP_MAX_LIMIT + 1):
+            request.context['foo']['key%03d' % i] = testing.DummyResource()
+        request.params['term'] = 'foo/key'
+        request.params['limit'] = '100000'
+        inst = self._makeOne()
+        result = inst(request)
+        self.assertEqual(len(result), KEY_LOOKUP_MAX_LIMIT)
+
+    def test_containers(self):
+        request = self._makeRequest()
+        request.params['term'] = 'f'
+        request.params['containers'] = 'true'
+        inst = self._makeOne()
+        result = inst(request)
+        self.assertEqual(result, ['foo/'])
+        self.assertNotIn('substanced_alias.containers', request.session)
+
+    def test_containers_cached(self):
+        request = self._makeRequest()
+        request.context['foo']._p_oid = b'\x00\x01'
+        request.params['term'] = 'foo/b'
+        request.params['containers'] = 'true'
+        inst = self._makeOne()
+        inst(request)
+        cache = request.session['substanced_alias.containers']
+        self.assertEqual(list(cache), ['foo'])
+
+    def test_bad_limit(self):
+        request = self._makeRequest()
+        request.params['term'] = 'foo/'
+        request.params['limit'] = 'abc'
+        inst = self._makeOne()
+        result = inst(request)
+        self.assertEqual(result, ['foo/bar', 'foo/baz', 'foo/qux'])
+
+
+class Test_alias_hits(unittest.TestCase):
+    def test_it(self):
+        from ..views import alias_hits
+        from ..counters import add_hits
+        root = DummyFolder()
+        add_hits(root, {'/a': 1, '/b': 5, '/c': 3})
+        request = testing.DummyRequest(params={'limit': '2'})
+        request.context = root
+        self.assertEqual(alias_hits(request), [['/b', 5], ['/c', 3]])
+
+class Test_all_aliases(unittest.TestCase):
+    def test_catalog_missing(self):
+        from ..views import all_aliases
+        root = DummyFolder()
+        request = testing.DummyRequest(params={'sort': 'bogus',
+                                               'b_size': '0'})
+        request.context = root
+        result = all_aliases(request)
+        self.assertTrue(result['catalog_missing'])
+        self.assertEqual(result['sort'], 'alias_name')
+        self.assertEqual(result['rows'], [])
+
+class Test_alias_timings(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def test_no_sink(self):
+        from ..views import alias_timings
+        self.assertEqual(alias_timings(testing.DummyRequest()), {})
+
+    def test_histogram(self):
+        from ..views import alias_timings
+        from ..timing import (
+            HistogramSink,
+            IAliasTimingSink,
+            )
+        sink = HistogramSink(bounds=(1,))
+        sink.record('response', 0.0005)
+        self.config.registry.registerUtility(sink, IAliasTimingSink)
+        request = testing.DummyRequest(params={'clear': 'true'})
+        result = alias_timings(request)
+        self.assertEqual(result['response']['count'], 1)
+        self.assertEqual(sink.snapshot(), {})
 
 class TestAddAliasView(unittest.TestCase):
     def _makeOne(self, context, request):
@@ -72,6 +166,97 @@ class TestAddAliasView(unittest.TestCase):
         struct = dict(name='name', resource='test', query=None, anchor=None)
         resp = inst.add_success(struct)
 
+    def test_add_success_alias_folder(self):
+        from ..folder import AliasFolder
+        request = self._makeRequest(None)
+        request.root['test'].__oid__ = 1
+        context = AliasFolder()
+        inst = self._makeOne(context, request)
+        struct = dict(name='name', resource='test', query=['a=1'],
+                      anchor=None)
+        resp = inst.add_success(struct)
+        self.assertEqual(context.aliases['name'], (1, (('a', '1'),), None))
+        self.assertEqual(len(context), 0)
+
+    def test_alias_folder_schema_without_policy(self):
+        from ..folder import AliasFolder
+        from ..views import POLICY_FIELDS
+        request = self._makeRequest(None)
+        inst = self._makeOne(AliasFolder(), request)
+        names = [node.name for node in inst.schema]
+        for name in POLICY_FIELDS:
+            self.assertFalse(name in names)
+        self.assertTrue('resource' in names)
+        inst = self._makeOne(request.context, request)
+        names = [node.name for node in inst.schema]
+        for name in POLICY_FIELDS:
+            self.assertTrue(name in names)
+
+class TestAddAliasFolderView(unittest.TestCase):
+    def test_add_success(self):
+        from ..views import AddAliasFolderView
+        folder = testing.DummyResource()
+        request = testing.DummyRequest()
+        request.registry.content = DummyContent(folder)
+        request.mgmt_path = lambda *arg: 'http://example.com'
+        context = DummyFolder()
+        inst = AddAliasFolderView(context, request)
+        resp = inst.add_success(dict(name='go'))
+        self.assertEqual(context['go'], folder)
+        self.assertEqual(resp.location, 'http://example.com')
+
+class TestWriteRedirectMapView(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, request):
+        from ..views import WriteRedirectMapView
+        return WriteRedirectMapView(DummyFolder(), request)
+
+    def _makeRequest(self):
+        request = testing.DummyRequest()
+        request.sdiapi = DummySDIAPI()
+        request.mgmt_path = lambda *arg: 'http://example.com'
+        return request
+
+    def test_not_configured(self):
+        request = self._makeRequest()
+        resp = self._makeOne(request).write_success({})
+        self.assertEqual(request.sdiapi.flashed[0][1], 'danger')
+        self.assertEqual(resp.location, 'http://example.com')
+
+    def test_write(self):
+        import os
+        import shutil
+        import tempfile
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'aliases.map')
+            self.config.registry.settings[
+                'substanced_alias.redirect_map'] = filename
+            request = self._makeRequest()
+            inst = self._makeOne(request)
+            inst.context.__objectmap__ = DummyPathObjectMap()
+            inst.write_success({})
+            self.assertTrue(os.path.exists(filename))
+            self.assertEqual(request.sdiapi.flashed[0][1], 'success')
+        finally:
+            shutil.rmtree(tmpdir)
+
+class DummySDIAPI(object):
+    def __init__(self):
+        self.flashed = []
+
+    def flash(self, msg, queue='info'):
+        self.flashed.append((msg, queue))
+
+class DummyPathObjectMap(object):
+    def path_for(self, oid):
+        return None
+
 class DummyContent(object):
     def __init__(self, resource):
         self.resource = resource
@@ -0,0 +1,234 @@
+""" Optional timing hooks around the stages of alias requests.
+
+When the ``substanced_alias.timing`` setting names a sink, ``includeme``
+registers it as an ``IAliasTimingSink`` utility along with
+``timing_tween_factory``. The stages recorded are:
+
+  ``request`` : the whole request for an alias, from the tween down
+  ``lookup_table`` : the lookup table check, and the answer on a hit
+  ``lookup_file`` : the binary search of the lookup file
+  ``traverse`` : from the tween to the alias view, i.e. traversal
+  ``generate_url`` : ``Alias.generate_url``
+  ``location`` : loading (or rebuilding) the stored location
+  ``build_location`` : the lineage walk and query encoding of a rebuild
+  ``resource_url`` : ``request.resource_url`` for virtual root requests
+  ``response`` : building the redirect response
+  ``find_container`` : traversal to the container in ``get_matching_keys``
+  ``filter_keys`` : the key range scan in ``get_matching_keys``
+
+Available sinks are ``statsd`` (UDP, see ``StatsdSink``), ``logging`` and
+``histogram``, an in-memory histogram shown by the ``alias_timings``
+management view. Without a sink, ``timed`` returns a shared no-op context
+manager, so the hooks cost one utility lookup each.
+"""
+import bisect
+import logging
+import socket
+import threading
+from timeit import default_timer
+
+from pyramid.threadlocal import get_current_registry
+from zope.interface import (
+    Interface,
+    implementer,
+    )
+
+# upper bounds, in milliseconds, of the buckets of ``HistogramSink``
+HISTOGRAM_BOUNDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250,
+                    500, 1000)
+
+# request attribute holding the time the timing tween saw the request
+START_ATTR = '_alias_timing_start'
+
+class IAliasTimingSink(Interface):
+    """ Receives the duration of each timed stage."""
+
+    def record(stage, seconds):
+        """ Records that ``stage`` took ``seconds``."""
+
+
+@implementer(IAliasTimingSink)
+class StatsdSink(object):
+    """ Sends each timing as a statsd timer (``prefix.stage:ms|ms``) over
+    UDP. Send errors are ignored, as statsd clients usually do.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='substanced_alias'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def record(self, stage, seconds):
+        data = '%s.%s:%.3f|ms' % (self.prefix, stage, seconds * 1000)
+        try:
+            self._socket.sendto(data.encode('ascii'), self.address)
+        except socket.error:
+            pass
+
+
+@implementer(IAliasTimingSink)
+class LoggingSink(object):
+    """ Logs each timing to ``logger`` at ``level``."""
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        if logger is None:
+            logger = logging.getLogger(__name__)
+        self.logger = logger
+        self.level = level
+
+    def record(self, stage, seconds):
+        self.logger.log(self.level, 'alias %s %.3fms', stage, seconds * 1000)
+
+
+@implementer(IAliasTimingSink)
+class HistogramSink(object):
+    """ Keeps a count, total, maximum and bucketed histogram of each stage
+    in memory. Percentiles are estimated as the upper bound of the bucket
+    they fall in.
+    """
+
+    def __init__(self, bounds=HISTOGRAM_BOUNDS):
+        self.bounds = tuple(bounds)
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        ms = seconds * 1000
+        index = bisect.bisect_left(self.bounds, ms)
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {
+                    'count': 0,
+                    'total': 0.0,
+                    'max': 0.0,
+                    'buckets': [0] * (len(self.bounds) + 1),
+                    }
+            stats['count'] += 1
+            stats['total'] += ms
+            stats['max'] = max(stats['max'], ms)
+            stats['buckets'][index] += 1
+
+    def percentile(self, buckets, count, fraction):
+        """ Returns the upper bound of the bucket holding the ``fraction``
+        percentile, or None if it is in the overflow bucket.
+        """
+        rank = fraction * count
+        seen = 0
+        for bound, n in zip(self.bounds, buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        """ Returns a dict of stage -> summary dict, with times in ms."""
+        with self._lock:
+            stages = dict((stage, dict(stats, buckets=list(stats['buckets'])))
+                          for stage, stats in self._stages.items())
+        result = {}
+        for stage, stats in stages.items():
+            count = stats['count']
+            buckets = stats['buckets']
+            result[stage] = {
+                'count': count,
+                'mean': stats['total'] / count,
+                'max': stats['max'],
+                'p50': self.percentile(buckets, count, 0.5),
+                'p99': self.percentile(buckets, count, 0.99),
+                'buckets': list(zip(self.bounds + (None,), buckets)),
+                }
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._stages.clear()
+
+
+class NullTimer(object):
+    """ A context manager which does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+NULL_TIMER = NullTimer()
+
+class Timer(object):
+    """ A context manager recording the time spent in its block."""
+
+    def __init__(self, sink, stage):
+        self.sink = sink
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc):
+        self.sink.record(self.stage, default_timer() - self.start)
+
+
+def timed(stage, registry=None):
+    """ Returns a context manager timing ``stage`` if a sink is registered in
+    ``registry`` (by default the current registry), otherwise ``NULL_TIMER``.
+    """
+    if registry is None:
+        registry = get_current_registry()
+    sink = registry.queryUtility(IAliasTimingSink)
+    if sink is None:
+        return NULL_TIMER
+    return Timer(sink, stage)
+
+def record_since_start(request, stage):
+    """ Records the time since the timing tween saw ``request`` as ``stage``.
+    Does nothing if the tween did not time the request.
+    """
+    start = getattr(request, START_ATTR, None)
+    if start is None:
+        return
+    sink = request.registry.queryUtility(IAliasTimingSink)
+    if sink is not None:
+        sink.record(stage, default_timer() - start)
+
+def make_sink(settings):
+    """ Returns the sink named by the ``substanced_alias.timing`` setting, or
+    None. The statsd sink reads ``substanced_alias.statsd_host``,
+    ``substanced_alias.statsd_port`` and ``substanced_alias.statsd_prefix``.
+    """
+    name = settings.get('substanced_alias.timing')
+    if not name:
+        return None
+    if name == 'statsd':
+        return StatsdSink(
+            settings.get('substanced_alias.statsd_host', '127.0.0.1'),
+            int(settings.get('substanced_alias.statsd_port', 8125)),
+            settings.get('substanced_alias.statsd_prefix', 'substanced_alias'))
+    if name == 'logging':
+        return LoggingSink()
+    if name == 'histogram':
+        return HistogramSink()
+    raise ValueError('Unknown substanced_alias.timing sink: %s' % name)
+
+def timing_tween_factory(handler, registry):
+    """ Pyramid tween factory which times requests for aliases and notes
+    when each request started, so the alias view can record the time spent
+    traversing.
+    """
+    from . import IAlias
+    sink = registry.queryUtility(IAliasTimingSink)
+    if sink is None:
+        return handler
+
+    def timing_tween(request):
+        start = default_timer()
+        setattr(request, START_ATTR, start)
+        try:
+            return handler(request)
+        finally:
+            if IAlias.providedBy(getattr(request, 'context', None)):
+                sink.record('request', default_timer() - start)
+
+    return timing_tween
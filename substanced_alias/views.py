@@ -1,20 +1,89 @@
+from itertools import islice
+
 from pyramid.view import view_config
-from pyramid.traversal import find_resource
 from pyramid.httpexceptions import HTTPFound
+from pyramid.settings import asbool
 
 from substanced.sdi import mgmt_view
 from substanced.form import FormView
+from substanced.schema import Schema
 
 from substanced.interfaces import (
     ISite,
     IFolder,
 )
+from substanced.util import (
+    find_catalog,
+    find_objectmap,
+)
+
+import colander
+from deform import widget
 
 from . import (
     IAlias,
     AliasSchema,
+    QUERY_MODE_CHOICES,
+    REDIRECT_STATUS_CHOICES,
+    alias_name_validator,
+    find_target,
     get_matching_keys,
 )
+from .catalog import (
+    CATALOG_NAME,
+    SORT_INDEXES,
+    AliasIndexViews,
+    search_aliases,
+)
+from .counters import (
+    count_hit,
+    top_hits,
+)
+from .folder import IAliasFolder
+from .maintenance import retarget_aliases
+from .patterns import (
+    PatternError,
+    add_pattern,
+    check_target,
+    get_patterns,
+    parse_pattern,
+    remove_pattern,
+)
+from .redirectmap import (
+    get_map_settings,
+    write_map_file,
+)
+from .timing import (
+    IAliasTimingSink,
+    record_since_start,
+)
+
+# default and maximum number of completions returned by ``alias_key_lookup``
+KEY_LOOKUP_LIMIT = 20
+KEY_LOOKUP_MAX_LIMIT = 100
+
+# default and maximum number of aliases per page of ``all_aliases``
+ALL_ALIASES_BATCH_SIZE = 50
+ALL_ALIASES_MAX_BATCH_SIZE = 500
+
+# session key of the container cache used by ``alias_key_lookup``
+CONTAINER_CACHE_KEY = 'substanced_alias.containers'
+
+# fields of the ``AliasSchema`` that ``AliasFolder`` entries do not store;
+# they always redirect with the site defaults
+POLICY_FIELDS = ('status', 'max_age', 'query_mode')
+
+def int_param(request, name, default, maximum=None):
+    """ Returns the request parameter ``name`` as a non-negative int no larger
+    than ``maximum``, or ``default`` if it is missing or not a number.
+    """
+    try:
+        value = max(int(request.params.get(name, default)), 0)
+    except (TypeError, ValueError):
+        return default
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
 
 
 @view_config(context=IAlias)
@@ -25,7 +94,9 @@ def default_alias_view(request):
     Note: this view is unprotected because it only performs the redirect. It
     does not know if the resource it redirects to exists or is protected.
     """
+    record_since_start(request, 'traverse')
     context = request.context
+    count_hit(request)
     return context.redirect(request)
 
 @mgmt_view(context=ISite, name='alias_key_lookup', permission='key lookup',
@@ -38,31 +109,327 @@ def alias_key_lookup(request):
       You have a resource foo/ containing bar, baz, and quux
       The user searches for foo/bar/b
       Keys returns a JSON representation of: ['foo/bar', 'foo/baz']
+
+    Keys are sorted. The optional ``limit`` (capped at
+    ``KEY_LOOKUP_MAX_LIMIT``) and ``offset`` parameters page through them.
+    If the ``containers`` parameter is true, keys of folders end with a '/'
+    so users can drill down one segment at a time; the folders resolved along
+    the way are cached in the session.
     """
     path = request.params.get('term', '')
-    keys = get_matching_keys(request.context, path)
+    limit = int_param(request, 'limit', KEY_LOOKUP_LIMIT, KEY_LOOKUP_MAX_LIMIT)
+    offset = int_param(request, 'offset', 0)
+    mark_containers = asbool(request.params.get('containers', False))
+    cached = request.session.get(CONTAINER_CACHE_KEY, {})
+    cache = dict(cached)
+    keys = get_matching_keys(request.context, path, limit=limit,
+                             offset=offset, mark_containers=mark_containers,
+                             cache=cache)
+    if cache != cached:
+        request.session[CONTAINER_CACHE_KEY] = cache
     return keys
 
+@mgmt_view(context=ISite, name='alias_hits', permission='view alias hits',
+           renderer='json', tab_condition=False)
+def alias_hits(request):
+    """ Returns a JSON list of [path, hits] pairs for the aliases with the
+    most hits flushed so far, most hits first. The ``limit`` parameter
+    (default 100) sets how many are returned.
+    """
+    limit = int_param(request, 'limit', 100)
+    return [list(item) for item in top_hits(request.context, limit)]
+
+@mgmt_view(context=ISite, name='alias_timings',
+           permission='view alias timings', renderer='json',
+           tab_condition=False)
+def alias_timings(request):
+    """ Returns the summaries kept by the ``histogram`` timing sink as JSON:
+    a dict of stage -> count, mean, max, estimated p50 and p99 and the
+    [upper bound, count] buckets, with times in milliseconds. Returns an empty
+    dict for other sinks. ``clear=true`` resets the histograms after reading
+    them.
+    """
+    sink = request.registry.queryUtility(IAliasTimingSink)
+    snapshot = getattr(sink, 'snapshot', None)
+    if snapshot is None:
+        return {}
+    result = snapshot()
+    if asbool(request.params.get('clear', False)):
+        sink.clear()
+    return result
+
+@mgmt_view(context=ISite, name='all_aliases', tab_title='All Aliases',
+           permission='list aliases', renderer='templates/all_aliases.pt')
+def all_aliases(request):
+    """ Lists the aliases of the site from the alias catalog, a batch at a
+    time. The ``name``, ``target`` and ``query_key`` parameters filter by
+    name prefix, target path prefix and query parameter name, ``sort`` (one
+    of ``SORT_INDEXES``) and ``reverse`` set the order, and ``b_start`` and
+    ``b_size`` select the batch. Only the aliases in the batch are loaded.
+    """
+    context = request.context
+    params = request.params
+    filters = dict((name, params.get(name, ''))
+                   for name in ('name', 'target', 'query_key'))
+    sort = params.get('sort')
+    if sort not in SORT_INDEXES:
+        sort = SORT_INDEXES[0]
+    reverse = asbool(params.get('reverse', False))
+    b_start = int_param(request, 'b_start', 0)
+    b_size = int_param(request, 'b_size', ALL_ALIASES_BATCH_SIZE,
+                       ALL_ALIASES_MAX_BATCH_SIZE) or ALL_ALIASES_BATCH_SIZE
+    result = {'filters': filters, 'sort': sort, 'reverse': reverse,
+              'rows': [], 'total': 0, 'b_start': b_start, 'sort_urls': {},
+              'previous_url': None, 'next_url': None,
+              'catalog_missing': False}
+    catalog = find_catalog(context, CATALOG_NAME)
+    if catalog is None:
+        result['catalog_missing'] = True
+        return result
+
+    resultset = search_aliases(catalog, **filters)
+    total = len(resultset)
+    resultset = resultset.sort(catalog[sort], reverse=reverse,
+                               limit=b_start + b_size, raise_unsortable=False)
+    objectmap = find_objectmap(context)
+    rows = []
+    for oid in islice(resultset.ids, b_start, None):
+        alias = objectmap.object_for(oid)
+        if alias is None:
+            continue
+        rows.append({
+            'name': alias.__name__,
+            'path': '/'.join(objectmap.path_for(oid)),
+            'url': request.mgmt_path(alias, '@@properties'),
+            'target': AliasIndexViews(alias).target_path(''),
+            'query': '&'.join(alias.query or ()),
+            'anchor': alias.anchor or '',
+            'dangling': alias.dangling,
+            })
+
+    def batch_url(start):
+        query = dict(filters, sort=sort, reverse=str(reverse).lower(),
+                     b_start=start, b_size=b_size)
+        return request.mgmt_path(context, '@@all_aliases', _query=query)
+
+    result['rows'] = rows
+    result['total'] = total
+    if b_start > 0:
+        result['previous_url'] = batch_url(max(b_start - b_size, 0))
+    if b_start + b_size < total:
+        result['next_url'] = batch_url(b_start + b_size)
+    result['sort_urls'] = dict(
+        (name, request.mgmt_path(context, '@@all_aliases', _query=dict(
+            filters, sort=name,
+            reverse=str(name == sort and not reverse).lower())))
+        for name in SORT_INDEXES)
+    return result
+
 @mgmt_view(context=IFolder, name='add_alias', permission='add alias',
            renderer='substanced.sdi:templates/form.pt',
            tab_condition=False)
 class AddAliasView(FormView):
     """ Makes ``Alias`` objects addable to repoze.Folder objects or any object
-    that inherits from it.
+    that inherits from it. An ``AliasFolder`` gets an entry instead, and the
+    form leaves out the ``POLICY_FIELDS`` it would not store.
     """
     title = 'Add Alias'
     schema = AliasSchema()
     buttons = ('add',)
 
+    def __init__(self, context, request):
+        FormView.__init__(self, context, request)
+        if IAliasFolder.providedBy(context):
+            schema = self.schema.clone()
+            for name in POLICY_FIELDS:
+                del schema[name]
+            self.schema = schema
+
     def add_success(self, appstruct):
         name = appstruct['name']
         resource_path = appstruct['resource']
-        resource = find_resource(self.request.root, resource_path)
+        resource = find_target(self.request, resource_path)
         query = appstruct['query']
         anchor = appstruct['anchor']
+        if IAliasFolder.providedBy(self.context):
+            self.context.add_alias(name, resource, query=query, anchor=anchor)
+            return HTTPFound(self.request.mgmt_path(self.context,
+                                                    '@@contents'))
+        status = int(appstruct.get('status') or 0) or None
         inst = self.request.registry.content.create(
-            IAlias, name, resource, query=query, anchor=anchor)
+            IAlias, name, resource, query=query, anchor=anchor, status=status,
+            max_age=appstruct.get('max_age'),
+            query_mode=appstruct.get('query_mode') or None)
         self.context[name] = inst
         return HTTPFound(self.request.mgmt_path(inst, '@@properties'))
 
 
+class AliasFolderSchema(Schema):
+    """ The add schema for ``AliasFolder`` objects."""
+    name = colander.SchemaNode(
+        colander.String(),
+        widget=widget.TextInputWidget(),
+        validator=alias_name_validator,
+        )
+
+@mgmt_view(context=IFolder, name='add_alias_folder', permission='add alias',
+           renderer='substanced.sdi:templates/form.pt',
+           tab_condition=False)
+class AddAliasFolderView(FormView):
+    """ Makes ``AliasFolder`` objects addable to Folders."""
+    title = 'Add Alias Folder'
+    schema = AliasFolderSchema()
+    buttons = ('add',)
+
+    def add_success(self, appstruct):
+        name = appstruct['name']
+        inst = self.request.registry.content.create(IAliasFolder)
+        self.context[name] = inst
+        return HTTPFound(self.request.mgmt_path(self.context, '@@contents'))
+
+
+class RetargetAliasesSchema(Schema):
+    """ The schema of the Retarget Aliases form."""
+    old_prefix = colander.SchemaNode(
+        colander.String(),
+        title='Old path prefix',
+        description='e.g. /blog/category',
+        validator=colander.Regex('^/', 'Must be an absolute path'),
+        )
+    new_prefix = colander.SchemaNode(
+        colander.String(),
+        title='New path prefix',
+        description='e.g. /archive/category',
+        validator=colander.Regex('^/', 'Must be an absolute path'),
+        )
+
+@mgmt_view(context=ISite, name='retarget_aliases',
+           tab_title='Retarget Aliases', permission='retarget aliases',
+           renderer='substanced.sdi:templates/form.pt')
+class RetargetAliasesView(FormView):
+    """ Points the aliases targeting objects below one path at the objects
+    at the same paths below another with ``retarget_aliases``, in the
+    request's transaction. Use the ``sd_alias_retarget`` console script for
+    restructures touching more aliases than a request should.
+    """
+    title = 'Retarget Aliases'
+    schema = RetargetAliasesSchema()
+    buttons = ('retarget',)
+
+    def retarget_success(self, appstruct):
+        request = self.request
+        retargeted, missing = retarget_aliases(
+            self.context, appstruct['old_prefix'], appstruct['new_prefix'],
+            commit_size=None)
+        request.sdiapi.flash('%s aliases retargeted' % retargeted, 'success')
+        if missing:
+            request.sdiapi.flash(
+                '%s aliases have no new target, e.g. %s -> %s' % (
+                    (len(missing),) + missing[0]), 'warning')
+        return HTTPFound(request.mgmt_path(self.context, '@@retarget_aliases'))
+
+def pattern_alias_validator(node, value):
+    try:
+        segments = parse_pattern(value['pattern'])
+    except PatternError as e:
+        raise colander.Invalid(node['pattern'], str(e))
+    try:
+        check_target(segments, value['target'])
+    except PatternError as e:
+        raise colander.Invalid(node['target'], str(e))
+
+class PatternAliasSchema(Schema):
+    """ The schema of the Pattern Aliases form."""
+    pattern = colander.SchemaNode(
+        colander.String(),
+        description='e.g. /p/{id} or /old/*',
+        )
+    target = colander.SchemaNode(
+        colander.String(),
+        description='e.g. /products/{id} or /new/*',
+        )
+    status = colander.SchemaNode(
+        colander.String(),
+        title='Redirect status',
+        widget=widget.SelectWidget(values=REDIRECT_STATUS_CHOICES),
+        validator=colander.OneOf([value for value, title
+                                  in REDIRECT_STATUS_CHOICES]),
+        missing='',
+        )
+    query_mode = colander.SchemaNode(
+        colander.String(),
+        title='Incoming query string',
+        widget=widget.SelectWidget(values=QUERY_MODE_CHOICES),
+        validator=colander.OneOf([value for value, title
+                                  in QUERY_MODE_CHOICES]),
+        missing='',
+        )
+
+@mgmt_view(context=ISite, name='pattern_aliases',
+           tab_title='Pattern Aliases', permission='add alias',
+           renderer='templates/pattern_aliases.pt')
+class PatternAliasesView(FormView):
+    """ Lists the pattern aliases of the site and adds or replaces one."""
+    title = 'Pattern Aliases'
+    schema = PatternAliasSchema(validator=pattern_alias_validator)
+    buttons = ('add',)
+
+    def add_success(self, appstruct):
+        add_pattern(self.context, appstruct['pattern'], appstruct['target'],
+                    int(appstruct['status'] or 0) or None,
+                    appstruct['query_mode'] or None)
+        self.request.sdiapi.flash('Pattern alias saved', 'success')
+        return HTTPFound(self.request.mgmt_path(self.context,
+                                                '@@pattern_aliases'))
+
+    def show(self, form):
+        return self.with_patterns(FormView.show(self, form))
+
+    def failure(self, e):
+        return self.with_patterns(FormView.failure(self, e))
+
+    def with_patterns(self, result):
+        patterns = get_patterns(self.context) or {}
+        result['patterns'] = [
+            {'pattern': pattern, 'target': target, 'status': status or '',
+             'query_mode': query_mode or ''}
+            for pattern, (target, status, query_mode) in patterns.items()]
+        result['csrf_token'] = self.request.session.get_csrf_token()
+        return result
+
+@mgmt_view(context=ISite, name='remove_pattern_alias', permission='add alias',
+           request_method='POST', check_csrf=True, tab_condition=False)
+def remove_pattern_alias(request):
+    """ Removes the pattern alias named by the ``pattern`` parameter."""
+    try:
+        remove_pattern(request.context, request.POST.get('pattern', ''))
+    except KeyError:
+        request.sdiapi.flash('No such pattern alias', 'danger')
+    else:
+        request.sdiapi.flash('Pattern alias removed', 'success')
+    return HTTPFound(request.mgmt_path(request.context, '@@pattern_aliases'))
+
+@mgmt_view(context=ISite, name='redirect_map', tab_title='Redirect Map',
+           permission='write redirect map',
+           renderer='substanced.sdi:templates/form.pt')
+class WriteRedirectMapView(FormView):
+    """ Writes the redirect map file named by the
+    ``substanced_alias.redirect_map`` setting, building the redirect index
+    first if the site does not have one yet.
+    """
+    title = 'Write Redirect Map'
+    schema = Schema()
+    buttons = ('write',)
+
+    def write_success(self, appstruct):
+        request = self.request
+        filename, fmt, base_url = get_map_settings(request.registry)
+        if filename is None:
+            request.sdiapi.flash(
+                'No redirect map file is configured '
+                '(substanced_alias.redirect_map)', 'danger')
+        else:
+            write_map_file(self.context, filename, fmt, base_url)
+            request.sdiapi.flash('Redirect map written to %s' % filename,
+                                 'success')
+        return HTTPFound(request.mgmt_path(self.context, '@@redirect_map'))